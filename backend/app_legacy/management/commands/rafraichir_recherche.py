@@ -0,0 +1,22 @@
+# app_legacy/management/commands/rafraichir_recherche.py
+from django.core.management import BaseCommand
+
+from app_legacy.services import refresh_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Resynchronise la projection de recherche chauffeur / moto (recherche_chauffeurs) "
+        "depuis association_user_motos, validated_users et motos_valides."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--association", type=int, action="append", dest="associations",
+                            help="Id d'association_user_motos (option répétable) ; défaut : toutes")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        res = refresh_search_index(opts["associations"], batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Projection de recherche : {res['upserted']} ligne(s) à jour, {res['deleted']} supprimée(s)"
+        ))
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:38
+
+from django.db import migrations, models
+
+
+def add_fulltext_index(apps, schema_editor):
+    # MySQL uniquement : index FULLTEXT (parser ngram) sur le texte normalisé
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute(
+            "ALTER TABLE recherche_chauffeurs "
+            "ADD FULLTEXT INDEX recherche_chauffeurs_texte_ft (texte) WITH PARSER ngram"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("ALTER TABLE recherche_chauffeurs DROP INDEX recherche_chauffeurs_texte_ft")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_legacy', '0006_agences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RechercheChauffeur',
+            fields=[
+                ('association_user_moto_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('nom', models.CharField(blank=True, default='', max_length=255)),
+                ('prenom', models.CharField(blank=True, default='', max_length=255)),
+                ('user_unique_id', models.CharField(blank=True, default='', max_length=255)),
+                ('moto_unique_id', models.CharField(blank=True, default='', max_length=255)),
+                ('vin', models.CharField(blank=True, default='', max_length=255)),
+                ('texte', models.TextField(blank=True, default='')),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'recherche_chauffeurs',
+                'indexes': [models.Index(fields=['nom'], name='recherche_c_nom_605482_idx'), models.Index(fields=['prenom'], name='recherche_c_prenom_ebfa52_idx'), models.Index(fields=['user_unique_id'], name='recherche_c_user_un_9384a5_idx'), models.Index(fields=['moto_unique_id'], name='recherche_c_moto_un_83056c_idx'), models.Index(fields=['vin'], name='recherche_c_vin_2d7743_idx')],
+            },
+        ),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+    ]
@@ -73,3 +73,35 @@ class Agences(models.Model):
     class Meta:
         db_table = "agences"
         managed = False
+
+
+class RechercheChauffeur(models.Model):
+    """
+    Projection de recherche chauffeur / moto, une ligne par association_user_motos.
+
+    Valeurs normalisées (minuscules, sans accents) recopiées des tables legacy
+    par refresh_search_index() : la recherche `q` des écrans finance passe par
+    ces colonnes indexées au lieu de LIKE '%...%' à travers les jointures legacy.
+    `texte` regroupe tous les champs (index FULLTEXT ngram sous MySQL).
+    """
+    association_user_moto_id = models.BigIntegerField(primary_key=True)
+    nom = models.CharField(max_length=255, blank=True, default="")
+    prenom = models.CharField(max_length=255, blank=True, default="")
+    user_unique_id = models.CharField(max_length=255, blank=True, default="")
+    moto_unique_id = models.CharField(max_length=255, blank=True, default="")
+    vin = models.CharField(max_length=255, blank=True, default="")
+    texte = models.TextField(blank=True, default="")
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "recherche_chauffeurs"
+        indexes = [
+            models.Index(fields=["nom"]),
+            models.Index(fields=["prenom"]),
+            models.Index(fields=["user_unique_id"]),
+            models.Index(fields=["moto_unique_id"]),
+            models.Index(fields=["vin"]),
+        ]
+
+    def __str__(self):
+        return f"{self.nom} {self.prenom} ({self.user_unique_id})".strip()
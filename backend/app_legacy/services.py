@@ -1,6 +1,19 @@
 # app_legacy/services.py
-from typing import Optional, Dict, Any
+import re
+import unicodedata
+from typing import Optional, Dict, Any, Iterable
+
+from django.conf import settings
 from django.db import connection
+from django.db.models import FloatField, Q, QuerySet, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.expressions import RawSQL
+
+from .models import AssociationUserMoto, RechercheChauffeur
+
+# Valeurs de association_user_motos.swap_bloque
+SWAP_BLOQUE = 0
+SWAP_DEBLOQUE = 1
 
 
 def fetch_association_summary(association_id: int) -> Optional[Dict[str, Any]]:
@@ -81,3 +94,202 @@ def fetch_all_association_summaries() -> list[dict[str, Any]]:
 
     columns = ["association_id", "validated_user_id", "moto_valide_id", "nom", "prenom", "vin"]
     return [dict(zip(columns, row)) for row in rows]
+
+
+class SwapStateBatch:
+    """
+    Regroupe les changements de swap_bloque d'un traitement (passage de
+    pénalités, paiement) et les écrit en deux UPDATE ... WHERE id IN (...),
+    en ignorant les associations déjà dans l'état visé.
+
+        swaps = SwapStateBatch()
+        swaps.block(assoc_id)
+        ...
+        swaps.flush()  # -> {"blocked": n, "unblocked": m} (lignes réellement modifiées)
+    """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self):
+        self._to_block: set[int] = set()
+        self._to_unblock: set[int] = set()
+
+    def block(self, association_id: int | None) -> None:
+        if association_id:
+            self._to_unblock.discard(association_id)
+            self._to_block.add(association_id)
+
+    def unblock(self, association_id: int | None) -> None:
+        if association_id:
+            self._to_block.discard(association_id)
+            self._to_unblock.add(association_id)
+
+    def __len__(self):
+        return len(self._to_block) + len(self._to_unblock)
+
+    @classmethod
+    def _write(cls, ids: Iterable[int], value: int) -> int:
+        ids = sorted(ids)
+        changed = 0
+        for i in range(0, len(ids), cls.BATCH_SIZE):
+            changed += (AssociationUserMoto.objects
+                        .filter(pk__in=ids[i:i + cls.BATCH_SIZE])
+                        .exclude(swap_bloque=value)
+                        .update(swap_bloque=value))
+        return changed
+
+    def flush(self) -> dict:
+        """Applique les changements en attente et retourne le nombre de lignes modifiées."""
+        res = {
+            "blocked": self._write(self._to_block, SWAP_BLOQUE) if self._to_block else 0,
+            "unblocked": self._write(self._to_unblock, SWAP_DEBLOQUE) if self._to_unblock else 0,
+        }
+        self._to_block.clear()
+        self._to_unblock.clear()
+        return res
+
+
+
+# 🔎 Recherche chauffeur / moto (projection RechercheChauffeur)
+
+SEARCH_FIELDS = ("nom", "prenom", "user_unique_id", "moto_unique_id", "vin")
+# Taille des n-grammes de l'index FULLTEXT (ngram_token_size MySQL, 2 par défaut)
+FULLTEXT_MIN_TERM = 2
+
+
+def normalize_search_text(value) -> str:
+    """Minuscules, sans accents, espaces regroupés : forme stockée dans RechercheChauffeur."""
+    value = unicodedata.normalize("NFKD", str(value or ""))
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return " ".join(value.lower().split())
+
+
+def _search_terms(q: str) -> list[str]:
+    # les opérateurs du mode BOOLEAN MODE ne doivent pas passer dans AGAINST(...)
+    return re.sub(r'[+\-<>()~*"@]', " ", normalize_search_text(q)).split()
+
+
+def _legacy_search_q(q: str, prefix: str = "") -> Q:
+    """Recherche directe `q` (icontains) sur les tables legacy, pour un queryset relié à AssociationUserMoto par `prefix`."""
+    return (
+        Q(**{f"{prefix}validated_user__user_unique_id__icontains": q}) |
+        Q(**{f"{prefix}validated_user__nom__icontains": q}) |
+        Q(**{f"{prefix}validated_user__prenom__icontains": q}) |
+        Q(**{f"{prefix}moto_valide__moto_unique_id__icontains": q}) |
+        Q(**{f"{prefix}moto_valide__vin__icontains": q})
+    )
+
+
+def _search_high_water_mark():
+    # plus grand id d'association déjà projeté (0 si la projection est vide), en sous-requête
+    return Coalesce(
+        Subquery(RechercheChauffeur.objects.order_by("-association_user_moto_id")
+                 .values("association_user_moto_id")[:1]),
+        Value(0),
+    )
+
+
+def search_association_ids(q: str) -> QuerySet | None:
+    """
+    Sous-requête des ids d'association_user_motos correspondant à la
+    recherche `q` (tous les mots doivent correspondre), résolus sur la
+    projection indexée ; à utiliser en `association_user_moto_id__in=`,
+    la liste des ids n'est jamais chargée en Python.
+
+    Sous MySQL (RECHERCHE_FULLTEXT) : MATCH ... AGAINST sur l'index ngram ;
+    sinon, et pour les mots trop courts pour l'index, « contient » sur chaque
+    colonne indexée, comme la recherche directe sur les tables legacy.
+
+    Les associations créées depuis le dernier rafraîchissement (id au-delà
+    du plus grand id projeté, toutes si la projection est vide) sont
+    cherchées directement sur les tables legacy. Les modifications d'une
+    association déjà projetée n'apparaissent qu'au rafraîchissement suivant
+    (tâche rafraichir_recherche_chauffeurs). Retourne None si `q` est vide.
+    """
+    terms = _search_terms(q)
+    if not terms:
+        return None
+
+    qs = RechercheChauffeur.objects.all()
+    fulltext = connection.vendor == "mysql" and getattr(settings, "RECHERCHE_FULLTEXT", True)
+    long_terms = [t for t in terms if len(t) >= FULLTEXT_MIN_TERM] if fulltext else []
+    if long_terms:
+        qs = qs.alias(pertinence=RawSQL(
+            "MATCH (texte) AGAINST (%s IN BOOLEAN MODE)",
+            (" ".join(f'+"{t}"' for t in long_terms),),
+            output_field=FloatField(),
+        )).filter(pertinence__gt=0)
+
+    for term in terms:
+        if term in long_terms:
+            continue
+        match = Q()
+        for field in SEARCH_FIELDS:
+            match |= Q(**{f"{field}__contains": term})
+        qs = qs.filter(match)
+
+    return (AssociationUserMoto.objects
+            .filter(Q(pk__in=qs.values("association_user_moto_id")) |
+                    Q(Q(pk__gt=_search_high_water_mark()), _legacy_search_q(q)))
+            .values("pk"))
+
+
+def driver_search_q(q: str, prefix: str = "", ids: QuerySet | None = None) -> Q:
+    """
+    Filtre `q` (nom, prénom, id chauffeur, id moto, VIN) pour un queryset
+    relié à ContratChauffeur par `prefix` ("contrat_chauffeur__", "contrat__",
+    "" pour ContratChauffeur lui-même). `ids` : sous-requête déjà construite
+    par search_association_ids(q), partagée par les querysets d'une même vue.
+    """
+    if ids is None:
+        ids = search_association_ids(q)
+    if ids is not None:
+        return Q(**{f"{prefix}association_user_moto_id__in": ids})
+
+    # Repli : aucun mot cherchable → recherche directe sur les tables legacy
+    return _legacy_search_q(q, f"{prefix}association_user_moto__")
+
+
+def refresh_search_index(association_ids: Iterable[int] | None = None, batch_size: int = 1000) -> dict:
+    """
+    Resynchronise RechercheChauffeur depuis les tables legacy (toutes les
+    associations, ou seulement `association_ids`) : upsert par lots puis
+    suppression des lignes dont l'association n'existe plus.
+    Retourne {"upserted": n, "deleted": m}.
+    """
+    source = AssociationUserMoto.objects.order_by("pk")
+    if association_ids is not None:
+        association_ids = list(association_ids)
+        source = source.filter(pk__in=association_ids)
+    source = source.values_list(
+        "pk", "validated_user__nom", "validated_user__prenom", "validated_user__user_unique_id",
+        "moto_valide__moto_unique_id", "moto_valide__vin",
+    )
+
+    # MySQL : ON DUPLICATE KEY UPDATE, sans cible de conflit explicite
+    unique_fields = ["association_user_moto_id"] if connection.features.supports_update_conflicts_with_target else None
+    upserted = 0
+    after_id = 0
+    while True:
+        rows = list(source.filter(pk__gt=after_id)[:batch_size])
+        if not rows:
+            break
+        objs = []
+        for pk, *values in rows:
+            values = [normalize_search_text(v) for v in values]
+            objs.append(RechercheChauffeur(
+                association_user_moto_id=pk, **dict(zip(SEARCH_FIELDS, values)),
+                texte=" ".join(v for v in values if v),
+            ))
+        RechercheChauffeur.objects.bulk_create(
+            objs, update_conflicts=True, unique_fields=unique_fields,
+            update_fields=[*SEARCH_FIELDS, "texte", "updated"],
+        )
+        upserted += len(objs)
+        after_id = rows[-1][0]
+
+    stale = RechercheChauffeur.objects.exclude(association_user_moto_id__in=AssociationUserMoto.objects.values("pk"))
+    if association_ids is not None:
+        stale = stale.filter(association_user_moto_id__in=association_ids)
+    deleted, _ = stale.delete()
+    return {"upserted": upserted, "deleted": deleted}
@@ -0,0 +1,9 @@
+# app_legacy/tasks.py
+from celery import shared_task
+
+from app_legacy.services import refresh_search_index
+
+
+@shared_task
+def rafraichir_recherche_chauffeurs():
+    return refresh_search_index()
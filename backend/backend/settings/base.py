@@ -182,4 +182,45 @@ AUTH_ISSUER = config("AUTH_ISSUER", default="http://127.0.0.1:8000")
 # L'URL du JWKS pour vérifier les tokens
 AUTH_JWKS_URL = f"{AUTH_SERVICE_BASE_URL}/auth/.well-known/jwks.json/"
 AUTH_SERVICE_PROVISION_URL = f"{AUTH_SERVICE_BASE_URL}/auth/users/provision/"
-SERVICE_API_KEY = config("SERVICE_API_KEY")
\ No newline at end of file
+SERVICE_API_KEY = config("SERVICE_API_KEY")
+
+# Moteur de pénalités : nombre de contrats traités par transaction
+PENALITE_CHUNK_SIZE = config("PENALITE_CHUNK_SIZE", default=200, cast=int)
+# Nombre de shards (sous-tâches Celery parallèles) par fenêtre de pénalités
+PENALITE_SHARDS = config("PENALITE_SHARDS", default=1, cast=int)
+# Jours rattrapés par la fenêtre "midi" (1 = la veille seulement, 0 = sans limite) ;
+# les trous plus anciens passent par la commande rattraper_penalites
+PENALITE_NOON_JOURS = config("PENALITE_NOON_JOURS", default=1, cast=int)
+# Id de la ReglePenalite appliquée aux contrats sans règle (0 = montants et heures par défaut)
+PENALITE_REGLE_DEFAUT = config("PENALITE_REGLE_DEFAUT", default=0, cast=int)
+# Bail d'un passage EN_COURS (secondes sans nouvelle tranche) avant qu'un autre worker le reprenne
+PENALITE_BAIL_SECONDES = config("PENALITE_BAIL_SECONDES", default=600, cast=int)
+
+# Caches : "totaux" garde les totaux du flux combiné (/api/lease/combined), invalidés à
+# chaque écriture (paiements, pénalités Celery, saisie groupée...). L'invalidation n'est
+# vue de tous les workers que sur un backend partagé (Redis, DatabaseCache...) : sans
+# TOTAUX_CACHE_BACKEND, le cache est désactivé (DummyCache) et les totaux recalculés
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "totaux": {
+        "BACKEND": config("TOTAUX_CACHE_BACKEND", default="django.core.cache.backends.dummy.DummyCache"),
+        "LOCATION": config("TOTAUX_CACHE_LOCATION", default="lease-totaux"),
+        "TIMEOUT": config("TOTAUX_CACHE_TTL", default=60, cast=int),
+    },
+}
+# Recherche chauffeur / moto : MATCH ... AGAINST sur l'index FULLTEXT ngram (MySQL) ;
+# False = « contient » sur les colonnes indexées (ex. MariaDB, sans parser ngram)
+RECHERCHE_FULLTEXT = config("RECHERCHE_FULLTEXT", default=True, cast=bool)
+# Exports asynchrones : une demande identique (format + filtres) dans ce délai
+# réutilise le job existant au lieu d'en lancer un nouveau
+EXPORT_DEDUP_SECONDES = config("EXPORT_DEDUP_SECONDES", default=120, cast=int)
+# Export en attente ou en cours sans signe de vie (file Celery, rendu DOCX...) depuis
+# ce délai : considéré interrompu, marqué en échec et relancé à la demande suivante
+EXPORT_BLOQUE_SECONDES = config("EXPORT_BLOQUE_SECONDES", default=1800, cast=int)
+# Fichiers des exports asynchrones : hors de MEDIA_ROOT, servis par la vue de téléchargement
+EXPORT_ROOT = config("EXPORT_ROOT", default=str(BASE_DIR / "exports_prives"))
+# Saisie groupée des paiements (lease/pay/batch) : contrats verrouillés par transaction
+PAIEMENT_LOT_CHUNK_SIZE = config("PAIEMENT_LOT_CHUNK_SIZE", default=100, cast=int)
+# Clés d'idempotence des POST : rejouées pendant ce délai (heures), purgées ensuite
+# par la tâche paiement_lease.tasks.purger_cles_idempotence
+IDEMPOTENCE_TTL_HEURES = config("IDEMPOTENCE_TTL_HEURES", default=72, cast=int)
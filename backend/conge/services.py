@@ -0,0 +1,68 @@
+# conge/services.py
+from bisect import bisect_right
+from datetime import date, timedelta
+from typing import Iterable
+
+from .models import Conge, StatutConge
+
+
+class LeaveCoverage:
+    """
+    Index en mémoire des congés approuvés chevauchant une fenêtre de dates.
+
+    Les intervalles [date_debut .. date_fin] sont chargés en une requête,
+    fusionnés et triés par contrat : savoir si (contrat, jour) est couvert
+    coûte ensuite une recherche dichotomique, sans requête SQL.
+
+        leaves = LeaveCoverage.load(debut, fin, contrat_ids=ids)
+        if leaves.covers(contrat_id, jour):
+            ...
+    """
+
+    def __init__(self, intervals: dict[int, tuple[list[date], list[date]]] | None = None):
+        # contrat_id -> (débuts triés, fins correspondantes), intervalles disjoints
+        self._intervals = intervals or {}
+
+    @classmethod
+    def load(cls, start: date, end: date, contrat_ids: Iterable[int] | None = None) -> "LeaveCoverage":
+        qs = Conge.objects.filter(
+            statut=StatutConge.APPROUVE,
+            date_debut__isnull=False,
+            date_fin__isnull=False,
+            date_debut__lte=end,
+            date_fin__gte=start,
+        )
+        if contrat_ids is not None:
+            qs = qs.filter(contrat_id__in=list(contrat_ids))
+
+        rows = qs.order_by("contrat_id", "date_debut").values_list("contrat_id", "date_debut", "date_fin")
+
+        intervals: dict[int, tuple[list[date], list[date]]] = {}
+        for contrat_id, debut, fin in rows:
+            starts, ends = intervals.setdefault(contrat_id, ([], []))
+            # fusion des congés qui se chevauchent ou se touchent
+            if ends and debut <= ends[-1] + timedelta(days=1):
+                ends[-1] = max(ends[-1], fin)
+            else:
+                starts.append(debut)
+                ends.append(fin)
+        return cls(intervals)
+
+    def covers(self, contrat_id: int, jour: date) -> bool:
+        """True si un congé approuvé du contrat couvre le jour donné."""
+        bounds = self._intervals.get(contrat_id)
+        if not bounds:
+            return False
+        starts, ends = bounds
+        i = bisect_right(starts, jour) - 1
+        return i >= 0 and jour <= ends[i]
+
+    def covered_days(self, contrat_id: int, start: date, end: date) -> list[date]:
+        """Jours de [start .. end] couverts par un congé approuvé du contrat."""
+        days = []
+        for debut, fin in zip(*self._intervals.get(contrat_id, ([], []))):
+            jour = max(debut, start)
+            while jour <= min(fin, end):
+                days.append(jour)
+                jour += timedelta(days=1)
+        return days
@@ -4,6 +4,8 @@ from django.shortcuts import render
 # conge/views.py
 from rest_framework.permissions import  IsAuthenticated
 from rest_framework import viewsets
+from paiement_lease.calendrier import schedule_calendar_refresh
+from paiement_lease.services import invalidate_combined_totals, invalidate_daily_reports
 from .models import Conge
 from .serializers import CongeCreateSerializer, CongeUpdateSerializer, CongeBaseSerializer
 
@@ -21,6 +23,32 @@ class CongeViewSet(viewsets.ModelViewSet):
             return CongeUpdateSerializer
         return CongeBaseSerializer
 
+    # 🔄 Les congés entrent dans les totaux du flux combiné, les récapitulatifs
+    # journaliers et le calendrier des paiements : mise à jour à chaque écriture
+    # (ancienne et nouvelle période)
+    @staticmethod
+    def _invalidate(contrat_id, *periodes):
+        invalidate_combined_totals()
+        for debut, fin in periodes:
+            if debut and fin:
+                invalidate_daily_reports(debut, fin)
+                schedule_calendar_refresh([contrat_id], debut, fin)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self._invalidate(serializer.instance.contrat_id, (serializer.instance.date_debut, serializer.instance.date_fin))
+
+    def perform_update(self, serializer):
+        avant = (serializer.instance.date_debut, serializer.instance.date_fin)
+        super().perform_update(serializer)
+        self._invalidate(serializer.instance.contrat_id, avant,
+                         (serializer.instance.date_debut, serializer.instance.date_fin))
+
+    def perform_destroy(self, instance):
+        contrat_id, periode = instance.contrat_id, (instance.date_debut, instance.date_fin)
+        super().perform_destroy(instance)
+        self._invalidate(contrat_id, periode)
+
 from django.http import HttpResponse
 
 def trigger_error(request):
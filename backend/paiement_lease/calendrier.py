@@ -0,0 +1,216 @@
+# paiement_lease/calendrier.py
+"""
+Projection du calendrier des paiements (CalendrierPaiementMois) : une ligne
+par contrat et par mois, les jours en bitmaps. Les mois touchés sont
+recalculés depuis les paiements et les congés approuvés après chaque
+écriture, par une tâche Celery ; le calendrier d'une page de contrats se lit
+ensuite sur la projection (calcul direct pour les contrats dont la projection
+ne couvre pas tous les paiements).
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Count
+
+from conge.services import LeaveCoverage
+from contrat_chauffeur.models import ContratChauffeur
+from .models import CalendrierPaiementMois, PaiementLease
+from .services import PaidDayIndex
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _next_month(mois: date) -> date:
+    return (mois + timedelta(days=32)).replace(day=1)
+
+
+def _month_days(mois: date) -> int:
+    return calendar.monthrange(mois.year, mois.month)[1]
+
+
+@lru_cache(maxsize=256)
+def _sundays_mask(mois: date) -> int:
+    """Bits des dimanches du mois (jamais des jours de paiement)."""
+    mask = 0
+    for day in range(1 + (6 - mois.weekday()) % 7, _month_days(mois) + 1, 7):
+        mask |= 1 << (day - 1)
+    return mask
+
+
+def _span_mask(mois: date, first: date, last: date) -> int:
+    """Bits des jours du mois compris dans [first .. last]."""
+    lo = first.day if month_start(first) == mois else 1
+    hi = last.day if month_start(last) == mois else _month_days(mois)
+    return ((1 << hi) - 1) & ~((1 << (lo - 1)) - 1)
+
+
+def _bit_days(mois: date, bits: int) -> list[date]:
+    """Jours du mois dont le bit est à 1, dans l'ordre."""
+    days = []
+    while bits:
+        low = bits & -bits
+        days.append(mois.replace(day=low.bit_length()))
+        bits ^= low
+    return days
+
+
+# --- Écriture ---
+def _compute_rows(contrat_ids: list[int], start: date | None, end: date | None) -> list[CalendrierPaiementMois]:
+    """Lignes des mois de [start .. end] (tout l'historique si None), depuis les paiements et les congés."""
+    paid = PaidDayIndex.load(start, end, contrat_ids=contrat_ids, by="created", statuts=None)
+    leaves = LeaveCoverage.load(start or date.min, end or date.max, contrat_ids=contrat_ids)
+
+    rows: dict[tuple[int, date], CalendrierPaiementMois] = {}
+
+    def row(contrat_id: int, jour: date) -> CalendrierPaiementMois:
+        key = (contrat_id, month_start(jour))
+        if key not in rows:
+            rows[key] = CalendrierPaiementMois(contrat_chauffeur_id=contrat_id, mois=key[1], comptes={})
+        return rows[key]
+
+    for contrat_id in contrat_ids:
+        for jour in paid.paid_days(contrat_id):
+            r, n = row(contrat_id, jour), paid.count(contrat_id, jour)
+            r.payes |= 1 << (jour.day - 1)
+            r.nombre += n
+            if n >= 2:
+                r.comptes[str(jour.day)] = n
+        for jour in leaves.covered_days(contrat_id, start or date.min, end or date.max):
+            row(contrat_id, jour).conges |= 1 << (jour.day - 1)
+
+    return list(rows.values())
+
+
+def refresh_payment_calendar(contrat_ids: Iterable[int], start: date | None = None, end: date | None = None) -> int:
+    """
+    Recalcule le calendrier des contrats sur les mois entiers de
+    [start .. end] (tout l'historique si None). Retourne le nombre de lignes
+    écrites.
+    """
+    ids = sorted(set(contrat_ids))
+    if not ids:
+        return 0
+    start = month_start(start) if start else None
+    end = _next_month(month_start(end)) - timedelta(days=1) if end else None
+
+    with transaction.atomic():
+        # verrou des contrats : deux recalculs d'un même contrat ne se croisent pas
+        list(ContratChauffeur.objects.select_for_update().filter(pk__in=ids).order_by("pk").values_list("pk", flat=True))
+        rows = _compute_rows(ids, start, end)
+
+        stale = CalendrierPaiementMois.objects.filter(contrat_chauffeur_id__in=ids)
+        if start:
+            stale = stale.filter(mois__gte=start)
+        if end:
+            stale = stale.filter(mois__lte=end)
+        stale.delete()
+        CalendrierPaiementMois.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def schedule_calendar_refresh(contrat_ids: Iterable[int], start: date | None, end: date | None = None) -> None:
+    """
+    Recalcule le calendrier des contrats sur [start .. end] (tout l'historique
+    si `start` est None) par une tâche Celery envoyée après le commit de la
+    transaction courante : à appeler à chaque écriture de PaiementLease ou de
+    Conge. Le recalcul et son verrou des contrats restent hors de la
+    transaction de l'écriture.
+    """
+    from .tasks import rafraichir_calendrier_paiements
+
+    ids = list(contrat_ids)
+    if not ids:
+        return
+    end = end or start
+    debut, fin = (start.isoformat() if start else None), (end.isoformat() if end else None)
+    transaction.on_commit(lambda: rafraichir_calendrier_paiements.delay(ids, debut, fin), robust=True)
+
+
+# --- Lecture ---
+def calendar_summaries(contrat_ids: Iterable[int]) -> dict[int, dict]:
+    """
+    Calendrier des contrats en une requête sur la projection :
+    {contrat_id: {"paiements", "conges", "paiements_par_jour", "resume",
+    "conges_approuves"}} ; les contrats sans paiement sont absents. Les jours
+    "conges" sont les jours ouvrés non payés entre le premier et le dernier
+    paiement.
+
+    Un contrat dont la projection ne compte pas tous ses paiements (mois
+    antérieurs au déploiement pas encore reconstruits, recalcul en attente ou
+    en échec) est calculé directement depuis les paiements et les congés, et
+    son historique complet est remis en projection par une tâche.
+    """
+    ids = list(contrat_ids)
+    months = defaultdict(dict)
+    for contrat_id, mois, payes, conges, nombre, comptes in (
+            CalendrierPaiementMois.objects
+            .filter(contrat_chauffeur_id__in=ids)
+            .order_by("contrat_chauffeur_id", "mois")
+            .values_list("contrat_chauffeur_id", "mois", "payes", "conges", "nombre", "comptes")):
+        months[contrat_id][mois] = (payes, conges, nombre, comptes or {})
+
+    # paiements enregistrés par contrat (même périmètre que `nombre`) : un
+    # écart signale des mois absents ou périmés dans la projection
+    enregistres = dict(
+        PaiementLease.objects
+        .filter(contrat_chauffeur_id__in=ids, created__isnull=False)
+        .order_by().values("contrat_chauffeur_id").annotate(n=Count("id"))
+        .values_list("contrat_chauffeur_id", "n")
+    )
+    ecarts = [contrat_id for contrat_id in ids
+              if sum(m[2] for m in months.get(contrat_id, {}).values()) != enregistres.get(contrat_id, 0)]
+    if ecarts:
+        for contrat_id in ecarts:
+            months.pop(contrat_id, None)
+        for r in _compute_rows(ecarts, None, None):
+            months[r.contrat_chauffeur_id][r.mois] = (r.payes, r.conges, r.nombre, r.comptes)
+        schedule_calendar_refresh(ecarts, None)
+
+    summaries = {}
+    for contrat_id, by_month in months.items():
+        paid_months = sorted(mois for mois, (payes, *_rest) in by_month.items() if payes)
+        if not paid_months:
+            continue
+        first_payes, last_payes = by_month[paid_months[0]][0], by_month[paid_months[-1]][0]
+        first = paid_months[0].replace(day=(first_payes & -first_payes).bit_length())
+        last = paid_months[-1].replace(day=last_payes.bit_length())
+
+        paiements, manques, approuves, par_jour = [], [], [], {}
+        total_jours = total_paiements = 0
+
+        # une itération par mois de la période, les jours restent en bitmaps
+        mois = month_start(first)
+        while mois <= last:
+            payes, conges, nombre, comptes = by_month.get(mois, (0, 0, 0, {}))
+            span = _span_mask(mois, first, last)
+            ouvres = span & ~_sundays_mask(mois)
+
+            paiements += _bit_days(mois, payes)
+            manques += _bit_days(mois, ouvres & ~payes)
+            approuves += _bit_days(mois, span & conges)
+            for day in sorted(comptes, key=int):
+                par_jour[mois.replace(day=int(day)).isoformat()] = comptes[day]
+            total_jours += ouvres.bit_count()
+            total_paiements += nombre
+            mois = _next_month(mois)
+
+        summaries[contrat_id] = {
+            "paiements": [j.isoformat() for j in paiements],
+            "conges": [j.isoformat() for j in manques],
+            "paiements_par_jour": par_jour,
+            "resume": {
+                "total_jours": total_jours,
+                "jours_payes": len(paiements),
+                "jours_conges": len(manques),
+                "total_paiements": total_paiements,
+                "jours_conge_approuve": len(approuves),
+            },
+            "conges_approuves": [j.isoformat() for j in approuves],
+        }
+    return summaries
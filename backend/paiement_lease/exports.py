@@ -0,0 +1,723 @@
+# paiement_lease/exports.py
+"""
+Exports du flux combiné (CSV, XLSX, DOCX), partagés par les vues d'export
+synchrones et les tâches d'export asynchrones (ExportJob) : chaque écrivain
+reçoit les filtres de la requête (`params`) et un fichier ouvert.
+"""
+import csv
+import hashlib
+import heapq
+import io
+import json
+import logging
+import tempfile
+from datetime import date, datetime, time, timedelta, timezone as py_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from docxtpl import DocxTemplate
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+
+from app_legacy.services import driver_search_q, search_association_ids
+from conge.models import Conge
+from penalite.models import Penalite, StatutPenalite
+from .filters import PaiementLeaseFilter, NonPaiementLeaseFilter
+from .models import ExportJob, PaiementLease, RapportJournalier, StatutExport
+from .serializers import LeasePaymentLiteSerializer, LeaseNonPayeLiteSerializer
+
+logger = logging.getLogger(__name__)
+
+# Fréquence (en lignes) des appels à progress()
+PROGRESS_EVERY = 500
+# Paramètres sans effet sur le contenu d'un export (pagination, méta)
+NON_EXPORT_PARAMS = {"page", "page_size", "cursor", "pagination", "meta_only", "format"}
+
+
+def _to_aware_utc(value):
+    """
+    Convertit 'value' (str|date|datetime|None) en datetime aware en UTC.
+    - ISO avec 'Z' ou offset → parse aware puis converti en UTC
+    - 'YYYY-MM-DD' → minuit local → rendu aware → converti en UTC
+    - naive → rendu aware (timezone courant) → converti en UTC
+    - None/parse ratée → 1970-01-01 UTC
+    """
+    if value is None:
+        return datetime(1970, 1, 1, tzinfo=py_timezone.utc)
+
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, date):
+        dt = datetime.combine(value, time.min)
+    elif isinstance(value, str):
+        s = value.replace("Z", "+00:00").strip()
+        dt = parse_datetime(s)
+        if dt is None:
+            d = parse_date(s)
+            if d is not None:
+                dt = datetime.combine(d, time.min)
+            else:
+                return datetime(1970, 1, 1, tzinfo=py_timezone.utc)
+    else:
+        return datetime(1970, 1, 1, tzinfo=py_timezone.utc)
+
+    # rendre aware si besoin, en timezone locale Django
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, timezone.get_current_timezone())
+
+    # convertir en UTC
+    return dt.astimezone(py_timezone.utc)
+
+
+def _sort_key(item: dict) -> datetime:
+    return _to_aware_utc(item.get("created") or item.get("date_concernee"))
+
+
+class _Counter:
+    value = 0
+
+
+def _counted(rows, progress=None, counter: _Counter | None = None):
+    """Itère `rows` en comptant les lignes ; progress(n) toutes les PROGRESS_EVERY lignes."""
+    counter = counter or _Counter()
+    for row in rows:
+        yield row
+        counter.value += 1
+        if progress and counter.value % PROGRESS_EVERY == 0:
+            progress(counter.value)
+
+
+def build_combined_querysets(params):
+    """
+    Querysets filtrés du flux combiné pour les exports (mêmes filtres que la
+    vue combinée, `params` = request.GET ou dict équivalent) :
+    retourne (paid_qs, np_qs, statut), sans les évaluer.
+    """
+    q       = (params.get("q") or "").strip()
+    search_ids = search_association_ids(q) if q else None
+    statut  = (params.get("statut") or "").upper().strip()  # "PAYE" | "NON_PAYE" | ''
+    paye_par = (params.get("paye_par") or "").strip()
+    agence  = (params.get("agence") or "").strip()
+
+    # ---------- PAYÉS ----------
+    paid_qs = (PaiementLease.objects
+               .select_related(
+                   "contrat_chauffeur",
+                   "contrat_chauffeur__association_user_moto",
+                   "contrat_chauffeur__association_user_moto__validated_user",
+                   "contrat_chauffeur__association_user_moto__moto_valide",
+                   "user_agence",
+                   "employe",
+                   "agences",
+               ))
+    paid_qs = PaiementLeaseFilter(params, queryset=paid_qs).qs
+
+    if q:
+        paid_qs = paid_qs.filter(driver_search_q(q, "contrat_chauffeur__", search_ids))
+    if paye_par := (params.get("paye_par") or "").strip():
+        terms = [t.strip() for t in paye_par.split() if t.strip()]
+        q_paye_par = Q()
+        for term in terms:
+            q_paye_par |= (
+                    Q(employe__nom__icontains=term) |
+                    Q(employe__prenom__icontains=term) |
+                    Q(user_agence__nom__icontains=term) |
+                    Q(user_agence__prenom__icontains=term)
+            )
+
+        paid_qs = paid_qs.filter(q_paye_par)
+    if agence := (params.get("agence") or "").strip():
+        # 👉 si l'UI envoie "direction" (ou "dir"), on filtre sur agences IS NULL
+        if agence.lower() in {"direction", "dir"}:
+            paid_qs = paid_qs.filter(agences__isnull=True)
+        else:
+            # filtre texte normal sur le nom d'agence
+            terms = [t.strip() for t in agence.split() if t.strip()]
+            q_agence = Q()
+            for term in terms:
+                q_agence |= Q(agences__nom_agence__icontains=term)
+            paid_qs = paid_qs.filter(q_agence)
+
+    # ---------- NON PAYÉS ----------
+    np_qs_base = (Penalite.objects
+             .select_related(
+                 "contrat_chauffeur",
+                 "contrat_chauffeur__association_user_moto",
+                 "contrat_chauffeur__association_user_moto__validated_user",
+                 "contrat_chauffeur__association_user_moto__moto_valide",
+                 "contrat_chauffeur__contrat_batt",
+             )
+             .filter(
+                statut_penalite__in=[StatutPenalite.NON_PAYE, StatutPenalite.PAYE, StatutPenalite.PARTIELLEMENT_PAYE],
+             ))
+    np_qs_base = NonPaiementLeaseFilter(params, queryset=np_qs_base).qs
+    # ✅ Anti-join : exclure les pénalités pour lesquelles un paiement de LEASE existe
+    np_qs = np_qs_base.annotate(
+        lease_paid=Exists(
+            PaiementLease.objects.filter(
+                contrat_chauffeur=OuterRef("contrat_chauffeur_id"),
+                date_concernee=OuterRef("date_paiement_manquee"),
+            )
+        )
+    ).filter(lease_paid=False)
+
+    if q:
+        np_qs = np_qs.filter(driver_search_q(q, "contrat_chauffeur__", search_ids))
+
+    return paid_qs, np_qs, statut
+
+
+def _keyset_chunks(qs, field: str, chunk_size: int):
+    """
+    Objets de `qs` triés (field DESC, id DESC), lus par tranches de
+    `chunk_size` sur la clé (field, id) : chaque tranche est une requête
+    WHERE (field, id) < dernière clé ... LIMIT n, la mémoire reste bornée
+    même quand le pilote charge tout le résultat côté client (mysqlclient).
+    Les lignes dont `field` est NULL viennent en dernier, comme en SQL.
+    """
+    qs = qs.order_by(f"-{field}", "-id")
+
+    page, last = qs.filter(**{f"{field}__isnull": False}), None
+    while True:
+        chunk = page if last is None else page.filter(
+            Q(**{f"{field}__lt": last[0]}) | Q(**{field: last[0], "id__lt": last[1]})
+        )
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            break
+        last = (getattr(rows[-1], field), rows[-1].pk)
+
+    page, last_id = qs.filter(**{f"{field}__isnull": True}), None
+    while True:
+        rows = list((page if last_id is None else page.filter(id__lt=last_id))[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            break
+        last_id = rows[-1].pk
+
+
+def iter_combined_rows(params, chunk_size: int = 500):
+    """
+    Lignes sérialisées du flux combiné, triées comme build_combined_queryset
+    (created / date concernée desc), sans tout charger en mémoire : chaque
+    source est lue par tranches de `chunk_size` sur sa clé de tri
+    (_keyset_chunks), puis les deux flux sont fusionnés au fil de l'eau
+    (heapq.merge).
+    """
+    paid_qs, np_qs, statut = build_combined_querysets(params)
+
+    streams = []
+    if statut != "NON_PAYE":
+        streams.append(
+            LeasePaymentLiteSerializer(p).data
+            for p in _keyset_chunks(paid_qs, "created", chunk_size)
+        )
+    if statut != "PAYE":
+        streams.append(
+            LeaseNonPayeLiteSerializer(p).data
+            for p in _keyset_chunks(np_qs, "date_paiement_manquee", chunk_size)
+        )
+    return heapq.merge(*streams, key=_sort_key, reverse=True)
+
+
+def build_combined_queryset(params):
+    """
+    Applique les mêmes filtres que la vue combinée, fusionne PAYE + NON_PAYE,
+    trie (created desc), et calcule des agrégats globaux.
+    Retourne (rows, aggregates) — sans pagination.
+    """
+    paid_qs, np_qs, statut = build_combined_querysets(params)
+
+    paid_ser = LeasePaymentLiteSerializer(paid_qs, many=True)
+    paid_rows = [dict(x) for x in paid_ser.data]
+
+    np_ser = LeaseNonPayeLiteSerializer(np_qs, many=True)
+    np_rows = [dict(x) for x in np_ser.data]
+
+    # ---------- Fusion par "statut" demandé ----------
+    if statut == "PAYE":
+        all_rows = paid_rows
+    elif statut == "NON_PAYE":
+        all_rows = np_rows
+    else:
+        all_rows = paid_rows + np_rows
+
+    # ---------- Tri commun ----------
+    all_rows.sort(key=_sort_key, reverse=True)
+
+    # ---------- Agrégats globaux ----------
+    from decimal import Decimal
+    paid_amount = Decimal("0")
+    paid_count  = 0
+    np_amount   = Decimal("0")
+    np_count    = 0
+
+    for r in all_rows:
+        st = (r.get("statut_paiement") or "").upper()
+        total = Decimal(str(r.get("montant_total") or 0))
+        if st == "PAYE":
+            paid_amount += total
+            paid_count  += 1
+        elif st == "NON_PAYE":
+            np_amount += total
+            np_count  += 1
+
+    aggregates = {
+        "paid": {
+            "count": int(paid_count),
+            "amount": float(paid_amount),
+        },
+        "non_paid": {
+            "count": int(np_count),
+            "amount": float(np_amount),
+        }
+    }
+
+    return all_rows, aggregates
+
+
+# --- CSV ---
+class _Echo:
+    """Pseudo-fichier pour csv.writer : write() renvoie la ligne au lieu de l'écrire."""
+
+    def write(self, value):
+        return value
+
+
+CSV_FIELDNAMES = [
+    "id","chauffeur","moto_unique_id","moto_vin",
+    "montant_moto","montant_batt","montant_total",
+    "date_concernee","date_limite","methode_paiement",
+    "agences","agences",
+    "paye_par","created","source"
+]
+
+
+def csv_lines(rows, chunk_size: int = 500):
+    """Texte CSV du flux, par paquets de `chunk_size` lignes (en-tête en premier)."""
+    writer = csv.DictWriter(_Echo(), fieldnames=CSV_FIELDNAMES)
+    yield writer.writeheader()
+
+    # un envoi par paquet de lignes plutôt qu'un par ligne
+    buffer = []
+    for r in rows:
+        buffer.append(writer.writerow({k: r.get(k, "") for k in CSV_FIELDNAMES}))
+        if len(buffer) >= chunk_size:
+            yield "".join(buffer)
+            buffer.clear()
+    if buffer:
+        yield "".join(buffer)
+
+
+def write_csv(params, fileobj, progress=None) -> int:
+    """CSV du flux combiné filtré par `params` dans `fileobj` (texte). Retourne le nombre de lignes."""
+    count = _Counter()
+    for chunk in csv_lines(_counted(iter_combined_rows(params), progress, count)):
+        fileobj.write(chunk)
+    return count.value
+
+
+# --- XLSX ---
+XLSX_COLUMNS = [
+    "Chauffeur","Moto (ID)","VIN",
+    "Payé par","Agence","Date concernée","Date paiement" ,
+    "Montant moto","Montant batt.","Montant total","Statut"
+]
+
+
+def _xlsx_cell(ws, value, number_format=None):
+    cell = WriteOnlyCell(ws, value=value)
+    if number_format and value is not None:
+        cell.number_format = number_format
+    return cell
+
+
+def _xlsx_amount(value):
+    try:
+        return Decimal(str(value)) if value not in (None, "") else None
+    except Exception:
+        return None
+
+
+def _xlsx_local_datetime(value):
+    # Excel ne gère pas les fuseaux : heure locale naïve
+    dt = parse_datetime(value) if isinstance(value, str) else value
+    if isinstance(dt, datetime):
+        return timezone.make_naive(dt) if timezone.is_aware(dt) else dt
+    return None
+
+
+def write_xlsx(params, fileobj, progress=None) -> int:
+    """
+    XLSX du flux combiné filtré par `params` dans `fileobj` (binaire), en
+    classeur write-only : les cellules ne restent pas en mémoire ; montants et
+    dates en cellules typées. Retourne le nombre de lignes.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Leases")
+    ws.append(XLSX_COLUMNS)
+
+    count = _Counter()
+    for r in _counted(iter_combined_rows(params), progress, count):
+        ws.append([
+            r.get("chauffeur"),
+            r.get("moto_unique_id"),
+            r.get("moto_vin"),
+            r.get("paye_par"),
+            r.get("agences"),
+            _xlsx_cell(ws, parse_date(r.get("date_concernee") or ""), "DD/MM/YYYY"),
+            _xlsx_cell(ws, _xlsx_local_datetime(r.get("created")), "DD/MM/YYYY HH:MM"),
+            _xlsx_cell(ws, _xlsx_amount(r.get("montant_moto")), "#,##0"),
+            _xlsx_cell(ws, _xlsx_amount(r.get("montant_batt")), "#,##0"),
+            _xlsx_cell(ws, _xlsx_amount(r.get("montant_total")), "#,##0"),
+            r.get("source"),
+        ])
+
+    if progress:
+        progress(count.value)  # signe de vie avant l'écriture du classeur
+    wb.save(fileobj)
+    return count.value
+
+
+# --- DOCX ---
+def _fmt_fcfa(n):
+    try:
+        d = Decimal(str(n or 0))
+    except Exception:
+        d = Decimal("0")
+    s = f"{d:,.2f}".replace(",", " ").replace(".00", "")
+    return f"{s} FCFA"
+
+def _fmt_date(d):
+    if not d:
+        return ""
+    # accepte déjà date ou datetime
+    from datetime import date, datetime
+    if isinstance(d, datetime):
+        d = d.date()
+    if isinstance(d, date):
+        return d.strftime("%d/%m/%Y")
+    # tolère une chaîne ISO YYYY-MM-DD
+    try:
+        return datetime.fromisoformat(str(d)).date().strftime("%d/%m/%Y")
+    except Exception:
+        return str(d)
+
+# --- nouveaux helpers filtres "date concernée" ---
+def _parse_iso_date(s: str | None) -> date | None:
+    s = (s or "").strip()
+    if not s:
+        return None
+    try:
+        return datetime.fromisoformat(s).date()
+    except Exception:
+        return None
+
+
+def build_report_context(params, progress=None) -> dict:
+    """
+    Contexte du modèle rapport-leases.docx (titre, payés, non payés,
+    pénalités, congés, valeurs déjà formatées) pour les filtres `params`.
+    """
+    # 1) Même fusion payés/non-payés que la liste (avec ses filtres backend)
+    rows, _aggs = build_combined_queryset(params)
+    if progress:
+        progress(0)  # signe de vie après la lecture complète du flux
+
+    paid_rows, non_paid_rows = [], []
+    for r in _counted(rows or [], progress):
+        row = {
+            "chauffeur":      r.get("chauffeur") or "",
+            "montant_moto":   _fmt_fcfa(r.get("montant_moto")),
+            "montant_batt":   _fmt_fcfa(r.get("montant_batt")),
+            "montant_total":  _fmt_fcfa(r.get("montant_total")),
+        }
+        if (r.get("source") or "").upper() == "PAYE":
+            paid_rows.append(row)
+        else:
+            non_paid_rows.append(row)
+
+    # 2) Filtres communs à conges/penalites : recherche + date_concernee (uniquement)
+    q = (params.get("q") or "").strip()
+    search_ids = search_association_ids(q) if q else None
+    dc_eq     = _parse_iso_date(params.get("date_concernee"))
+    dc_after  = _parse_iso_date(params.get("date_concernee_after"))
+    dc_before = _parse_iso_date(params.get("date_concernee_before"))
+
+    # -----------------------
+    #        PÉNALITÉS
+    # -----------------------
+    pens = (Penalite.objects
+            .select_related(
+                "contrat_chauffeur",
+                "contrat_chauffeur__association_user_moto",
+                "contrat_chauffeur__association_user_moto__validated_user",
+            )
+            .exclude(statut_penalite=StatutPenalite.ANNULEE)
+            )
+    if q:
+        pens = pens.filter(driver_search_q(q, "contrat_chauffeur__", search_ids))
+
+    # date_concernee pour pénalités = date_paiement_manquee (DateField)
+    if dc_eq:
+        pens = pens.filter(date_paiement_manquee=dc_eq)
+    else:
+        if dc_after and dc_before:
+            pens = pens.filter(date_paiement_manquee__range=(dc_after, dc_before))
+        elif dc_after:
+            pens = pens.filter(date_paiement_manquee__gte=dc_after)
+        elif dc_before:
+            pens = pens.filter(date_paiement_manquee__lte=dc_before)
+
+    penalites = []
+    for p in pens:
+        vu = getattr(getattr(p.contrat_chauffeur, "association_user_moto", None), "validated_user", None)
+        nom = " ".join(filter(None, [getattr(vu, "nom", ""), getattr(vu, "prenom", "")])).strip() if vu else ""
+        penalites.append({
+            "chauffeur": nom,
+            "montant":   _fmt_fcfa(p.montant_penalite),
+            "statut":    p.get_statut_penalite_display() if hasattr(p, "get_statut_penalite_display") else p.statut_penalite,
+        })
+
+    # -----------------------
+    #          CONGÉS
+    # -----------------------
+    conges_qs = (
+        Conge.objects
+        .select_related(
+            "contrat",
+            "contrat__association_user_moto",
+            "contrat__association_user_moto__validated_user",
+        )
+    )
+
+    if q:
+        conges_qs = conges_qs.filter(driver_search_q(q, "contrat__", search_ids))
+
+    # Filtre "date concernée" = chevauchement sur [date_debut .. date_fin] (DateField)
+    if dc_eq:
+        conges_qs = conges_qs.filter(date_debut__lte=dc_eq, date_fin__gte=dc_eq)
+    else:
+        if dc_after and dc_before:
+            conges_qs = conges_qs.filter(date_fin__gte=dc_after, date_debut__lte=dc_before)
+        elif dc_after:
+            conges_qs = conges_qs.filter(date_fin__gte=dc_after)
+        elif dc_before:
+            conges_qs = conges_qs.filter(date_debut__lte=dc_before)
+
+    # Construction des lignes
+    conges = []
+    for c in conges_qs:
+        vu = getattr(getattr(c.contrat, "association_user_moto", None), "validated_user", None)
+        nom = " ".join(filter(None, [getattr(vu, "nom", ""), getattr(vu, "prenom", "")])).strip() if vu else ""
+        # nb_jour si inexistant → calcule (fin - debut + 1)
+        nb_jour = getattr(c, "nb_jour", None)
+        if nb_jour is None and c.date_debut and c.date_fin:
+            nb_jour = (c.date_fin - c.date_debut).days + 1
+        conges.append({
+            "chauffeur": nom,
+            "debut": _fmt_date(c.date_debut),  # accepte maintenant des dates
+            "fin": _fmt_date(c.date_fin),
+            "reprise": _fmt_date(getattr(c, "date_reprise", None)),  # si tu l’as
+            "jours": int(nb_jour or 0),
+        })
+
+    # 3) Titre
+    if dc_eq:
+        report_title = f"RECAPITULATIF DU {dc_eq.strftime('%d/%m/%Y')}"
+    elif dc_after and dc_before:
+        report_title = f"RECAPITULATIF DU {dc_after.strftime('%d/%m/%Y')} AU {dc_before.strftime('%d/%m/%Y')}"
+    elif dc_after:
+        report_title = f"RECAPITULATIF À PARTIR DU {dc_after.strftime('%d/%m/%Y')}"
+    elif dc_before:
+        report_title = f"RECAPITULATIF JUSQU'AU {dc_before.strftime('%d/%m/%Y')}"
+    else:
+        report_title = f"RECAPITULATIF DU {timezone.localdate().strftime('%d/%m/%Y')}"
+
+    return {
+        "report_title":  report_title,
+        "paid_rows":     paid_rows,
+        "non_paid_rows": non_paid_rows,
+        "penalites":     penalites,
+        "conges":        conges,
+    }
+
+
+def snapshot_day(params) -> date | None:
+    """Jour passé servi par un instantané : `date_concernee` seule, sans autre filtre."""
+    filtres = normalize_export_params(params)
+    if set(filtres) != {"date_concernee"}:
+        return None
+    jour = _parse_iso_date(filtres["date_concernee"])
+    return jour if jour and jour < timezone.localdate() else None
+
+
+def daily_report_context(jour: date, refresh: bool = False) -> dict:
+    """
+    Contexte du récapitulatif de `jour`, depuis RapportJournalier (calculé et enregistré s'il manque).
+
+    L'instantané n'est invalidé que par les écritures datées (paiement,
+    pénalité, congé) : un changement de `montant_par_paiement` d'un contrat
+    ou du nom d'un chauffeur (tables legacy) n'y est pas reporté. Pour en
+    tenir compte, recalculer le jour avec `refresh=True`.
+    """
+    if not refresh:
+        snapshot = RapportJournalier.objects.filter(jour=jour).first()
+        if snapshot is not None:
+            return snapshot.contexte
+
+    context = build_report_context({"date_concernee": jour.isoformat()})
+    RapportJournalier.objects.update_or_create(jour=jour, defaults={"contexte": context})
+    return context
+
+
+def write_docx(params, fileobj, progress=None) -> int:
+    """
+    Rapport DOCX (rapport-leases.docx) du flux combiné, des pénalités et des
+    congés filtrés par `params`, écrit dans `fileobj` (binaire). Un jour passé
+    sans autre filtre est servi par son instantané RapportJournalier.
+    Retourne le nombre de lignes de paiement du rapport.
+    """
+    jour = snapshot_day(params)
+    context = daily_report_context(jour) if jour else build_report_context(params, progress)
+    if progress:
+        progress(len(context["paid_rows"]) + len(context["non_paid_rows"]))  # signe de vie avant le rendu
+
+    # Rendu du .docx (assure-toi que 'rapport-leases.docx' existe bien)
+    tpl_path = settings.BASE_DIR / "templates" / "rapport-leases.docx"
+    doc = DocxTemplate(str(tpl_path))
+    doc.render(context)
+    doc.save(fileobj)
+    return len(context["paid_rows"]) + len(context["non_paid_rows"])
+
+
+# format -> (extension, content-type, écrivain, fichier binaire ?)
+EXPORT_FORMATS = {
+    "csv": ("csv", "text/csv; charset=utf-8", write_csv, False),
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_xlsx, True),
+    "docx": ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", write_docx, True),
+}
+
+
+# --- Exports asynchrones (ExportJob) ---
+def normalize_export_params(params) -> dict:
+    """Filtres d'export non vides, espaces regroupés, triés : forme stockée dans ExportJob.parametres."""
+    normalized = {}
+    for key in sorted(params.keys()):
+        if key in NON_EXPORT_PARAMS:
+            continue
+        value = " ".join(str(params.get(key) or "").split())
+        if value:
+            normalized[key] = value
+    return normalized
+
+
+def export_fingerprint(fmt: str, params: dict) -> str:
+    return hashlib.sha256(json.dumps([fmt, params], sort_keys=True).encode()).hexdigest()
+
+
+def submit_export(fmt: str, params, user=None) -> tuple[ExportJob, bool]:
+    """
+    Crée un ExportJob et planifie sa tâche Celery après le commit, ou
+    renvoie le job identique (même format, mêmes filtres) encore en cours ou
+    terminé depuis moins de EXPORT_DEDUP_SECONDES. Retourne (job, créé).
+
+    Un job en attente ou en cours sans signe de vie (`updated`, renouvelé au
+    démarrage, à chaque palier de lignes et autour des phases longues)
+    depuis EXPORT_BLOQUE_SECONDES est considéré interrompu (worker tué,
+    tâche jamais livrée) : il passe en échec et n'est plus réutilisé. Entre deux demandes simultanées, la contrainte
+    unique (empreinte, actif) ne laisse passer qu'une création.
+    """
+    from .tasks import executer_export_lease
+
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export inconnu : {fmt!r} (attendu : {', '.join(EXPORT_FORMATS)})")
+
+    params = normalize_export_params(params)
+    empreinte = export_fingerprint(fmt, params)
+    now = timezone.now()
+    window = now - timedelta(seconds=getattr(settings, "EXPORT_DEDUP_SECONDES", 120))
+    stale = now - timedelta(seconds=getattr(settings, "EXPORT_BLOQUE_SECONDES", 1800))
+
+    with transaction.atomic():
+        ExportJob.objects.filter(empreinte=empreinte, actif=True, updated__lt=stale).update(
+            statut=StatutExport.ECHOUE, erreur="Export interrompu : aucune progression.",
+            actif=None, date_fin=now, updated=now,
+        )
+        existing = (ExportJob.objects
+                    .filter(empreinte=empreinte)
+                    .filter(Q(actif=True) | Q(statut=StatutExport.TERMINE, created__gte=window))
+                    .order_by("-created")
+                    .first())
+        if existing:
+            return existing, False
+
+        try:
+            with transaction.atomic():
+                job = ExportJob.objects.create(format=fmt, parametres=params, empreinte=empreinte,
+                                               demande_par=user, actif=True)
+        except IntegrityError:
+            # demande identique enregistrée au même moment : on renvoie son job (lecture verrouillante,
+            # hors de l'instantané de la transaction)
+            existing = ExportJob.objects.select_for_update().filter(empreinte=empreinte, actif=True).first()
+            if existing is None:
+                raise
+            return existing, False
+        transaction.on_commit(lambda: executer_export_lease.delay(str(job.job_id)))
+    return job, True
+
+
+def run_export_job(job_id) -> dict:
+    """
+    Exécute un ExportJob : écrit le fichier dans un fichier temporaire, en
+    mettant `lignes` à jour au fil de l'eau, puis l'enregistre sous
+    EXPORT_ROOT/exports/. Un job déjà terminé n'est pas refait.
+    """
+    job = ExportJob.objects.get(job_id=job_id)
+    if job.statut == StatutExport.TERMINE:
+        return {"job_id": str(job.job_id), "statut": job.statut, "lignes": job.lignes}
+
+    ExportJob.objects.filter(pk=job.pk).update(statut=StatutExport.EN_COURS, lignes=0, erreur="",
+                                               updated=timezone.now())
+    extension, _content_type, writer, binary = EXPORT_FORMATS[job.format]
+
+    def progress(n):
+        # `updated` sert de signe de vie au dédoublonnage (submit_export)
+        ExportJob.objects.filter(pk=job.pk).update(lignes=n, updated=timezone.now())
+
+    try:
+        with tempfile.TemporaryFile() as tmp:
+            if binary:
+                lignes = writer(job.parametres, tmp, progress)
+            else:
+                text = io.TextIOWrapper(tmp, encoding="utf-8", newline="")
+                lignes = writer(job.parametres, text, progress)
+                text.flush()
+                text.detach()
+            tmp.seek(0)
+            progress(lignes)  # signe de vie avant l'enregistrement du fichier
+
+            stamp = timezone.localtime().strftime("%Y%m%d_%H%M%S")
+            job.fichier.save(f"leases_{stamp}_{job.job_id.hex[:8]}.{extension}", File(tmp), save=False)
+    except Exception as e:
+        logger.exception("[EXPORT] job %s (%s) en échec", job.job_id, job.format)
+        job.statut = StatutExport.ECHOUE
+        job.erreur = str(e)
+        job.actif = None
+        job.date_fin = timezone.now()
+        job.save(update_fields=["statut", "erreur", "actif", "date_fin", "updated"])
+        raise
+
+    job.statut = StatutExport.TERMINE
+    job.lignes = lignes
+    job.actif = None
+    job.date_fin = timezone.now()
+    job.save(update_fields=["fichier", "statut", "lignes", "actif", "date_fin", "updated"])
+    logger.info("[EXPORT] job %s : %s ligne(s) -> %s", job.job_id, lignes, job.fichier.name)
+    return {"job_id": str(job.job_id), "statut": job.statut, "lignes": lignes}
@@ -0,0 +1,267 @@
+# paiement_lease/ingestion.py
+"""
+Saisie groupée des paiements de lease (relevés mobile money de fin de
+journée). Les lignes sont regroupées par contrat : chaque contrat est
+verrouillé une seule fois, les paiements sont insérés en bulk_create et les
+règles de PaiementLeaseAPIView s'appliquent ligne à ligne (limite de 2
+paiements par jour, dates avancées hors dimanche, soldes, swap).
+"""
+import csv
+import io
+import json
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from app_legacy.services import SwapStateBatch
+from contrat_chauffeur.models import ContratBatterie, ContratChauffeur
+from penalite.models import Penalite, StatutPenalite
+from .calendrier import schedule_calendar_refresh
+from .models import PaiementLease
+from .serializers import LeasePaymentBatchLineSerializer
+from .services import MAX_PAIEMENTS_JOUR, add_days_skip_sunday, daily_payment_counts, invalidate_combined_totals, \
+    invalidate_daily_reports, next_working_day, set_daily_payment_counts
+
+CHUNK_SIZE = getattr(settings, "PAIEMENT_LOT_CHUNK_SIZE", 100)
+
+ACCEPTE, REJETE = "accepte", "rejete"
+BATCH_FORMATS = ("csv", "json")
+
+
+def parse_payment_batch(content, fmt: str) -> list[dict]:
+    """
+    Lignes d'un lot : "json" = liste d'objets (ou {"paiements": [...]}),
+    "csv" = en-tête avec les noms des champs, séparateur "," ou ";".
+    """
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+
+    if fmt == "json":
+        data = json.loads(content)
+        if isinstance(data, dict):
+            data = data.get("paiements")
+        if not isinstance(data, list):
+            raise ValueError("Liste de paiements attendue.")
+        return data
+
+    if fmt == "csv":
+        try:
+            dialect = csv.Sniffer().sniff(content.split("\n", 1)[0], delimiters=",;")
+        except csv.Error:
+            dialect = csv.excel
+        # cellule vide = champ absent (les dates concernées sont facultatives)
+        return [
+            {k.strip(): v.strip() for k, v in row.items() if k and isinstance(v, str) and v.strip()}
+            for row in csv.DictReader(io.StringIO(content), dialect=dialect)
+        ]
+
+    raise ValueError(f"Format de lot inconnu : {fmt!r} (attendu : {', '.join(BATCH_FORMATS)}).")
+
+
+def _errors_text(errors) -> str:
+    if isinstance(errors, dict):
+        return "; ".join(f"{champ}: {' '.join(map(str, msgs))}" for champ, msgs in errors.items())
+    return str(errors)
+
+
+def ingest_payments(lines: list, employe=None, chunk_size: int | None = None) -> dict:
+    """
+    Enregistre un lot de paiements et retourne le rapport ligne à ligne,
+    dans l'ordre du lot :
+
+        {"acceptees": n, "rejetees": m, "lignes": [{"ligne": 1, "contrat_id": ...,
+         "reference_transaction": ..., "statut": "accepte" | "rejete",
+         "reference_paiement": ..., "message": ...}, ...]}
+
+    Les contrats sont traités par ordre d'id, par tranches de `chunk_size`
+    (PAIEMENT_LOT_CHUNK_SIZE) contrats : une transaction par tranche.
+    """
+    report = []
+    par_contrat = defaultdict(list)  # contrat_id -> [(rang, données validées)]
+    refs_lot = set()
+
+    # (1) Validation des lignes
+    for i, raw in enumerate(lines):
+        entry = {"ligne": i + 1, "contrat_id": None, "reference_transaction": None,
+                 "statut": REJETE, "reference_paiement": None, "message": ""}
+        report.append(entry)
+
+        serializer = LeasePaymentBatchLineSerializer(data=raw if isinstance(raw, dict) else {})
+        if not serializer.is_valid():
+            entry["message"] = _errors_text(serializer.errors)
+            continue
+        data = serializer.validated_data
+        ref = data.get("reference_transaction") or None
+        entry.update(contrat_id=data["contrat_id"], reference_transaction=ref)
+
+        if ref:
+            if ref in refs_lot:
+                entry["message"] = "Transaction en double dans le lot."
+                continue
+            refs_lot.add(ref)
+        par_contrat[data["contrat_id"]].append((i, data))
+
+    # (2) Enregistrement, une transaction par tranche de contrats
+    ids = sorted(par_contrat)
+    size = chunk_size or CHUNK_SIZE
+    for k in range(0, len(ids), size):
+        chunk = {cid: par_contrat[cid] for cid in ids[k:k + size]}
+        try:
+            acceptes = _ingest_chunk(chunk, report, employe)
+        except Exception as e:
+            acceptes = {}
+            for items in chunk.values():
+                for i, _data in items:
+                    report[i]["message"] = report[i]["message"] or str(e)
+
+        for i, reference in acceptes.items():
+            report[i].update(statut=ACCEPTE, reference_paiement=reference, message="Paiement enregistré.")
+
+    n = sum(1 for entry in report if entry["statut"] == ACCEPTE)
+    return {"acceptees": n, "rejetees": len(report) - n, "lignes": report}
+
+
+@transaction.atomic
+def _ingest_chunk(par_contrat: dict, report: list, employe) -> dict:
+    """
+    Enregistre les lignes d'une tranche de contrats ; retourne {rang: reference_paiement}
+    des lignes acceptées et renseigne le motif des lignes refusées dans `report`.
+    """
+    # (1) Un verrou par contrat, dans l'ordre des ids
+    contrats = {c.pk: c for c in ContratChauffeur.objects.select_for_update()
+                .filter(pk__in=list(par_contrat)).order_by("pk")}
+    batt_ids = {c.contrat_batt_id for c in contrats.values() if c.contrat_batt_id}
+    batts = {b.pk: b for b in ContratBatterie.objects.select_for_update().filter(pk__in=batt_ids)} if batt_ids else {}
+
+    # (2) Paiements déjà reçus aujourd'hui et transactions déjà enregistrées
+    today = timezone.localdate()
+    deja_jour = daily_payment_counts(contrats, today)
+    refs = [d["reference_transaction"] for items in par_contrat.values() for _i, d in items
+            if d.get("reference_transaction")]
+    refs_connues = set(
+        PaiementLease.objects.filter(reference_transaction__in=refs).values_list("reference_transaction", flat=True)
+    ) if refs else set()
+
+    # (3) Règles de PaiementLeaseAPIView, ligne à ligne, sur les contrats en mémoire
+    now = timezone.now()
+    acceptes, paiements = {}, []
+    contrats_modifies, batts_modifiees = {}, {}
+    restants_jour = {}  # contrat_id -> paiements encore permis aujourd'hui
+
+    for cid, items in par_contrat.items():
+        contrat = contrats.get(cid)
+        batt = batts.get(contrat.contrat_batt_id) if contrat else None
+        restants = MAX_PAIEMENTS_JOUR - deja_jour.get(cid, 0)
+
+        for i, data in items:
+            if contrat is None:
+                report[i]["message"] = "Contrat introuvable."
+                continue
+            ref = data.get("reference_transaction") or None
+            if ref and ref in refs_connues:
+                report[i]["message"] = "Transaction déjà enregistrée."
+                continue
+            if restants <= 0:
+                report[i]["message"] = "Limite de 2 paiements par jour atteinte pour ce contrat."
+                continue
+
+            base_concernee = data.get("date_paiement_concerne") or contrat.date_concernee
+            base_limite = data.get("date_limite_paiement") or contrat.date_limite
+            if not base_concernee or not base_limite:
+                report[i]["message"] = "Date concernée inconnue pour ce contrat."
+                continue
+
+            m_moto = Decimal(data.get("montant_moto") or 0)
+            m_batt = Decimal(data.get("montant_batt") or 0)
+            m_total = m_moto + m_batt
+
+            # état rétabli si le contrat refuse le nouveau solde
+            etat = (contrat.montant_paye, contrat.montant_restant, contrat.date_concernee, contrat.date_limite)
+            contrat.montant_paye = (contrat.montant_paye or Decimal("0")) + m_total
+            contrat.montant_restant = max(
+                Decimal("0"),
+                (contrat.montant_total or Decimal("0")) - contrat.montant_paye
+            )
+            contrat.date_concernee = next_working_day(base_concernee)
+            contrat.date_limite = add_days_skip_sunday(contrat.date_concernee, 1)
+            try:
+                contrat.clean()
+            except ValidationError as e:
+                contrat.montant_paye, contrat.montant_restant, contrat.date_concernee, contrat.date_limite = etat
+                report[i]["message"] = " ".join(e.messages)
+                continue
+
+            if batt is not None:
+                batt.montant_paye = (batt.montant_paye or Decimal("0")) + m_batt
+                batt.montant_restant = max(
+                    Decimal("0"),
+                    (batt.montant_total or Decimal("0")) - batt.montant_paye
+                )
+                batts_modifiees[batt.pk] = batt
+
+            reference = f"PL-{now.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:5].upper()}"
+            paiements.append(PaiementLease(
+                reference_paiement=reference,
+                montant_moto=m_moto,
+                montant_batt=m_batt,
+                montant_total=m_total,
+                methode_paiement=data["methode_paiement"],
+                reference_transaction=ref,
+                type_contrat="CHAUFFEUR",
+                statut="PAYE" if m_total > 0 else "IMPAYE",
+                contrat_chauffeur=contrat,
+                date_concernee=base_concernee,
+                date_limite=base_limite,
+                employe=employe,
+                user_agence=None,
+            ))
+            acceptes[i] = reference
+            contrats_modifies[cid] = contrat
+            restants -= 1
+        restants_jour[cid] = restants
+
+    if not paiements:
+        return acceptes
+
+    # (4) Écritures groupées
+    PaiementLease.objects.bulk_create(paiements, batch_size=500)
+    set_daily_payment_counts(
+        {cid: MAX_PAIEMENTS_JOUR - restants for cid, restants in restants_jour.items() if cid in contrats_modifies},
+        today,
+    )
+    for obj in [*contrats_modifies.values(), *batts_modifiees.values()]:
+        obj.updated = now
+    ContratChauffeur.objects.bulk_update(
+        contrats_modifies.values(),
+        ["montant_paye", "montant_restant", "date_concernee", "date_limite", "date_fin", "updated"],
+        batch_size=500,
+    )
+    if batts_modifiees:
+        ContratBatterie.objects.bulk_update(batts_modifiees.values(), ["montant_paye", "montant_restant", "updated"])
+
+    # (5) Swap : débloqué si plus aucune pénalité échue, sinon maintenu bloqué
+    en_retard = set(
+        Penalite.objects.filter(
+            contrat_chauffeur_id__in=list(contrats_modifies),
+            statut_penalite__in=[StatutPenalite.NON_PAYE, StatutPenalite.PARTIELLEMENT_PAYE],
+            echeance_paiement_penalite__lt=now,
+        ).values_list("contrat_chauffeur_id", flat=True)
+    )
+    swaps = SwapStateBatch()
+    for cid, contrat in contrats_modifies.items():
+        if cid in en_retard:
+            swaps.block(contrat.association_user_moto_id)
+        else:
+            swaps.unblock(contrat.association_user_moto_id)
+    swaps.flush()
+
+    invalidate_combined_totals()
+    jours = [p.date_concernee for p in paiements]
+    invalidate_daily_reports(min(jours), max(jours))
+    schedule_calendar_refresh(contrats_modifies, today)
+    return acceptes
@@ -0,0 +1,63 @@
+# paiement_lease/management/commands/importer_paiements_lease.py
+import csv
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+
+from paiement_lease.ingestion import REJETE, ingest_payments, parse_payment_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe un lot de paiements de lease (relevé mobile money .csv ou .json) : "
+        "un verrou par contrat, paiements insérés en lot, rapport ligne à ligne."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fichier", help="Relevé .csv (en-tête = noms des champs) ou .json")
+        parser.add_argument("--format", choices=["csv", "json"], default=None,
+                            help="Format du fichier ; défaut : d'après l'extension")
+        parser.add_argument("--employe", type=int, default=None,
+                            help="Id de l'employé enregistré comme auteur des paiements")
+        parser.add_argument("--chunk-size", type=int, default=None,
+                            help="Contrats verrouillés par transaction")
+        parser.add_argument("--rapport", default=None,
+                            help="Écrit le rapport ligne à ligne dans ce fichier CSV")
+
+    def handle(self, *args, **opts):
+        path = Path(opts["fichier"])
+        if not path.is_file():
+            raise CommandError(f"Fichier introuvable : {path}")
+
+        employe = None
+        if opts["employe"] is not None:
+            employe = get_user_model().objects.filter(pk=opts["employe"]).first()
+            if employe is None:
+                raise CommandError(f"Employé introuvable : {opts['employe']}")
+
+        try:
+            lines = parse_payment_batch(path.read_bytes(), opts["format"] or path.suffix.lstrip(".").lower())
+        except (ValueError, UnicodeDecodeError) as e:
+            raise CommandError(f"Lot illisible : {e}")
+
+        res = ingest_payments(lines, employe=employe, chunk_size=opts["chunk_size"])
+
+        # (1) Résumé
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {res['acceptees']} paiement(s) enregistré(s), {res['rejetees']} ligne(s) rejetée(s) "
+            f"sur {len(res['lignes'])}"
+        ))
+
+        # (2) Lignes rejetées
+        for ligne in res["lignes"]:
+            if ligne["statut"] == REJETE:
+                self.stdout.write(f"  ligne {ligne['ligne']} (contrat {ligne['contrat_id']}) : {ligne['message']}")
+
+        # (3) Rapport complet
+        if opts["rapport"]:
+            with open(opts["rapport"], "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=list(res["lignes"][0]) if res["lignes"] else ["ligne"])
+                writer.writeheader()
+                writer.writerows(res["lignes"])
+            self.stdout.write(f"  rapport : {opts['rapport']}")
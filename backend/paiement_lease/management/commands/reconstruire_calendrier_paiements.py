@@ -0,0 +1,44 @@
+# paiement_lease/management/commands/reconstruire_calendrier_paiements.py
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from contrat_chauffeur.models import ContratChauffeur
+from paiement_lease.calendrier import refresh_payment_calendar
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit la projection du calendrier des paiements (CalendrierPaiementMois) "
+        "depuis les paiements et les congés approuvés, par tranche de contrats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--contrat", type=int, action="append", dest="contrats",
+                            help="Id de contrat (option répétable) ; défaut : tous les contrats")
+        parser.add_argument("--debut", default=None, help="Premier mois 'YYYY-MM-DD' ; défaut : tout l'historique")
+        parser.add_argument("--fin", default=None, help="Dernier mois 'YYYY-MM-DD' ; défaut : tout l'historique")
+        parser.add_argument("--chunk-size", type=int, default=200)
+        parser.add_argument("--pause", type=float, default=0.0,
+                            help="Pause en secondes entre deux tranches")
+
+    def handle(self, *args, **opts):
+        debut = parse_date(opts["debut"]) if opts["debut"] else None
+        fin = parse_date(opts["fin"]) if opts["fin"] else None
+        if (opts["debut"] and not debut) or (opts["fin"] and not fin) or (debut and fin and debut > fin):
+            raise CommandError("Plage invalide : 'YYYY-MM-DD' attendu, début <= fin.")
+
+        ids = opts["contrats"] or list(ContratChauffeur.objects.order_by("pk").values_list("pk", flat=True))
+        size = max(1, opts["chunk_size"])
+
+        lignes = 0
+        for i in range(0, len(ids), size):
+            lignes += refresh_payment_calendar(ids[i:i + size], debut, fin)
+            self.stdout.write(f"  … {min(i + size, len(ids))}/{len(ids)} contrat(s), {lignes} mois")
+            if opts["pause"]:
+                time.sleep(opts["pause"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Calendrier reconstruit : {lignes} mois sur {len(ids)} contrat(s)"
+        ))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:43
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiement_lease', '0011_paiementlease_paiement_le_contrat_929157_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('format', models.CharField(max_length=10)),
+                ('parametres', models.JSONField(blank=True, default=dict)),
+                ('empreinte', models.CharField(max_length=64)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('termine', 'Terminé'), ('echoue', 'Échoué')], default='en_attente', max_length=20)),
+                ('lignes', models.PositiveIntegerField(default=0)),
+                ('fichier', models.FileField(blank=True, null=True, upload_to='exports/')),
+                ('erreur', models.TextField(blank=True, default='')),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+                ('demande_par', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'paiement_lease_export',
+                'ordering': ('-created',),
+                'indexes': [models.Index(fields=['empreinte', 'statut'], name='paiement_le_emprein_a74efe_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiement_lease', '0012_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RapportJournalier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('jour', models.DateField(unique=True)),
+                ('contexte', models.JSONField(default=dict)),
+            ],
+            options={
+                'db_table': 'paiement_lease_rapport_journalier',
+                'ordering': ('-jour',),
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiement_lease', '0013_rapportjournalier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleIdempotence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('cle', models.CharField(max_length=100, unique=True)),
+                ('empreinte', models.CharField(max_length=64)),
+                ('statut_http', models.PositiveSmallIntegerField(default=0)),
+                ('reponse', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'db_table': 'paiement_lease_idempotence',
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:53
+
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def init_compteurs(apps, schema_editor):
+    # compteurs de la veille et du jour, à partir des paiements déjà enregistrés
+    PaiementLease = apps.get_model("paiement_lease", "PaiementLease")
+    CompteurPaiementJour = apps.get_model("paiement_lease", "CompteurPaiementJour")
+    debut = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=1), time.min))
+    compteurs = Counter(
+        (contrat_id, timezone.localtime(created).date())
+        for contrat_id, created in PaiementLease.objects.filter(created__gte=debut)
+        .values_list("contrat_chauffeur_id", "created").iterator()
+    )
+    CompteurPaiementJour.objects.bulk_create(
+        [CompteurPaiementJour(contrat_chauffeur_id=contrat_id, jour=jour, nombre=n)
+         for (contrat_id, jour), n in compteurs.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contrat_chauffeur', '0021_contratchauffeur_date_modification_statut_and_more'),
+        ('paiement_lease', '0014_cleidempotence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurPaiementJour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('jour', models.DateField()),
+                ('nombre', models.PositiveSmallIntegerField(default=0)),
+                ('contrat_chauffeur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compteurs_paiement_jour', to='contrat_chauffeur.contratchauffeur')),
+            ],
+            options={
+                'db_table': 'paiement_lease_compteur_jour',
+                'constraints': [models.UniqueConstraint(fields=('contrat_chauffeur', 'jour'), name='uniq_compteur_paiement_par_contrat_et_jour')],
+            },
+        ),
+        migrations.RunPython(init_compteurs, migrations.RunPython.noop),
+    ]
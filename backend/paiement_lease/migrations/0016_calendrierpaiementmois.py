@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contrat_chauffeur', '0021_contratchauffeur_date_modification_statut_and_more'),
+        ('paiement_lease', '0015_compteurpaiementjour'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendrierPaiementMois',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('mois', models.DateField()),
+                ('payes', models.PositiveIntegerField(default=0)),
+                ('conges', models.PositiveIntegerField(default=0)),
+                ('nombre', models.PositiveIntegerField(default=0)),
+                ('comptes', models.JSONField(blank=True, default=dict)),
+                ('contrat_chauffeur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendrier_paiements', to='contrat_chauffeur.contratchauffeur')),
+            ],
+            options={
+                'db_table': 'paiement_lease_calendrier_mois',
+                'ordering': ('contrat_chauffeur', 'mois'),
+                'constraints': [models.UniqueConstraint(fields=('contrat_chauffeur', 'mois'), name='uniq_calendrier_paiement_par_contrat_et_mois')],
+            },
+        ),
+    ]
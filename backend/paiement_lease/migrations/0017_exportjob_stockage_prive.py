@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:08
+
+import paiement_lease.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiement_lease', '0016_calendrierpaiementmois'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='fichier',
+            field=models.FileField(blank=True, null=True, storage=paiement_lease.models.export_storage, upload_to='exports/'),
+        ),
+    ]
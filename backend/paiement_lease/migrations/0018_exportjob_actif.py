@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiement_lease', '0017_exportjob_stockage_prive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='actif',
+            field=models.BooleanField(default=None, editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='exportjob',
+            constraint=models.UniqueConstraint(fields=('empreinte', 'actif'), name='uniq_export_actif_par_empreinte'),
+        ),
+    ]
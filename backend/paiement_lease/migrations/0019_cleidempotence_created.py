@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiement_lease', '0018_exportjob_actif'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cleidempotence',
+            index=models.Index(fields=['created'], name='paiement_le_created_4091d6_idx'),
+        ),
+    ]
@@ -1,5 +1,9 @@
+import uuid
+
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.utils.translation import gettext_lazy as _
 
 from app_legacy.models import UsersAgences, Agences
 from contrat_chauffeur.models import ContratChauffeur
@@ -51,3 +55,159 @@ class PaiementLease(TimeStampedModel):
 
     def __str__(self):
         return self.reference_paiement or f"PaiementLease #{self.pk}"
+
+
+
+class StatutExport(models.TextChoices):
+    EN_ATTENTE = "en_attente", _("En attente")
+    EN_COURS = "en_cours", _("En cours")
+    TERMINE = "termine", _("Terminé")
+    ECHOUE = "echoue", _("Échoué")
+
+
+def export_storage():
+    # hors de MEDIA_ROOT : un export n'est servi que par la vue de téléchargement authentifiée
+    return FileSystemStorage(location=settings.EXPORT_ROOT)
+
+
+class ExportJob(TimeStampedModel):
+    """
+    Export asynchrone du flux combiné (CSV / XLSX / DOCX), exécuté par une
+    tâche Celery : le fichier est écrit sous EXPORT_ROOT/exports/ et n'est
+    téléchargeable que par le demandeur ou le staff.
+    `empreinte` (format + filtres normalisés) sert à dédoublonner les
+    demandes identiques rapprochées ; `actif` vaut True tant que le job est
+    en attente ou en cours, NULL ensuite : la contrainte unique
+    (empreinte, actif) garantit un seul job actif par empreinte, même pour
+    deux demandes simultanées.
+    """
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    format = models.CharField(max_length=10)
+    parametres = models.JSONField(default=dict, blank=True)
+    empreinte = models.CharField(max_length=64)
+    statut = models.CharField(max_length=20, choices=StatutExport.choices, default=StatutExport.EN_ATTENTE)
+    lignes = models.PositiveIntegerField(default=0)
+    fichier = models.FileField(upload_to="exports/", storage=export_storage, null=True, blank=True)
+    erreur = models.TextField(blank=True, default="")
+    demande_par = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True, blank=True
+    )
+    actif = models.BooleanField(null=True, default=None, editable=False)
+    date_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "paiement_lease_export"
+        ordering = ("-created",)
+        indexes = [
+            models.Index(fields=["empreinte", "statut"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["empreinte", "actif"], name="uniq_export_actif_par_empreinte"),
+        ]
+
+    def __str__(self):
+        return f"Export {self.format} {self.job_id} ({self.statut})"
+
+
+
+class RapportJournalier(TimeStampedModel):
+    """
+    Instantané du récapitulatif DOCX d'un jour passé (date concernée = jour,
+    sans autre filtre) : contexte du modèle rapport-leases.docx déjà formaté
+    (payés, non payés, pénalités, congés). Calculé par la tâche qui suit la
+    fenêtre de 14h ou à la première demande ; supprimé dès qu'une écriture
+    touche ce jour (paiement, pénalité, congé).
+    """
+    jour = models.DateField(unique=True)
+    contexte = models.JSONField(default=dict)
+
+    class Meta:
+        db_table = "paiement_lease_rapport_journalier"
+        ordering = ("-jour",)
+
+    def __str__(self):
+        return f"Rapport du {self.jour}"
+
+
+
+class CleIdempotence(TimeStampedModel):
+    """
+    Réponse enregistrée d'un POST rejouable (en-tête Idempotency-Key ou
+    reference_transaction) : une nouvelle tentative avec la même clé renvoie
+    cette réponse sans refaire le traitement. `cle` = portée + empreinte de
+    la clé ; `empreinte` = empreinte du corps de la requête d'origine.
+    """
+    cle = models.CharField(max_length=100, unique=True)
+    empreinte = models.CharField(max_length=64)
+    statut_http = models.PositiveSmallIntegerField(default=0)
+    reponse = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        db_table = "paiement_lease_idempotence"
+        indexes = [
+            models.Index(fields=["created"]),
+        ]
+
+    def __str__(self):
+        return f"{self.cle} ({self.statut_http})"
+
+
+
+class CompteurPaiementJour(TimeStampedModel):
+    """
+    Nombre de paiements de lease enregistrés par contrat et par jour local
+    (règle des 2 paiements par jour) : la règle touche une seule ligne, par
+    la clé unique (contrat, jour), au lieu de compter les paiements du jour.
+    """
+    contrat_chauffeur = models.ForeignKey(
+        ContratChauffeur, on_delete=models.CASCADE, related_name="compteurs_paiement_jour"
+    )
+    jour = models.DateField()
+    nombre = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        db_table = "paiement_lease_compteur_jour"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["contrat_chauffeur", "jour"],
+                name="uniq_compteur_paiement_par_contrat_et_jour",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.contrat_chauffeur_id} {self.jour} : {self.nombre}"
+
+
+
+class CalendrierPaiementMois(TimeStampedModel):
+    """
+    Projection du calendrier des paiements (CalendrierPaiementsAPIView) : une
+    ligne par contrat et par mois, les jours en bitmaps (bit j-1 = jour j) :
+    `payes` = au moins un paiement enregistré ce jour (jour local de created),
+    `conges` = jour couvert par un congé approuvé. `comptes` garde le nombre
+    de paiements des jours à 2 paiements ou plus. Recalculée à chaque écriture
+    de paiement ou de congé (voir paiement_lease.calendrier).
+    """
+    contrat_chauffeur = models.ForeignKey(
+        ContratChauffeur, on_delete=models.CASCADE, related_name="calendrier_paiements"
+    )
+    mois = models.DateField()  # premier jour du mois
+    payes = models.PositiveIntegerField(default=0)
+    conges = models.PositiveIntegerField(default=0)
+    nombre = models.PositiveIntegerField(default=0)
+    comptes = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        db_table = "paiement_lease_calendrier_mois"
+        ordering = ("contrat_chauffeur", "mois")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["contrat_chauffeur", "mois"],
+                name="uniq_calendrier_paiement_par_contrat_et_mois",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.contrat_chauffeur_id} {self.mois:%Y-%m}"
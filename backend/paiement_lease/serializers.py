@@ -1,5 +1,6 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import PaiementLease
+from .models import ExportJob, PaiementLease
 
 from penalite.models import Penalite
 
@@ -99,6 +100,24 @@ class LeasePaymentLiteSerializer(serializers.ModelSerializer):
         return "PAYE"
 
 
+class LeasePaymentBatchLineSerializer(serializers.ModelSerializer):
+    """Ligne d'un lot de paiements ; sans dates, celles du contrat sont utilisées."""
+    contrat_id = serializers.IntegerField()
+    date_paiement_concerne = serializers.DateField(required=False, allow_null=True)
+    date_limite_paiement = serializers.DateField(required=False, allow_null=True)
+
+    class Meta:
+        model = PaiementLease
+        fields = [
+            "contrat_id",
+            "montant_moto",
+            "montant_batt",
+            "methode_paiement",
+            "reference_transaction",
+            "date_paiement_concerne",
+            "date_limite_paiement",
+        ]
+
 
 from rest_framework import serializers
 from penalite.models import Penalite
@@ -216,3 +235,20 @@ class LeaseNonPayeLiteSerializer(serializers.ModelSerializer):
         return "NON_PAYE"
 
 
+
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ["job_id", "format", "parametres", "statut", "lignes", "erreur", "url", "created", "date_fin"]
+
+    def get_url(self, obj):
+        # lien de téléchargement (vue authentifiée) une fois le fichier écrit
+        if not obj.fichier:
+            return None
+        url = reverse("lease-combined-export-job-file", kwargs={"job_id": obj.job_id})
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
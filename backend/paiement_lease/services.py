@@ -0,0 +1,595 @@
+# paiement_lease/services.py
+import hashlib
+import json
+import logging
+import time as time_module
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (CharField, Count, DateTimeField, DecimalField, Exists, F, IntegerField,
+                              OuterRef, Q, Sum, Value)
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.utils import timezone
+
+from app_legacy.services import SwapStateBatch
+from contrat_chauffeur.models import ContratBatterie, ContratChauffeur
+from penalite.models import Penalite, StatutPenalite
+from .models import CleIdempotence, CompteurPaiementJour, PaiementLease, RapportJournalier
+
+logger = logging.getLogger(__name__)
+
+
+# 📅 Échéancier : les dimanches ne sont jamais des jours de paiement
+def next_working_day(d):
+    """Retourne le jour suivant, en sautant le dimanche."""
+    nxt = d + timedelta(days=1)
+    while nxt.weekday() == 6:  # 6 = dimanche
+        nxt += timedelta(days=1)
+    return nxt
+
+
+def add_days_skip_sunday(d, n=1):
+    """Ajoute n jours à une date, en sautant les dimanches."""
+    result = d
+    for _ in range(n):
+        result += timedelta(days=1)
+        while result.weekday() == 6:
+            result += timedelta(days=1)
+    return result
+
+
+
+# 🔢 Limite de paiements par contrat et par jour (CompteurPaiementJour)
+MAX_PAIEMENTS_JOUR = 2
+
+
+def _recorded_payment_counts(contrat_ids: Iterable[int], jour: date) -> dict[int, int]:
+    """
+    Paiements de lease créés le `jour` (jour local) pour chaque contrat. Sert
+    d'amorce quand le compteur du jour n'existe pas encore : paiements écrits
+    avant le déploiement du compteur, ou par l'ancien code pendant la bascule.
+    Lecture simple, sans verrou.
+    """
+    debut = timezone.make_aware(datetime.combine(jour, time.min))
+    fin = debut + timedelta(days=1)
+    return dict(
+        PaiementLease.objects
+        .filter(contrat_chauffeur_id__in=list(contrat_ids), created__gte=debut, created__lt=fin)
+        .values("contrat_chauffeur_id").annotate(n=Count("id"))
+        .values_list("contrat_chauffeur_id", "n")
+    )
+
+
+def reserve_daily_payment(contrat_id: int, jour: date, limite: int = MAX_PAIEMENTS_JOUR) -> bool:
+    """
+    Réserve un paiement dans le compteur du jour du contrat : True (compteur
+    incrémenté) si la limite n'est pas atteinte, False sinon. Seule la ligne
+    (contrat, jour) est touchée : pas de comptage ni de verrou de plage.
+    """
+    compteur = CompteurPaiementJour.objects.filter(contrat_chauffeur_id=contrat_id, jour=jour, nombre__lt=limite)
+    if compteur.update(nombre=F("nombre") + 1, updated=timezone.now()):
+        return True
+
+    # pas de ligne sous la limite : premier paiement du jour (compteur amorcé
+    # avec les paiements déjà enregistrés), sinon la ligne existe déjà (limite
+    # atteinte ou insertion concurrente) -> UPDATE gardé rejoué
+    deja = _recorded_payment_counts([contrat_id], jour).get(contrat_id, 0)
+    try:
+        with transaction.atomic():
+            CompteurPaiementJour.objects.create(contrat_chauffeur_id=contrat_id, jour=jour,
+                                                nombre=min(deja + 1, limite))
+        return deja < limite
+    except IntegrityError:
+        return bool(compteur.update(nombre=F("nombre") + 1, updated=timezone.now()))
+
+
+def daily_payment_counts(contrat_ids: Iterable[int], jour: date) -> dict[int, int]:
+    """
+    Paiements déjà enregistrés le `jour` pour chaque contrat ({contrat_id: nombre}).
+    Les contrats sans compteur du jour sont comptés sur PaiementLease.
+    """
+    contrat_ids = list(contrat_ids)
+    counts = dict(
+        CompteurPaiementJour.objects
+        .filter(contrat_chauffeur_id__in=contrat_ids, jour=jour)
+        .values_list("contrat_chauffeur_id", "nombre")
+    )
+    sans_compteur = [cid for cid in contrat_ids if cid not in counts]
+    if sans_compteur:
+        counts.update(_recorded_payment_counts(sans_compteur, jour))
+    return counts
+
+
+def set_daily_payment_counts(counts: dict[int, int], jour: date) -> None:
+    """
+    Écrit les compteurs du `jour` ({contrat_id: nombre}) en un upsert groupé
+    (INSERT ... ON DUPLICATE KEY UPDATE sur MySQL). Les contrats doivent être
+    verrouillés par l'appelant.
+    """
+    if not counts:
+        return
+    # MySQL : ON DUPLICATE KEY UPDATE, sans cible de conflit explicite
+    unique_fields = (["contrat_chauffeur", "jour"]
+                     if connection.features.supports_update_conflicts_with_target else None)
+    CompteurPaiementJour.objects.bulk_create(
+        [CompteurPaiementJour(contrat_chauffeur_id=cid, jour=jour, nombre=n) for cid, n in counts.items()],
+        update_conflicts=True, unique_fields=unique_fields, update_fields=["nombre", "updated"],
+        batch_size=500,
+    )
+
+# 💳 Paiement : écritures minimales sous le verrou du contrat
+def apply_payment_to_contracts(contrat_id: int, contrat_batt_id: int | None, m_moto: Decimal, m_batt: Decimal,
+                               date_concernee: date, date_limite: date) -> bool:
+    """
+    Reporte un paiement sur le contrat chauffeur (et son contrat batterie) par
+    des UPDATE conditionnels, sans recharger ni valider les modèles (save()
+    -> full_clean() interroge les FK). Retourne False, sans rien écrire, si le
+    montant payé sortirait de [0 .. montant_total] (garde de ContratChauffeur.clean).
+    """
+    now = timezone.now()
+    money = DecimalField(max_digits=14, decimal_places=2)
+    m_total = m_moto + m_batt
+
+    def restant(montant):
+        return Greatest(
+            F("montant_total") - F("montant_paye") - Value(montant, output_field=money),
+            Value(Decimal("0"), output_field=money),
+            output_field=money,
+        )
+
+    # montant_restant avant montant_paye : MySQL évalue le SET de gauche à droite
+    updated = (ContratChauffeur.objects
+               .filter(pk=contrat_id,
+                       montant_paye__gte=Value(-m_total, output_field=money),
+                       montant_total__gte=F("montant_paye") + Value(m_total, output_field=money))
+               .update(montant_restant=restant(m_total),
+                       montant_paye=F("montant_paye") + Value(m_total, output_field=money),
+                       date_concernee=date_concernee,
+                       date_limite=date_limite,
+                       updated=now))
+    if not updated:
+        return False
+
+    if contrat_batt_id:
+        ContratBatterie.objects.filter(pk=contrat_batt_id).update(
+            montant_restant=restant(m_batt),
+            montant_paye=F("montant_paye") + Value(m_batt, output_field=money),
+            updated=now,
+        )
+    return True
+
+
+def refresh_swap_after_payment(contrat_id: int, association_id: int | None) -> None:
+    """
+    Débloque le swap de l'association si le contrat n'a plus de pénalité
+    échue, sinon le maintient bloqué. Appelée après le commit du paiement.
+    """
+    if not association_id:
+        return
+    penalite_en_retard = Penalite.objects.filter(
+        contrat_chauffeur_id=contrat_id,
+        statut_penalite__in=[StatutPenalite.NON_PAYE, StatutPenalite.PARTIELLEMENT_PAYE],
+        echeance_paiement_penalite__lt=timezone.now(),
+    ).exists()
+
+    swaps = SwapStateBatch()
+    if penalite_en_retard:
+        swaps.block(association_id)
+    else:
+        swaps.unblock(association_id)
+    swaps.flush()
+    logger.info("[SWAP] association %s : swap %s après paiement", association_id,
+                "maintenu bloqué (pénalité échue)" if penalite_en_retard else "débloqué")
+
+
+# Colonnes du flux combiné PAYE + NON_PAYE (voir combined_rows_queryset)
+COMBINED_FIELDS = ("id", "source", "tri")
+
+
+class PaidDayIndex:
+    """
+    Index compact des jours payés par contrat.
+
+    Une seule requête charge (contrat, date_concernee, created, montant_total)
+    pour tous les paiements de la fenêtre ; chaque contrat est ensuite résumé
+    par des bitsets (entiers Python) où le bit i représente le jour start + i :
+
+    - paid    : au moins un paiement pour le jour
+    - on_time : paiement reçu avant `deadline(contrat, jour)` avec au moins le
+                montant attendu du contrat (`montants_min`)
+    - late    : paiement reçu entre `deadline(contrat, jour)` et
+                `late_deadline(contrat, jour)`
+
+    `by="date_concernee"` indexe les paiements par jour concerné (moteur de
+    pénalités) ; `by="created"` par jour local d'enregistrement (calendrier).
+    Avec start/end à None la fenêtre est déduite des paiements chargés.
+    """
+
+    def __init__(self, start: date | None):
+        self.start = start
+        self._paid: dict[int, int] = {}
+        self._on_time: dict[int, int] = {}
+        self._late: dict[int, int] = {}
+        self._counts: dict[int, dict[int, int]] = {}
+
+    @classmethod
+    def load(cls, start: date | None, end: date | None,
+             contrat_ids: Iterable[int] | None = None,
+             montants_min: dict[int, Decimal] | None = None,
+             deadline: Callable[[int, date], datetime] | None = None,
+             late_deadline: Callable[[int, date], datetime] | None = None,
+             by: str = "date_concernee",
+             statuts: Iterable[str] | None = ("PAYE",)) -> "PaidDayIndex":
+        qs = PaiementLease.objects.all()
+        if statuts is not None:
+            qs = qs.filter(statut__in=list(statuts))
+        if contrat_ids is not None:
+            qs = qs.filter(contrat_chauffeur_id__in=list(contrat_ids))
+
+        if by == "created":
+            tz = timezone.get_current_timezone()
+            qs = qs.exclude(created__isnull=True)
+            if start:
+                qs = qs.filter(created__gte=timezone.make_aware(datetime.combine(start, time.min), tz))
+            if end:
+                qs = qs.filter(created__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz))
+        else:
+            if start:
+                qs = qs.filter(date_concernee__gte=start)
+            if end:
+                qs = qs.filter(date_concernee__lte=end)
+
+        rows = []
+        for contrat_id, date_concernee, created, montant in (
+                qs.order_by().values_list("contrat_chauffeur_id", "date_concernee", "created", "montant_total")):
+            jour = timezone.localdate(created) if by == "created" else date_concernee
+            rows.append((contrat_id, jour, created, montant))
+
+        if start is None:
+            start = min((r[1] for r in rows), default=None)
+        index = cls(start)
+        montants_min = montants_min or {}
+
+        for contrat_id, jour, created, montant in rows:
+            offset = (jour - start).days
+            if offset < 0:
+                continue
+            bit = 1 << offset
+
+            index._paid[contrat_id] = index._paid.get(contrat_id, 0) | bit
+            counts = index._counts.setdefault(contrat_id, {})
+            counts[offset] = counts.get(offset, 0) + 1
+
+            limit = deadline(contrat_id, jour) if deadline else None
+            if (limit is None or created <= limit) and (montant or 0) >= (montants_min.get(contrat_id) or 0):
+                index._on_time[contrat_id] = index._on_time.get(contrat_id, 0) | bit
+            elif limit is not None and late_deadline and limit < created <= late_deadline(contrat_id, jour):
+                index._late[contrat_id] = index._late.get(contrat_id, 0) | bit
+
+        return index
+
+    def _bit(self, bits: dict[int, int], contrat_id: int, jour: date) -> bool:
+        if self.start is None:
+            return False
+        offset = (jour - self.start).days
+        return offset >= 0 and bool((bits.get(contrat_id, 0) >> offset) & 1)
+
+    def has_payment(self, contrat_id: int, jour: date) -> bool:
+        return self._bit(self._paid, contrat_id, jour)
+
+    def is_paid(self, contrat_id: int, jour: date) -> bool:
+        """Payé à temps et au montant attendu (règle du moteur de pénalités)."""
+        return self._bit(self._on_time, contrat_id, jour)
+
+    def paid_late(self, contrat_id: int, jour: date) -> bool:
+        return self._bit(self._late, contrat_id, jour)
+
+    def count(self, contrat_id: int, jour: date) -> int:
+        if self.start is None:
+            return 0
+        return self._counts.get(contrat_id, {}).get((jour - self.start).days, 0)
+
+    def paid_days(self, contrat_id: int) -> list[date]:
+        """Jours (triés) ayant au moins un paiement."""
+        bits = self._paid.get(contrat_id, 0)
+        days = []
+        offset = 0
+        while bits:
+            if bits & 1:
+                days.append(self.start + timedelta(days=offset))
+            bits >>= 1
+            offset += 1
+        return days
+
+
+def _keyset_filter(source: str, key: tuple[datetime, str, int], backward: bool) -> Q:
+    """
+    Lignes d'une branche (source constante) situées après `key` dans l'ordre
+    (tri DESC, source DESC, id DESC), ou avant si `backward`.
+    """
+    tri, key_source, key_id = key
+    if backward:
+        if source > key_source:
+            return Q(tri__gte=tri)
+        if source == key_source:
+            return Q(tri__gt=tri) | Q(tri=tri, id__gt=key_id)
+        return Q(tri__gt=tri)
+    if source < key_source:
+        return Q(tri__lte=tri)
+    if source == key_source:
+        return Q(tri__lt=tri) | Q(tri=tri, id__lt=key_id)
+    return Q(tri__lt=tri)
+
+
+def combined_rows_queryset(paid_qs, np_qs, statut: str = "",
+                           after: tuple[datetime, str, int] | None = None,
+                           before: tuple[datetime, str, int] | None = None):
+    """
+    Flux combiné des paiements (PAYE) et des pénalités non couvertes
+    (NON_PAYE) en un seul UNION ALL, trié côté base :
+
+        tri DESC, source DESC, id DESC
+
+    `tri` reprend la clé de tri historique : `created` pour un paiement,
+    minuit local de `date_paiement_manquee` pour une pénalité ; à égalité
+    les PAYE passent avant les NON_PAYE. Chaque ligne ne porte que
+    COMBINED_FIELDS : paginer ce queryset ne lit que la page demandée, les
+    lignes complètes sont ensuite chargées par source.
+
+    `after` / `before` (clé (tri, source, id)) restreignent chaque branche
+    aux lignes suivant / précédant la clé (pagination par curseur) ; avec
+    `before` l'ordre est inversé.
+    """
+    text = CharField()
+    when = DateTimeField()
+    # Décalage du fuseau courant (Africa/Douala, sans heure d'été) : minuit local en UTC
+    offset = Value(timezone.localtime().utcoffset() or timedelta(0))
+
+    branches = {
+        "PAYE": paid_qs.order_by().annotate(
+            source=Value("PAYE", output_field=text),
+            tri=F("created"),
+        ),
+        "NON_PAYE": np_qs.order_by().annotate(
+            source=Value("NON_PAYE", output_field=text),
+            tri=Cast("date_paiement_manquee", when) - offset,
+        ),
+    }
+    if statut in branches:
+        branches = {statut: branches[statut]}
+
+    parts = []
+    for source, qs in branches.items():
+        if after or before:
+            qs = qs.filter(_keyset_filter(source, after or before, backward=bool(before)))
+        parts.append(qs.values(*COMBINED_FIELDS))
+
+    rows = parts[0].union(*parts[1:], all=True) if len(parts) > 1 else parts[0]
+    if before:
+        return rows.order_by("tri", "source", "id")
+    return rows.order_by("-tri", "-source", "-id")
+
+
+def encode_cursor(row: dict, backward: bool = False) -> str:
+    """Curseur opaque (base64) d'une ligne du flux combiné."""
+    payload = {"t": row["tri"].isoformat(), "s": row["source"], "i": row["id"], "r": int(backward)}
+    return urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[tuple[datetime, str, int], bool] | None:
+    """(clé, backward) d'un curseur, None s'il est invalide."""
+    try:
+        payload = json.loads(urlsafe_b64decode(cursor.encode()))
+        tri = datetime.fromisoformat(payload["t"])
+        if timezone.is_naive(tri):
+            return None
+        return (tri, str(payload["s"]), int(payload["i"])), bool(payload.get("r"))
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def combined_rows_page(paid_qs, np_qs, statut: str, cursor: str | None, size: int) -> tuple[list[dict], str | None, str | None]:
+    """
+    Une page du flux combiné par clé (keyset) : (lignes, curseur suivant,
+    curseur précédent). Coût constant quelle que soit la profondeur : pas
+    d'OFFSET, pas de COUNT.
+    """
+    decoded = decode_cursor(cursor) if cursor else None
+    key, backward = decoded if decoded else (None, False)
+
+    if backward:
+        rows = list(combined_rows_queryset(paid_qs, np_qs, statut, before=key)[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size][::-1]
+        if not rows:
+            return [], None, None
+        return rows, encode_cursor(rows[-1]), encode_cursor(rows[0], backward=True) if has_more else None
+
+    rows = list(combined_rows_queryset(paid_qs, np_qs, statut, after=key)[:size + 1])
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if not rows:
+        return [], None, None
+    return (rows,
+            encode_cursor(rows[-1]) if has_more else None,
+            encode_cursor(rows[0], backward=True) if key else None)
+
+
+def _q2(val) -> Decimal:
+    return Decimal(val or 0).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def combined_totals(paid_qs, pen_qs, conge_qs) -> dict:
+    """
+    Bloc meta.totals du flux combiné en un seul aller-retour : UNION ALL de
+    trois agrégats conditionnels (paiements, pénalités, congés).
+
+    - paid      : SUM(montant_moto + montant_batt), COUNT
+    - non_paid  : pénalités de `pen_qs` sans paiement de lease pour
+                  (contrat, jour) : -SUM(montant_par_paiement moto + batterie), COUNT
+    - conges    : COUNT
+    - penalites : COUNT de `pen_qs`
+    """
+    text = CharField()
+    money = DecimalField(max_digits=18, decimal_places=2)
+    zero = Value(Decimal("0"), output_field=money)
+    none = Value(0, output_field=IntegerField())
+    uncovered = Q(lease_paid=False)
+
+    paid = (paid_qs.order_by()
+            .annotate(k=Value("paid", output_field=text))
+            .values("k")
+            .annotate(
+                amount=Coalesce(Sum(Coalesce("montant_moto", zero) + Coalesce("montant_batt", zero)), zero),
+                n=Count("id"),
+                n_np=none,
+            ))
+    penalites = (pen_qs.order_by()
+                 .annotate(
+                     lease_paid=Exists(PaiementLease.objects.filter(
+                         contrat_chauffeur=OuterRef("contrat_chauffeur_id"),
+                         date_concernee=OuterRef("date_paiement_manquee"),
+                     )),
+                     k=Value("penalites", output_field=text),
+                 )
+                 .values("k")
+                 .annotate(
+                     amount=Coalesce(Sum(
+                         Coalesce("contrat_chauffeur__montant_par_paiement", zero) +
+                         Coalesce("contrat_chauffeur__contrat_batt__montant_par_paiement", zero),
+                         filter=uncovered,
+                     ), zero),
+                     n=Count("id"),
+                     n_np=Count("id", filter=uncovered),
+                 ))
+    conges = (conge_qs.order_by()
+              .annotate(k=Value("conges", output_field=text))
+              .values("k")
+              .annotate(amount=zero, n=Count("id"), n_np=none))
+
+    rows = {r["k"]: r for r in paid.union(penalites, conges, all=True)}
+    p, pen, c = rows["paid"], rows["penalites"], rows["conges"]
+    return {
+        "paid": {"amount": float(_q2(p["amount"])), "count": int(p["n"])},
+        "non_paid": {"amount": float(_q2(0 - _q2(pen["amount"]))), "count": int(pen["n_np"])},
+        "conges": {"count": int(c["n"])},
+        "penalites": {"count": int(pen["n"])},
+    }
+
+
+# Paramètres de requête qui influencent meta.totals (le tri, 'statut' et la page n'en font pas partie)
+TOTALS_PARAMS = (
+    "q", "paye_par", "agence",
+    "date_concernee", "date_concernee_after", "date_concernee_before",
+    "created", "created_after", "created_before",
+)
+TOTALS_CACHE = "totaux"
+TOTALS_VERSION_KEY = "lease_totaux:version"
+
+
+def _totals_version(cache) -> int:
+    # Version initiale horodatée : une clé de version évincée ne ressert jamais d'anciens totaux
+    return cache.get_or_set(TOTALS_VERSION_KEY, time_module.time_ns(), timeout=None)
+
+
+def totals_cache_key(params) -> str:
+    """Clé de cache des totaux pour un jeu de filtres normalisé (espaces, casse, ordre)."""
+    normalized = {}
+    for name in TOTALS_PARAMS:
+        value = " ".join((params.get(name) or "").split())
+        if value:
+            normalized[name] = value.lower() if name in ("q", "paye_par", "agence") else value
+    digest = hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+    return f"lease_totaux:{_totals_version(caches[TOTALS_CACHE])}:{digest}"
+
+
+def cached_combined_totals(params, compute) -> dict:
+    """meta.totals depuis le cache TOTALS_CACHE, calculés par `compute()` en cas d'absence."""
+    cache = caches[TOTALS_CACHE]
+    key = totals_cache_key(params)
+    totals = cache.get(key)
+    if totals is None:
+        totals = compute()
+        cache.set(key, totals)
+    return totals
+
+
+def invalidate_combined_totals() -> None:
+    """
+    Invalide tous les totaux en cache (changement de version), après le
+    commit de la transaction courante : à appeler à chaque écriture de
+    PaiementLease, Penalite ou Conge.
+    """
+    def bump():
+        cache = caches[TOTALS_CACHE]
+        try:
+            cache.incr(TOTALS_VERSION_KEY)
+        except ValueError:
+            cache.set(TOTALS_VERSION_KEY, time_module.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+
+def invalidate_daily_reports(start: date | None, end: date | None = None) -> None:
+    """
+    Supprime les instantanés RapportJournalier de [start .. end] (un seul jour
+    si `end` est omis) : le prochain rapport de ces jours sera recalculé. À
+    appeler à chaque écriture datée ; sans `start` (écriture non datée, par
+    ex. pénalité sans date_paiement_manquee) rien n'est supprimé.
+    """
+    if start is None:
+        return
+    RapportJournalier.objects.filter(jour__gte=start, jour__lte=end or start).delete()
+
+
+
+# 🔑 Idempotence des POST (voir CleIdempotence)
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# Durée pendant laquelle une clé rejoue sa réponse ; purgée ensuite (purge_idempotency_keys)
+IDEMPOTENCY_TTL = timedelta(hours=getattr(settings, "IDEMPOTENCE_TTL_HEURES", 72))
+
+
+def idempotency_key(request, scope: str) -> str | None:
+    """
+    Clé d'idempotence de la requête pour `scope` : en-tête Idempotency-Key,
+    à défaut reference_transaction du corps ; None si aucune des deux.
+    """
+    raw = (request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+    if not raw:
+        ref = str(request.data.get("reference_transaction") or "").strip()
+        raw = f"ref:{ref}" if ref else ""
+    if not raw:
+        return None
+    return f"{scope}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def request_fingerprint(data) -> str:
+    """Empreinte du corps de la requête, pour refuser une clé réutilisée avec un autre contenu."""
+    items = data.lists() if hasattr(data, "lists") else data.items()
+    return hashlib.sha256(json.dumps(dict(items), sort_keys=True, default=str).encode()).hexdigest()
+
+
+def idempotency_expired(stored: CleIdempotence) -> bool:
+    """Clé plus ancienne que IDEMPOTENCE_TTL_HEURES : elle ne rejoue plus sa réponse."""
+    return stored.created < timezone.now() - IDEMPOTENCY_TTL
+
+
+def purge_idempotency_keys(before: datetime | None = None, batch_size: int = 1000) -> int:
+    """
+    Supprime par lots les clés d'idempotence créées avant `before` (défaut :
+    maintenant - IDEMPOTENCE_TTL_HEURES). Retourne le nombre de clés supprimées.
+    """
+    before = before or timezone.now() - IDEMPOTENCY_TTL
+    deleted = 0
+    while True:
+        ids = list(CleIdempotence.objects.filter(created__lt=before)
+                   .order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += CleIdempotence.objects.filter(pk__in=ids).delete()[0]
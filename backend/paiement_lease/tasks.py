@@ -0,0 +1,37 @@
+# paiement_lease/tasks.py
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from paiement_lease.calendrier import refresh_payment_calendar
+from paiement_lease.exports import daily_report_context, run_export_job
+from paiement_lease.services import purge_idempotency_keys
+
+
+@shared_task
+def executer_export_lease(job_id: str):
+    return run_export_job(job_id)
+
+
+@shared_task
+def generer_rapport_journalier(jour: str | None = None):
+    """Recalcule l'instantané du récapitulatif de `jour` ('YYYY-MM-DD', défaut : la veille)."""
+    jour = parse_date(jour) if jour else timezone.localdate() - timedelta(days=1)
+    context = daily_report_context(jour, refresh=True)
+    return {"jour": jour.isoformat(), "lignes": len(context["paid_rows"]) + len(context["non_paid_rows"])}
+
+
+@shared_task
+def purger_cles_idempotence():
+    """Supprime les clés d'idempotence expirées (IDEMPOTENCE_TTL_HEURES) ; à planifier une fois par jour."""
+    return {"supprimees": purge_idempotency_keys()}
+
+
+@shared_task
+def rafraichir_calendrier_paiements(contrat_ids: list[int], debut: str | None = None, fin: str | None = None):
+    """Recalcule le calendrier des contrats sur les mois de [debut .. fin] ('YYYY-MM-DD', défaut : tout l'historique)."""
+    debut = parse_date(debut) if debut else None
+    fin = parse_date(fin) if fin else None
+    return {"mois": refresh_payment_calendar(contrat_ids, debut, fin)}
@@ -2,16 +2,23 @@ from django.urls import path
 
 from paiement_lease.views import PaiementLeaseAPIView, \
     LeaseCombinedListAPIView, LeaseCombinedExportXLSX, LeaseCombinedExportCSV, LeaseCombinedExportDOCX
-from paiement_lease.views import  PaiementLeaseAPIView, \
-    LeaseCombinedListAPIView, LeaseCombinedExportXLSX, LeaseCombinedExportCSV, CalendrierPaiementsAPIView
+from paiement_lease.views import  PaiementLeaseAPIView, PaiementLeaseBatchAPIView, \
+    LeaseCombinedListAPIView, LeaseCombinedExportXLSX, LeaseCombinedExportCSV, CalendrierPaiementsAPIView, \
+    LeaseCombinedExportJobAPIView, LeaseCombinedExportJobStatusAPIView, LeaseCombinedExportJobFileAPIView
 
 
 urlpatterns = [
     path("lease/pay", PaiementLeaseAPIView.as_view(), name="lease-pay"),
+    path("lease/pay/batch", PaiementLeaseBatchAPIView.as_view(), name="lease-pay-batch"),
     path("lease/combined", LeaseCombinedListAPIView.as_view(), name="lease-combined"),
     path("lease/combined/export/xlsx", LeaseCombinedExportXLSX.as_view(), name="lease-combined-export-excel"),
     path("lease/combined/export/csv", LeaseCombinedExportCSV.as_view(), name="lease-combined-export-csv"),
     path("lease/combined/export/docx", LeaseCombinedExportDOCX.as_view(), name="lease-combined-export-docx"),
+    path("lease/combined/export/jobs", LeaseCombinedExportJobAPIView.as_view(), name="lease-combined-export-jobs"),
+    path("lease/combined/export/jobs/<uuid:job_id>", LeaseCombinedExportJobStatusAPIView.as_view(),
+         name="lease-combined-export-job"),
+    path("lease/combined/export/jobs/<uuid:job_id>/fichier", LeaseCombinedExportJobFileAPIView.as_view(),
+         name="lease-combined-export-job-file"),
     path("lease/paiements/calendrier", CalendrierPaiementsAPIView.as_view(), name="calendrier-paiements"),
 
 ]
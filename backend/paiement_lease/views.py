@@ -1,6 +1,7 @@
-import csv
+import os
+import tempfile
 import uuid
-from collections import Counter
+from functools import partial
 from io import BytesIO
 
 
@@ -10,21 +11,27 @@ from django.db.models.fields import DecimalField
 from django.db.models.functions.comparison import Coalesce
 from decimal import Decimal, ROUND_HALF_UP
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.utils.urls import replace_query_param
 from django.db.models import Q, Value as V
-from openpyxl import Workbook
-from docxtpl import DocxTemplate
+from app_legacy.services import driver_search_q, search_association_ids
 from conge.models import Conge, StatutConge
 from penalite.models import Penalite, StatutPenalite
 from shared.models import StandardResultsSetPagination
+from .calendrier import calendar_summaries, schedule_calendar_refresh
+from .exports import EXPORT_FORMATS, csv_lines, iter_combined_rows, submit_export, write_docx, write_xlsx
 from .filters import PaiementLeaseFilter, NonPaiementLeaseFilter
+from .ingestion import ingest_payments, parse_payment_batch
 from .serializers import  LeasePaymentLiteSerializer, \
-    LeaseNonPayeLiteSerializer
+    LeaseNonPayeLiteSerializer, ExportJobSerializer
+from .services import add_days_skip_sunday, apply_payment_to_contracts, cached_combined_totals, combined_rows_page, combined_rows_queryset, \
+    combined_totals, idempotency_expired, idempotency_key, invalidate_combined_totals, invalidate_daily_reports, next_working_day, \
+    refresh_swap_after_payment, request_fingerprint, reserve_daily_payment
 from contrat_chauffeur.models import ContratChauffeur
-from paiement_lease.models import PaiementLease
+from paiement_lease.models import CleIdempotence, ExportJob, PaiementLease, StatutExport
 from datetime import datetime, time, timezone as py_timezone
 from django.utils.dateparse import parse_datetime, parse_date
 
@@ -39,42 +46,6 @@ from rest_framework.response import Response
 
 
 
-def _to_aware_utc(value):
-    """
-    Convertit 'value' (str|date|datetime|None) en datetime aware en UTC.
-    - ISO avec 'Z' ou offset → parse aware puis converti en UTC
-    - 'YYYY-MM-DD' → minuit local → rendu aware → converti en UTC
-    - naive → rendu aware (timezone courant) → converti en UTC
-    - None/parse ratée → 1970-01-01 UTC
-    """
-    if value is None:
-        return datetime(1970, 1, 1, tzinfo=py_timezone.utc)
-
-    if isinstance(value, datetime):
-        dt = value
-    elif isinstance(value, date):
-        dt = datetime.combine(value, time.min)
-    elif isinstance(value, str):
-        s = value.replace("Z", "+00:00").strip()
-        dt = parse_datetime(s)
-        if dt is None:
-            d = parse_date(s)
-            if d is not None:
-                dt = datetime.combine(d, time.min)
-            else:
-                return datetime(1970, 1, 1, tzinfo=py_timezone.utc)
-    else:
-        return datetime(1970, 1, 1, tzinfo=py_timezone.utc)
-
-    # rendre aware si besoin, en timezone locale Django
-    if timezone.is_naive(dt):
-        dt = timezone.make_aware(dt, timezone.get_current_timezone())
-
-    # convertir en UTC
-    return dt.astimezone(py_timezone.utc)
-
-
-
 def noon_aware(d):
     """Retourne un datetime à 12:00 (midi) pour une date donnée, aware si USE_TZ=True."""
     dt = datetime.combine(d, time(hour=12))
@@ -82,56 +53,65 @@ def noon_aware(d):
         dt = timezone.make_aware(dt, timezone.get_current_timezone())
     return dt
 
-def next_working_day(d):
-    """Retourne le jour suivant, en sautant le dimanche."""
-    nxt = d + timedelta(days=1)
-    while nxt.weekday() == 6:  # 6 = dimanche
-        nxt += timedelta(days=1)
-    return nxt
-
-def add_days_skip_sunday(d, n=1):
-    """Ajoute n jours à une date, en sautant les dimanches."""
-    result = d
-    for _ in range(n):
-        result += timedelta(days=1)
-        while result.weekday() == 6:
-            result += timedelta(days=1)
-    return result
-
 class PaiementLeaseAPIView(APIView):
+    """
+    Enregistre un paiement de lease. Rejouable : avec un en-tête
+    Idempotency-Key (ou un reference_transaction), une nouvelle tentative
+    renvoie la réponse d'origine sans verrouiller ni modifier le contrat.
+    """
     permission_classes = [IsAuthenticated]
-
+    idempotency_scope = "lease-pay"
+
+    @staticmethod
+    def _remember(idem, payload: dict, code: int) -> Response:
+        # la réponse est enregistrée dans la même transaction que le paiement
+        if idem is not None:
+            idem.statut_http, idem.reponse = code, payload
+            idem.save(update_fields=["statut_http", "reponse", "updated"])
+        return Response(payload, status=code)
+
+    @staticmethod
+    def _replay(stored, empreinte: str) -> Response:
+        if stored.empreinte != empreinte:
+            return Response(
+                {"success": False, "message": "Clé d'idempotence déjà utilisée pour une autre requête."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return Response(stored.reponse, status=stored.statut_http, headers={"Idempotent-Replayed": "true"})
 
     def post(self, request, *args, **kwargs):
         serializer = LeasePaymentLiteSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
+        # 🔑 Nouvelle tentative d'une requête déjà traitée : réponse d'origine, sans verrou
+        cle = idempotency_key(request, self.idempotency_scope)
+        empreinte = request_fingerprint(request.data) if cle else None
+        if cle and (stored := CleIdempotence.objects.filter(cle=cle).first()):
+            if not idempotency_expired(stored):
+                return self._replay(stored, empreinte)
+            # clé expirée (IDEMPOTENCE_TTL_HEURES) : la requête est traitée comme nouvelle
+            stored.delete()
+
         try:
             with transaction.atomic():
-                contrat = ContratChauffeur.objects.select_for_update().get(pk=data["contrat_id"])
+                # clé réservée avant le verrou du contrat : un doublon concurrent bute sur l'index unique
+                idem = CleIdempotence.objects.create(cle=cle, empreinte=empreinte) if cle else None
+
+                # verrou du contrat : seules les colonnes utiles sont relues
+                contrat = (ContratChauffeur.objects.select_for_update()
+                           .only("id", "date_concernee", "date_limite", "contrat_batt_id", "association_user_moto_id")
+                           .get(pk=data["contrat_id"]))
 
                 base_concernee = data.get("date_paiement_concerne") or contrat.date_concernee
                 base_limite = data.get("date_limite_paiement") or contrat.date_limite
 
-                today = timezone.localdate()
-                today_start = timezone.make_aware(datetime.combine(today, time.min))
-                today_end = timezone.make_aware(datetime.combine(today, time.max))
-
-                count_today = (
-                    PaiementLease.objects
-                    .select_for_update()
-                    .filter(
-                        contrat_chauffeur=contrat,
-                        created__range=(today_start, today_end)
-                    )
-                    .count()
-                )
-
-                if count_today >= 2:
-                    return Response(
+                # compteur du jour (une ligne) au lieu de compter les paiements du jour
+                if not reserve_daily_payment(contrat.pk, timezone.localdate()):
+                    return self._remember(
+                        idem,
                         {"success": False, "message": "Limite de 2 paiements par jour atteinte pour ce contrat."},
-                        status=status.HTTP_400_BAD_REQUEST
+                        status.HTTP_400_BAD_REQUEST
                     )
 
                 # Montants
@@ -139,6 +119,13 @@ class PaiementLeaseAPIView(APIView):
                 m_batt = Decimal(data.get("montant_batt") or 0)
                 m_total = m_moto + m_batt
 
+                # ✅ Mise à jour du contrat chauffeur (et batterie) : UPDATE conditionnels
+                next_concernee = next_working_day(base_concernee)
+                next_limite = add_days_skip_sunday(next_concernee, 1)
+                if not apply_payment_to_contracts(contrat.pk, contrat.contrat_batt_id, m_moto, m_batt,
+                                                  next_concernee, next_limite):
+                    raise ValueError("Le montant payé ne peut pas dépasser le montant total.")
+
                 now = timezone.now()
                 reference = f"PL-{now.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:5].upper()}"
                 statut_global = "PAYE" if m_total > 0 else "IMPAYE"
@@ -152,62 +139,34 @@ class PaiementLeaseAPIView(APIView):
                     reference_transaction=data.get("reference_transaction"),
                     type_contrat="CHAUFFEUR",
                     statut=statut_global,
-                    contrat_chauffeur=contrat,
+                    contrat_chauffeur_id=contrat.pk,
                     date_concernee=base_concernee,
                     date_limite=base_limite,
                     employe=request.user,
                     user_agence=None,
                 )
 
-                # ✅ Mise à jour du contrat chauffeur
-                contrat.montant_paye = (contrat.montant_paye or Decimal("0")) + m_total
-                contrat.montant_restant = max(
-                    Decimal("0"),
-                    (contrat.montant_total or Decimal("0")) - contrat.montant_paye
+                # 🟩 Swap (pénalités échues) décidé après le commit, hors verrou
+                transaction.on_commit(
+                    partial(refresh_swap_after_payment, contrat.pk, contrat.association_user_moto_id),
+                    robust=True,
                 )
+                schedule_calendar_refresh([contrat.pk], timezone.localdate())
 
-                next_concernee = next_working_day(base_concernee)
-                next_limite = add_days_skip_sunday(next_concernee, 1)
-
-                contrat.date_concernee = next_concernee
-                contrat.date_limite = next_limite
-                contrat.save()
-
-                if contrat.contrat_batt:
-                    batt = contrat.contrat_batt
-                    batt.montant_paye = (batt.montant_paye or Decimal("0")) + m_batt
-                    batt.montant_restant = max(
-                        Decimal("0"),
-                        (batt.montant_total or Decimal("0")) - batt.montant_paye
-                    )
-                    batt.save(update_fields=["montant_paye", "montant_restant", "updated"])
-
-                # 🟩 --- Nouvelle logique : débloquer le swap si plus de pénalité échue ---
-                from penalite.models import Penalite, StatutPenalite
-                now = timezone.now()
-                penalite_en_retard = Penalite.objects.filter(
-                    contrat_chauffeur=contrat,
-                    statut_penalite__in=[StatutPenalite.NON_PAYE, StatutPenalite.PARTIELLEMENT_PAYE],
-                    echeance_paiement_penalite__lt=now
-                ).exists()
-
-                assoc = getattr(contrat, "association_user_moto", None)
+                invalidate_combined_totals()
+                invalidate_daily_reports(base_concernee)
 
-                if assoc:
-                    if not penalite_en_retard:
-                        assoc.swap_bloque = 1  # ✅ Débloqué
-                        msg = f"✅ Swap débloqué automatiquement pour chauffeur {assoc.validated_user_id}"
-                    else:
-                        assoc.swap_bloque = 0  # 🚫 Toujours bloqué
-                        msg = f"⛔ Swap maintenu bloqué (pénalité échue) pour chauffeur {assoc.validated_user_id}"
-
-                    assoc.save(update_fields=["swap_bloque"])
-                    print(msg)
-                # 🟩 --- Fin ajout ---
-
-            return Response({"success": True, "message": "Paiement enregistré avec succès."},
-                            status=status.HTTP_201_CREATED)
+                response = self._remember(idem, {"success": True, "message": "Paiement enregistré avec succès."},
+                                          status.HTTP_201_CREATED)
+            return response
 
+        except IntegrityError as e:
+            # même clé traitée en parallèle et validée entre-temps : on rejoue sa réponse
+            stored = CleIdempotence.objects.filter(cle=cle).first() if cle else None
+            if stored is not None:
+                return self._replay(stored, empreinte)
+            return Response({"success": False, "message": str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
         except ContratChauffeur.DoesNotExist:
             return Response({"success": False, "message": "Contrat introuvable."},
                             status=status.HTTP_404_NOT_FOUND)
@@ -217,6 +176,31 @@ class PaiementLeaseAPIView(APIView):
                             status=status.HTTP_400_BAD_REQUEST)
 
 
+class PaiementLeaseBatchAPIView(APIView):
+    """
+    Saisie groupée des paiements (relevé mobile money de fin de journée).
+    Corps : liste JSON de paiements (ou {"paiements": [...]}), ou fichier
+    "fichier" .csv / .json en multipart. Chaque contrat n'est verrouillé
+    qu'une fois ; la réponse détaille les lignes acceptées et refusées.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        fichier = request.FILES.get("fichier")
+        try:
+            if fichier is not None:
+                fmt = (request.data.get("format") or fichier.name.rsplit(".", 1)[-1]).lower()
+                lines = parse_payment_batch(fichier.read(), fmt)
+            else:
+                lines = request.data if isinstance(request.data, list) else request.data.get("paiements")
+                if not isinstance(lines, list):
+                    raise ValueError("Liste de paiements attendue.")
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(ingest_payments(lines, employe=request.user), status=status.HTTP_200_OK)
+
+
 # class PaiementLeaseAPIView(APIView):
 #     permission_classes = [IsAuthenticated]
 #
@@ -312,8 +296,38 @@ class PaiementLeaseAPIView(APIView):
 #                             status=status.HTTP_400_BAD_REQUEST)
 
 
-def _sort_key(item: dict) -> datetime:
-    return _to_aware_utc(item.get("created") or item.get("date_concernee"))
+def _serialize_combined_rows(page) -> list[dict]:
+    """
+    Sérialise une page du flux combiné ({"id", "source", "tri"}) : une requête
+    par source pour les seules lignes de la page, ordre de la page conservé.
+    """
+    paid_ids = [r["id"] for r in page if r["source"] == "PAYE"]
+    np_ids = [r["id"] for r in page if r["source"] == "NON_PAYE"]
+
+    paid = PaiementLease.objects.select_related(
+        "contrat_chauffeur",
+        "contrat_chauffeur__association_user_moto",
+        "contrat_chauffeur__association_user_moto__validated_user",
+        "contrat_chauffeur__association_user_moto__moto_valide",
+        "user_agence",
+        "employe",
+        "agences",
+    ).in_bulk(paid_ids) if paid_ids else {}
+    non_paid = Penalite.objects.select_related(
+        "contrat_chauffeur",
+        "contrat_chauffeur__association_user_moto",
+        "contrat_chauffeur__association_user_moto__validated_user",
+        "contrat_chauffeur__association_user_moto__moto_valide",
+        "contrat_chauffeur__contrat_batt",
+    ).in_bulk(np_ids) if np_ids else {}
+
+    rows = []
+    for r in page:
+        if r["source"] == "PAYE" and r["id"] in paid:
+            rows.append(LeasePaymentLiteSerializer(paid[r["id"]]).data)
+        elif r["source"] == "NON_PAYE" and r["id"] in non_paid:
+            rows.append(LeaseNonPayeLiteSerializer(non_paid[r["id"]]).data)
+    return rows
 
 
 
@@ -322,14 +336,6 @@ class LeaseCombinedListAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
 
-    # --- util arrondi 2 décimales ---
-    def _q2(self, val) -> Decimal:
-        try:
-            d = Decimal(val or 0)
-        except Exception:
-            d = Decimal(0)
-        return d.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
     def _parse_iso_date(self, s: str | None) -> date | None:
         s = (s or "").strip()
         if not s:
@@ -339,50 +345,11 @@ class LeaseCombinedListAPIView(APIView):
         except Exception:
             return None
 
-    def _aggregate_paid(self, qs_paid):
-        """
-        Agrégat PAYE:
-          amount = SUM(montant_moto + montant_batt)
-          count  = nb de lignes
-        """
-        agg = qs_paid.aggregate(
-            total=Coalesce(
-                Sum(
-                    Coalesce(F("montant_moto"), V(0, output_field=DecimalField())) +
-                    Coalesce(F("montant_batt"), V(0, output_field=DecimalField()))
-                ),
-                V(0, output_field=DecimalField(max_digits=18, decimal_places=2)),
-            )
-        )
-        total = self._q2(agg["total"] or 0)
-        count = qs_paid.count()
-        return float(total), count
-
-    def _aggregate_non_paid(self, qs_np):
-        """
-        Agrégat NON_PAYE:
-          amount = somme des montants dus négatifs
-                   (-contrat.montant_par_paiement) + (-contrat_batt.montant_par_paiement)
-          count  = nb de lignes
-        Calcul en Python (dépend de champs liés + signe).
-        """
-        qs_np = qs_np.select_related("contrat_chauffeur", "contrat_chauffeur__contrat_batt")
-
-        total = Decimal("0.00")
-        count = 0
-        for pen in qs_np:
-            count += 1
-            contrat = pen.contrat_chauffeur
-            batt = getattr(contrat, "contrat_batt", None)
-            moto_due = -self._q2(getattr(contrat, "montant_par_paiement", 0))
-            batt_due = -self._q2(getattr(batt, "montant_par_paiement", 0) if batt else 0)
-            total += (moto_due + batt_due)
-
-        return float(self._q2(total)), count
-
     def get(self, request, *args, **kwargs):
 
         q = (request.GET.get("q") or "").strip()
+        # ids d'associations correspondant à q, résolus une fois sur la projection de recherche
+        search_ids = search_association_ids(q) if q else None
         statut = (request.GET.get("statut") or "").upper().strip()
         paye_par = (request.GET.get("paye_par") or "").strip()
         agence = (request.GET.get("station") or "").strip()
@@ -408,13 +375,7 @@ class LeaseCombinedListAPIView(APIView):
         paid_qs = PaiementLeaseFilter(request.GET, queryset=paid_qs).qs
 
         if q:
-            paid_qs = paid_qs.filter(
-                Q(contrat_chauffeur__association_user_moto__validated_user__user_unique_id__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__validated_user__nom__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__validated_user__prenom__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__moto_valide__moto_unique_id__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__moto_valide__vin__icontains=q)
-            )
+            paid_qs = paid_qs.filter(driver_search_q(q, "contrat_chauffeur__", search_ids))
         if paye_par := (request.GET.get("paye_par") or "").strip():
             terms = [t.strip() for t in paye_par.split() if t.strip()]
             q_paye_par = Q()
@@ -463,17 +424,8 @@ class LeaseCombinedListAPIView(APIView):
         np_qs = NonPaiementLeaseFilter(request.GET, queryset=np_qs).qs
 
         if q:
-            np_qs = np_qs.filter(
-                Q(contrat_chauffeur__association_user_moto__validated_user__user_unique_id__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__validated_user__nom__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__validated_user__prenom__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__moto_valide__moto_unique_id__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__moto_valide__vin__icontains=q)
-            )
+            np_qs = np_qs.filter(driver_search_q(q, "contrat_chauffeur__", search_ids))
 
-        # -------- AGRÉGATS (HORS PAGINATION) --------
-        total_paid, count_paid = self._aggregate_paid(paid_qs)
-        total_np, count_np = self._aggregate_non_paid(np_qs)
         # =======================
         #        CONGÉS
         # =======================
@@ -496,13 +448,7 @@ class LeaseCombinedListAPIView(APIView):
 
         # recherche (q)
         if q:
-            conge_qs = conge_qs.filter(
-                Q(contrat__association_user_moto__validated_user__user_unique_id__icontains=q) |
-                Q(contrat__association_user_moto__validated_user__nom__icontains=q) |
-                Q(contrat__association_user_moto__validated_user__prenom__icontains=q) |
-                Q(contrat__association_user_moto__moto_valide__moto_unique_id__icontains=q) |
-                Q(contrat__association_user_moto__moto_valide__vin__icontains=q)
-            )
+            conge_qs = conge_qs.filter(driver_search_q(q, "contrat__", search_ids))
 
         # ---- filtre "date concernée" (chevauchement) ----
         # règle DateField : un congé compte si [date_debut..date_fin] chevauche la fenêtre
@@ -517,7 +463,6 @@ class LeaseCombinedListAPIView(APIView):
                 conge_qs = conge_qs.filter(date_debut__lte=dc_before)
 
         # ⚠️ on ne filtre PAS par created pour les congés
-        conge_count = conge_qs.count()
 
         # =======================
         #      PÉNALITÉS
@@ -534,235 +479,65 @@ class LeaseCombinedListAPIView(APIView):
 
         # recherche (q)
         if q:
-            pen_count_qs = pen_count_qs.filter(
-                Q(contrat_chauffeur__association_user_moto__validated_user__user_unique_id__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__validated_user__nom__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__validated_user__prenom__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__moto_valide__moto_unique_id__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__moto_valide__vin__icontains=q)
-            )
+            pen_count_qs = pen_count_qs.filter(driver_search_q(q, "contrat_chauffeur__", search_ids))
 
-        # filtre "date concernée" = date du paiement manqué
-        if dc_eq:
-            pen_count_qs = pen_count_qs.filter(date_paiement_manquee=dc_eq)
-        else:
-            if dc_after and dc_before:
-                pen_count_qs = pen_count_qs.filter(date_paiement_manquee__range=(dc_after, dc_before))
-            elif dc_after:
-                pen_count_qs = pen_count_qs.filter(date_paiement_manquee__gte=dc_after)
-            elif dc_before:
-                pen_count_qs = pen_count_qs.filter(date_paiement_manquee__lte=dc_before)
+        # filtre "date concernée" = date du paiement manqué (mêmes règles que les non-payés,
+        # qui sont le sous-ensemble sans paiement de lease : voir combined_totals)
+        pen_count_qs = NonPaiementLeaseFilter(request.GET, queryset=pen_count_qs).qs
 
         # ⚠️ NE PAS filtrer par created ici
-        penalite_count = pen_count_qs.count()
-
-        # -------- META --------
-        meta = {
-            "totals": {
-                "paid": {"amount": total_paid, "count": count_paid},
-                "non_paid": {"amount": total_np, "count": count_np},
-                "conges": {"count": int(conge_count)},
-                "penalites": {"count": int(penalite_count)},
-            }
-        }
-
-        # -------- Sérialisation des listes --------
-        paid_data = LeasePaymentLiteSerializer(paid_qs, many=True).data
-        np_data = LeaseNonPayeLiteSerializer(np_qs, many=True).data
-
-        # -------- Filtre global 'statut' (sur les lignes) --------
-        if statut == "PAYE":
-            all_rows = list(paid_data)
-        elif statut == "NON_PAYE":
-            all_rows = list(np_data)
-        else:
-            all_rows = list(paid_data) + list(np_data)
-
-        # -------- Tri commun --------
-        def ts(item):
-            return _to_aware_utc(item.get("created") or item.get("date_concernee"))
 
-        all_rows.sort(key=ts, reverse=True)
+        # -------- META : tous les totaux en une requête (hors pagination), mis en cache par filtres --------
+        meta = {"totals": cached_combined_totals(
+            request.GET, lambda: combined_totals(paid_qs, pen_count_qs, conge_qs),
+        )}
+        if request.GET.get("meta_only") in ("1", "true"):
+            return Response({"meta": meta})
 
-        # -------- Pagination --------
+        # -------- Lignes : UNION ALL trié + paginé côté SQL (filtre 'statut' inclus) --------
         paginator = StandardResultsSetPagination()
-        page = paginator.paginate_queryset(all_rows, request, view=self)
-
-        response = paginator.get_paginated_response(page)
-        response.data["meta"] = meta
-        return response
 
+        # Mode curseur (?pagination=cursor ou ?cursor=...) : pages par clé (tri, source, id)
+        if request.GET.get("pagination") == "cursor" or "cursor" in request.GET:
+            rows, next_cursor, prev_cursor = combined_rows_page(
+                paid_qs, np_qs, statut, request.GET.get("cursor"), paginator.get_page_size(request),
+            )
+            url = request.build_absolute_uri()
+            return Response({
+                "next": replace_query_param(url, "cursor", next_cursor) if next_cursor else None,
+                "previous": replace_query_param(url, "cursor", prev_cursor) if prev_cursor else None,
+                "results": _serialize_combined_rows(rows),
+                "meta": meta,
+            })
 
+        rows_qs = combined_rows_queryset(paid_qs, np_qs, statut)
+        page = paginator.paginate_queryset(rows_qs, request, view=self)
 
+        response = paginator.get_paginated_response(_serialize_combined_rows(page))
+        response.data["meta"] = meta
+        return response
 
-def build_combined_queryset(request):
-    """
-    Applique les mêmes filtres que la vue combinée, fusionne PAYE + NON_PAYE,
-    trie (created desc), et calcule des agrégats globaux.
-    Retourne (rows, aggregates) — sans pagination.
-    """
-    q       = (request.GET.get("q") or "").strip()
-    statut  = (request.GET.get("statut") or "").upper().strip()  # "PAYE" | "NON_PAYE" | ''
-    paye_par = (request.GET.get("paye_par") or "").strip()
-    agence  = (request.GET.get("agence") or "").strip()
-
-    # ---------- PAYÉS ----------
-    paid_qs = (PaiementLease.objects
-               .select_related(
-                   "contrat_chauffeur",
-                   "contrat_chauffeur__association_user_moto",
-                   "contrat_chauffeur__association_user_moto__validated_user",
-                   "contrat_chauffeur__association_user_moto__moto_valide",
-                   "user_agence",
-                   "employe",
-               ))
-    paid_qs = PaiementLeaseFilter(request.GET, queryset=paid_qs).qs
-
-    if q:
-        paid_qs = paid_qs.filter(
-            Q(contrat_chauffeur__association_user_moto__validated_user__user_unique_id__icontains=q) |
-            Q(contrat_chauffeur__association_user_moto__validated_user__nom__icontains=q) |
-            Q(contrat_chauffeur__association_user_moto__validated_user__prenom__icontains=q) |
-            Q(contrat_chauffeur__association_user_moto__moto_valide__moto_unique_id__icontains=q) |
-            Q(contrat_chauffeur__association_user_moto__moto_valide__vin__icontains=q)
-        )
-    if paye_par := (request.GET.get("paye_par") or "").strip():
-        terms = [t.strip() for t in paye_par.split() if t.strip()]
-        q_paye_par = Q()
-        for term in terms:
-            q_paye_par |= (
-                    Q(employe__nom__icontains=term) |
-                    Q(employe__prenom__icontains=term) |
-                    Q(user_agence__nom__icontains=term) |
-                    Q(user_agence__prenom__icontains=term)
-            )
 
-        paid_qs = paid_qs.filter(q_paye_par)
-    if agence := (request.GET.get("agence") or "").strip():
-        # 👉 si l'UI envoie "direction" (ou "dir"), on filtre sur agences IS NULL
-        if agence.lower() in {"direction", "dir"}:
-            paid_qs = paid_qs.filter(agences__isnull=True)
-        else:
-            # filtre texte normal sur le nom d'agence
-            terms = [t.strip() for t in agence.split() if t.strip()]
-            q_agence = Q()
-            for term in terms:
-                q_agence |= Q(agences__nom_agence__icontains=term)
-            paid_qs = paid_qs.filter(q_agence)
 
-    paid_ser = LeasePaymentLiteSerializer(paid_qs, many=True)
-    paid_rows = [dict(x) for x in paid_ser.data]
-
-    # ---------- NON PAYÉS ----------
-    np_qs_base = (Penalite.objects
-             .select_related(
-                 "contrat_chauffeur",
-                 "contrat_chauffeur__association_user_moto",
-                 "contrat_chauffeur__association_user_moto__validated_user",
-                 "contrat_chauffeur__association_user_moto__moto_valide",
-                 "contrat_chauffeur__contrat_batt",
-             )
-             .filter(
-                statut_penalite__in=[StatutPenalite.NON_PAYE, StatutPenalite.PAYE, StatutPenalite.PARTIELLEMENT_PAYE],
-             ))
-    np_qs_base = NonPaiementLeaseFilter(request.GET, queryset=np_qs_base).qs
-    # ✅ Anti-join : exclure les pénalités pour lesquelles un paiement de LEASE existe
-    np_qs = np_qs_base.annotate(
-        lease_paid=Exists(
-            PaiementLease.objects.filter(
-                contrat_chauffeur=OuterRef("contrat_chauffeur_id"),
-                date_concernee=OuterRef("date_paiement_manquee"),
-            )
-        )
-    ).filter(lease_paid=False)
-
-    if q:
-        np_qs = np_qs.filter(
-            Q(contrat_chauffeur__association_user_moto__validated_user__user_unique_id__icontains=q) |
-            Q(contrat_chauffeur__association_user_moto__validated_user__nom__icontains=q) |
-            Q(contrat_chauffeur__association_user_moto__validated_user__prenom__icontains=q) |
-            Q(contrat_chauffeur__association_user_moto__moto_valide__moto_unique_id__icontains=q) |
-            Q(contrat_chauffeur__association_user_moto__moto_valide__vin__icontains=q)
-        )
 
-    np_ser = LeaseNonPayeLiteSerializer(np_qs, many=True)
-    np_rows = [dict(x) for x in np_ser.data]
-
-    # ---------- Fusion par "statut" demandé ----------
-    if statut == "PAYE":
-        all_rows = paid_rows
-    elif statut == "NON_PAYE":
-        all_rows = np_rows
-    else:
-        all_rows = paid_rows + np_rows
-
-    # ---------- Tri commun ----------
-    all_rows.sort(key=_sort_key, reverse=True)
-
-    # ---------- Agrégats globaux ----------
-    from decimal import Decimal
-    paid_amount = Decimal("0")
-    paid_count  = 0
-    np_amount   = Decimal("0")
-    np_count    = 0
-
-    for r in all_rows:
-        st = (r.get("statut_paiement") or "").upper()
-        total = Decimal(str(r.get("montant_total") or 0))
-        if st == "PAYE":
-            paid_amount += total
-            paid_count  += 1
-        elif st == "NON_PAYE":
-            np_amount += total
-            np_count  += 1
-
-    aggregates = {
-        "paid": {
-            "count": int(paid_count),
-            "amount": float(paid_amount),
-        },
-        "non_paid": {
-            "count": int(np_count),
-            "amount": float(np_amount),
-        }
-    }
-
-    return all_rows, aggregates
-
-from django.http.response import HttpResponse
+from django.http.response import FileResponse, HttpResponse, StreamingHttpResponse
 # --- CSV ---
 class LeaseCombinedExportCSV(APIView):
+    """
+    Export CSV du flux combiné, en streaming : les lignes sont lues par
+    paquets et envoyées au fur et à mesure (mémoire bornée, premier octet
+    immédiat) au lieu de construire tout le fichier dans la réponse.
+    """
 
     permission_classes = [IsAuthenticated]
-
+    chunk_size = 500
 
     def get(self, request, *args, **kwargs):
-        # ⬇️ dépaqueter (lignes, agrégats)
-        rows, _ = build_combined_queryset(request)  # rows = liste de dict "lite"
+        rows = iter_combined_rows(request.GET, chunk_size=self.chunk_size)
 
         filename = f"leases_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response = StreamingHttpResponse(csv_lines(rows, self.chunk_size), content_type='text/csv; charset=utf-8')
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-        fieldnames = [
-            "id","chauffeur","moto_unique_id","moto_vin",
-            "montant_moto","montant_batt","montant_total",
-            "date_concernee","date_limite","methode_paiement",
-            "agences","agences",
-            "paye_par","created","source"
-        ]
-        writer = csv.DictWriter(response, fieldnames=fieldnames)
-        writer.writeheader()
-
-        # sécurisation douce
-        for r in (rows or []):
-            if not isinstance(r, dict):
-                try:
-                    r = dict(r)
-                except Exception:
-                    continue
-            writer.writerow({k: r.get(k, "") for k in fieldnames})
-
         return response
 
 
@@ -771,89 +546,25 @@ class LeaseCombinedExportCSV(APIView):
 
 
 class LeaseCombinedExportXLSX(APIView):
+    """
+    Export XLSX du flux combiné (classeur write-only, voir exports.write_xlsx),
+    assemblé dans un fichier temporaire puis renvoyé en streaming.
+    """
     permission_classes = [IsAuthenticated]
 
-
     def get(self, request, *args, **kwargs):
-        # ⬇️ dépaqueter
-        rows, _ = build_combined_queryset(request)
-
         filename = f"leases_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Leases"
-
-        headers = [
-            "Chauffeur","Moto (ID)","VIN",
-            "Payé par","Agence","Date concernée","Date paiement" ,
-            "Montant moto","Montant batt.","Montant total","Statut"
-        ]
-        ws.append(headers)
-
-        def getv(d, key, default=""):
-            if isinstance(d, dict):
-                return d.get(key, default)
-            try:
-                return dict(d).get(key, default)
-            except Exception:
-                return default
-
-        for r in (rows or []):
-            ws.append([
-                getv(r, "chauffeur"),
-                getv(r, "moto_unique_id"),
-                getv(r, "moto_vin"),
-                getv(r, "paye_par"),
-                getv(r, "agences"),
-                getv(r, "date_concernee"),
-                getv(r, "created"),
-                getv(r, "montant_moto"),
-                getv(r, "montant_batt"),
-                getv(r, "montant_total"),
-                getv(r, "source"),
-            ])
 
-        resp = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        # fichier temporaire fermé (et supprimé) par FileResponse en fin d'envoi
+        tmp = tempfile.TemporaryFile()
+        write_xlsx(request.GET, tmp)
+        tmp.seek(0)
+        return FileResponse(
+            tmp, as_attachment=True, filename=filename,
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         )
-        resp['Content-Disposition'] = f'attachment; filename="{filename}"'
-        wb.save(resp)
-        return resp
 
 
-def _fmt_fcfa(n):
-    try:
-        d = Decimal(str(n or 0))
-    except Exception:
-        d = Decimal("0")
-    s = f"{d:,.2f}".replace(",", " ").replace(".00", "")
-    return f"{s} FCFA"
-
-def _fmt_date(d):
-    if not d:
-        return ""
-    # accepte déjà date ou datetime
-    from datetime import date, datetime
-    if isinstance(d, datetime):
-        d = d.date()
-    if isinstance(d, date):
-        return d.strftime("%d/%m/%Y")
-    # tolère une chaîne ISO YYYY-MM-DD
-    try:
-        return datetime.fromisoformat(str(d)).date().strftime("%d/%m/%Y")
-    except Exception:
-        return str(d)
-
-# --- nouveaux helpers filtres "date concernée" ---
-def _parse_iso_date(s: str | None) -> date | None:
-    s = (s or "").strip()
-    if not s:
-        return None
-    try:
-        return datetime.fromisoformat(s).date()
-    except Exception:
-        return None
-
 def _day_bounds(d: date):
     """Bornes timezone-aware [d 00:00:00 .. d 23:59:59.999999] dans le TZ courant."""
     tz = timezone.get_current_timezone()
@@ -867,149 +578,82 @@ class LeaseCombinedExportDOCX(APIView):
 
 
     def get(self, request, *args, **kwargs):
-        # 1) Même fusion payés/non-payés que la liste (avec ses filtres backend)
-        rows, _aggs = build_combined_queryset(request)
-
-        paid_rows, non_paid_rows = [], []
-        for r in rows or []:
-            row = {
-                "chauffeur":      r.get("chauffeur") or "",
-                "montant_moto":   _fmt_fcfa(r.get("montant_moto")),
-                "montant_batt":   _fmt_fcfa(r.get("montant_batt")),
-                "montant_total":  _fmt_fcfa(r.get("montant_total")),
-            }
-            if (r.get("source") or "").upper() == "PAYE":
-                paid_rows.append(row)
-            else:
-                non_paid_rows.append(row)
+        buf = BytesIO()
+        write_docx(request.GET, buf)
 
-        # 2) Filtres communs à conges/penalites : recherche + date_concernee (uniquement)
-        q = (request.GET.get("q") or "").strip()
-        dc_eq     = _parse_iso_date(request.GET.get("date_concernee"))
-        dc_after  = _parse_iso_date(request.GET.get("date_concernee_after"))
-        dc_before = _parse_iso_date(request.GET.get("date_concernee_before"))
-
-        # -----------------------
-        #        PÉNALITÉS
-        # -----------------------
-        pens = (Penalite.objects
-                .select_related(
-                    "contrat_chauffeur",
-                    "contrat_chauffeur__association_user_moto",
-                    "contrat_chauffeur__association_user_moto__validated_user",
-                )
-                .exclude(statut_penalite=StatutPenalite.ANNULEE)
-                )
-        if q:
-            pens = pens.filter(
-                Q(contrat_chauffeur__association_user_moto__validated_user__user_unique_id__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__validated_user__nom__icontains=q) |
-                Q(contrat_chauffeur__association_user_moto__validated_user__prenom__icontains=q)
-            )
+        filename = f"leases_{timezone.localtime().strftime('%Y%m%d_%H%M%S')}.docx"
+        resp = HttpResponse(
+            buf.getvalue(),
+            content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
+        resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return resp
 
-        # date_concernee pour pénalités = date_paiement_manquee (DateField)
-        if dc_eq:
-            pens = pens.filter(date_paiement_manquee=dc_eq)
-        else:
-            if dc_after and dc_before:
-                pens = pens.filter(date_paiement_manquee__range=(dc_after, dc_before))
-            elif dc_after:
-                pens = pens.filter(date_paiement_manquee__gte=dc_after)
-            elif dc_before:
-                pens = pens.filter(date_paiement_manquee__lte=dc_before)
-
-        penalites = []
-        for p in pens:
-            vu = getattr(getattr(p.contrat_chauffeur, "association_user_moto", None), "validated_user", None)
-            nom = " ".join(filter(None, [getattr(vu, "nom", ""), getattr(vu, "prenom", "")])).strip() if vu else ""
-            penalites.append({
-                "chauffeur": nom,
-                "montant":   _fmt_fcfa(p.montant_penalite),
-                "statut":    p.get_statut_penalite_display() if hasattr(p, "get_statut_penalite_display") else p.statut_penalite,
-            })
 
-        # -----------------------
-        #          CONGÉS
-        # -----------------------
-        conges_qs = (
-            Conge.objects
-            .select_related(
-                "contrat",
-                "contrat__association_user_moto",
-                "contrat__association_user_moto__validated_user",
-            )
+# --- Exports asynchrones ---
+class LeaseCombinedExportJobAPIView(APIView):
+    """
+    POST : lance un export du flux combiné en tâche de fond.
+    Corps : {"format": "csv" | "xlsx" | "docx", "filtres": {...}} ; sans
+    "filtres", les paramètres de l'URL (mêmes filtres que les exports directs).
+    Une demande identique récente renvoie le job existant (200) au lieu d'en
+    créer un nouveau (202).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        fmt = (request.data.get("format") or "").lower().strip()
+        filtres = request.data.get("filtres")
+        if filtres is not None and not isinstance(filtres, dict):
+            return Response({"detail": "'filtres' doit être un objet."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            job, created = submit_export(fmt, filtres if filtres is not None else request.query_params, request.user)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            ExportJobSerializer(job, context={"request": request}).data,
+            status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
         )
 
-        if q:
-            conges_qs = conges_qs.filter(
-                Q(contrat__association_user_moto__validated_user__user_unique_id__icontains=q) |
-                Q(contrat__association_user_moto__validated_user__nom__icontains=q) |
-                Q(contrat__association_user_moto__validated_user__prenom__icontains=q)
-            )
 
-        # Filtre "date concernée" = chevauchement sur [date_debut .. date_fin] (DateField)
-        if dc_eq:
-            conges_qs = conges_qs.filter(date_debut__lte=dc_eq, date_fin__gte=dc_eq)
-        else:
-            if dc_after and dc_before:
-                conges_qs = conges_qs.filter(date_fin__gte=dc_after, date_debut__lte=dc_before)
-            elif dc_after:
-                conges_qs = conges_qs.filter(date_fin__gte=dc_after)
-            elif dc_before:
-                conges_qs = conges_qs.filter(date_debut__lte=dc_before)
-
-        # Construction des lignes
-        conges = []
-        for c in conges_qs:
-            vu = getattr(getattr(c.contrat, "association_user_moto", None), "validated_user", None)
-            nom = " ".join(filter(None, [getattr(vu, "nom", ""), getattr(vu, "prenom", "")])).strip() if vu else ""
-            # nb_jour si inexistant → calcule (fin - debut + 1)
-            nb_jour = getattr(c, "nb_jour", None)
-            if nb_jour is None and c.date_debut and c.date_fin:
-                nb_jour = (c.date_fin - c.date_debut).days + 1
-            conges.append({
-                "chauffeur": nom,
-                "debut": _fmt_date(c.date_debut),  # accepte maintenant des dates
-                "fin": _fmt_date(c.date_fin),
-                "reprise": _fmt_date(getattr(c, "date_reprise", None)),  # si tu l’as
-                "jours": int(nb_jour or 0),
-            })
+def _export_job_for(request, job_id):
+    """ExportJob `job_id` s'il a été demandé par l'utilisateur courant (ou pour le staff), sinon None."""
+    jobs = ExportJob.objects.filter(job_id=job_id)
+    if not request.user.is_staff:
+        jobs = jobs.filter(demande_par=request.user)
+    return jobs.first()
 
-        # 3) Titre
-        if dc_eq:
-            report_title = f"RECAPITULATIF DU {dc_eq.strftime('%d/%m/%Y')}"
-        elif dc_after and dc_before:
-            report_title = f"RECAPITULATIF DU {dc_after.strftime('%d/%m/%Y')} AU {dc_before.strftime('%d/%m/%Y')}"
-        elif dc_after:
-            report_title = f"RECAPITULATIF À PARTIR DU {dc_after.strftime('%d/%m/%Y')}"
-        elif dc_before:
-            report_title = f"RECAPITULATIF JUSQU'AU {dc_before.strftime('%d/%m/%Y')}"
-        else:
-            report_title = f"RECAPITULATIF DU {timezone.localdate().strftime('%d/%m/%Y')}"
-
-        # 4) Rendu du .docx (assure-toi que 'rapport-leases.docx' existe bien)
-        tpl_path = settings.BASE_DIR / "templates" / "rapport-leases.docx"
-        doc = DocxTemplate(str(tpl_path))
-        context = {
-            "report_title":  report_title,
-            "paid_rows":     paid_rows,
-            "non_paid_rows": non_paid_rows,
-            "penalites":     penalites,
-            "conges":        conges,
-        }
-        doc.render(context)
 
-        buf = BytesIO()
-        doc.save(buf)
-        buf.seek(0)
+class LeaseCombinedExportJobStatusAPIView(APIView):
+    """
+    GET : avancement d'un export (lignes traitées) et lien de téléchargement une fois terminé.
+    Réservé au demandeur de l'export et au staff.
+    """
+    permission_classes = [IsAuthenticated]
 
-        filename = f"leases_{timezone.localtime().strftime('%Y%m%d_%H%M%S')}.docx"
-        resp = HttpResponse(
-            buf.getvalue(),
-            content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    def get(self, request, job_id, *args, **kwargs):
+        job = _export_job_for(request, job_id)
+        if job is None:
+            return Response({"detail": "Export introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ExportJobSerializer(job, context={"request": request}).data)
+
+
+class LeaseCombinedExportJobFileAPIView(APIView):
+    """GET : fichier d'un export terminé, réservé au demandeur de l'export et au staff."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = _export_job_for(request, job_id)
+        if job is None or job.statut != StatutExport.TERMINE or not job.fichier:
+            return Response({"detail": "Export introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            job.fichier.open("rb"),
+            as_attachment=True,
+            filename=os.path.basename(job.fichier.name),
+            content_type=EXPORT_FORMATS[job.format][1],
         )
-        resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-        return resp
 
 
 class CalendrierPaiementsAPIView(APIView):
@@ -1019,6 +663,8 @@ class CalendrierPaiementsAPIView(APIView):
     - Liste paginée de tous les chauffeurs avec résumé de leurs paiements et congés.
     - Inclut `paiements_par_jour` pour les jours où il y a eu >= 2 paiements.
     - Les congés sont calculés entre la première et la dernière date de paiement.
+    - `conges_approuves` : jours couverts par un congé approuvé.
+    - Lu sur la projection CalendrierPaiementMois (une requête pour la page).
     """
 
     def get(self, request, *args, **kwargs):
@@ -1031,80 +677,25 @@ class CalendrierPaiementsAPIView(APIView):
         )
 
         if search:
-            contrats = contrats.filter(
-                Q(association_user_moto__validated_user__nom__icontains=search)
-                | Q(association_user_moto__validated_user__prenom__icontains=search)
-                | Q(association_user_moto__validated_user__user_unique_id__icontains=search)
-            )
+            contrats = contrats.filter(driver_search_q(search))
 
         paginator = StandardResultsSetPagination()
         contrats_page = paginator.paginate_queryset(contrats, request, view=self)
 
-        results = []
+        # 🟢 Paiements et congés de la page, déjà agrégés par mois
+        calendriers = calendar_summaries([c.id for c in contrats_page])
 
+        results = []
         for contrat in contrats_page:
             chauffeur = getattr(contrat.association_user_moto, "validated_user", None)
             if not chauffeur:
                 continue
 
-            # =============================
-            # 🟢 Paiements
-            # =============================
-            paiements_qs = (
-                PaiementLease.objects
-                .filter(contrat_chauffeur=contrat)
-                .exclude(created__isnull=True)
-                .values_list("created", flat=True)
-            )
-
-            paiement_dates = [p.date() for p in paiements_qs if p]
-            if not paiement_dates:
-                # Aucun paiement → rien à calculer
+            calendrier = calendriers.get(contrat.id)
+            if calendrier is None:
+                # Aucun paiement → rien à afficher
                 continue
 
-            # Compte les paiements par jour
-            count_by_date = Counter(paiement_dates)
-            jours_payes = sorted(count_by_date.keys())
-            jours_payes_set = set(jours_payes)
-
-            # 🔸 Jours avec >= 2 paiements
-            paiements_par_jour = {
-                d.strftime("%Y-%m-%d"): c
-                for d, c in count_by_date.items()
-                if c >= 2
-            }
-
-            # =============================
-            # 🔵 Calcul des congés
-            # =============================
-            date_debut = min(jours_payes)
-            date_fin = max(jours_payes)
-
-            jours_total = []
-            current = date_debut
-            while current <= date_fin:
-                jours_total.append(current)
-                current += timedelta(days=1)
-
-            jours_manques = [
-                j.strftime("%Y-%m-%d")
-                for j in jours_total
-                if j not in jours_payes_set and j.weekday() != 6
-            ]
-
-            jours_payes_iso = [j.strftime("%Y-%m-%d") for j in jours_payes]
-
-            # =============================
-            # 📊 Résumé
-            # =============================
-            total_jours = len([j for j in jours_total if j.weekday() != 6])
-            total_payes = len(jours_payes_iso)
-            total_conges = len(jours_manques)
-            total_paiements = sum(count_by_date.values())
-
-            # =============================
-            # 🧩 Bloc final
-            # =============================
             results.append({
                 "contrat": {
                     "id": contrat.id,
@@ -1112,18 +703,7 @@ class CalendrierPaiementsAPIView(APIView):
                     "prenom_chauffeur": getattr(chauffeur, "prenom", ""),
                     "user_unique_id": getattr(chauffeur, "user_unique_id", ""),
                 },
-                "paiements": jours_payes_iso,
-                "conges": jours_manques,
-                "paiements_par_jour": paiements_par_jour,  # ✅ doublons uniquement
-                "resume": {
-                    "total_jours": total_jours,
-                    "jours_payes": total_payes,
-                    "jours_conges": total_conges,
-                    "total_paiements": total_paiements,
-                }
+                **calendrier,
             })
 
         return paginator.get_paginated_response(results)
-
-
-
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+def _invalidate_penalty_rules(sender, **kwargs):
+    from .services import invalidate_penalty_rules
+    invalidate_penalty_rules()
 
 
 class PenaliteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'penalite'
+
+    def ready(self):
+        # Cache des règles du moteur (penalite.services) vidé à chaque modification
+        post_save.connect(_invalidate_penalty_rules, sender="penalite.ReglePenalite")
+        post_delete.connect(_invalidate_penalty_rules, sender="penalite.ReglePenalite")
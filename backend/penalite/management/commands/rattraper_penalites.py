@@ -0,0 +1,50 @@
+# penalite/management/commands/rattraper_penalites.py
+from django.core.management import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from penalite.services import backfill_penalties
+
+
+class Command(BaseCommand):
+    help = (
+        "Rattrape les pénalités légères manquantes sur une plage de dates "
+        "(hors fenêtre de 12h), en un passage ensembliste par tranche de contrats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("debut", help="Premier jour 'YYYY-MM-DD'")
+        parser.add_argument("fin", help="Dernier jour 'YYYY-MM-DD' (borné à la veille échue)")
+        parser.add_argument("--contrat", type=int, action="append", dest="contrats",
+                            help="Id de contrat (option répétable) ; défaut : tous les contrats en cours")
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument("--pause", type=float, default=0.0,
+                            help="Pause en secondes entre deux tranches")
+        parser.add_argument("--lecture-seule", action="store_true",
+                            help="Calcule le rattrapage sans rien écrire")
+
+    def handle(self, *args, **opts):
+        debut, fin = parse_date(opts["debut"]), parse_date(opts["fin"])
+        if not debut or not fin or debut > fin:
+            raise CommandError("Plage invalide : 'YYYY-MM-DD' attendu, début <= fin.")
+
+        def progress(done, total, counters):
+            self.stdout.write(f"  … {done}/{total} contrat(s), {counters['created']} pénalité(s)")
+
+        res = backfill_penalties(
+            debut, fin, contrat_ids=opts["contrats"], chunk_size=opts["chunk_size"],
+            throttle=opts["pause"], write=not opts["lecture_seule"], progress=progress,
+        )
+
+        # (1) Résumé
+        action = "à créer" if opts["lecture_seule"] else "créée(s)"
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rattrapage {res['start']} → {res['end']} : {res['created']} pénalité(s) {action} "
+            f"sur {res['contrats']} contrat(s), {res['swaps_blocked']} swap(s) bloqué(s)"
+        ))
+        self.stdout.write(
+            f"  payés {res['paid_skipped']}, congés {res['leave_skipped']}, déjà présentes {res['unchanged']}"
+        )
+
+        # (2) Détail par jour
+        for jour, n in res["par_jour"].items():
+            self.stdout.write(f"  {jour.isoformat()}  {n}")
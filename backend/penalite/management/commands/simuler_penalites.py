@@ -0,0 +1,71 @@
+# penalite/management/commands/simuler_penalites.py
+from time import perf_counter
+
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from penalite.services import MODES, simulate_penalties
+
+
+class Command(BaseCommand):
+    help = (
+        "Simule un passage du moteur de pénalités (fenêtre + instant de référence) "
+        "sans rien écrire : compteurs, pénalités concernées, durées et requêtes par phase."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fenetre", choices=["noon", "fourteen"])
+        parser.add_argument("--reference", help="Instant de référence 'YYYY-MM-DD HH:MM' (défaut : maintenant)")
+        parser.add_argument("--mode", choices=MODES, default="set")
+        parser.add_argument("--lecture-seule", action="store_true",
+                            help="Aucune écriture (au lieu d'une transaction annulée), mode 'set' uniquement")
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument("--details", type=int, default=20,
+                            help="Nombre de pénalités listées (0 pour aucune)")
+
+    def handle(self, *args, **opts):
+        now = None
+        if opts["reference"]:
+            now = parse_datetime(opts["reference"])
+            if now is None:
+                raise CommandError("--reference invalide, format attendu 'YYYY-MM-DD HH:MM'.")
+            if timezone.is_naive(now):
+                now = timezone.make_aware(now, timezone.get_current_timezone())
+
+        started = perf_counter()
+        try:
+            report = simulate_penalties(
+                opts["fenetre"], now=now, mode=opts["mode"],
+                read_only=opts["lecture_seule"], chunk_size=opts["chunk_size"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        total = perf_counter() - started
+
+        # (1) Compteurs
+        res = report["result"]
+        self.stdout.write(self.style.SUCCESS(
+            f"🧪 Simulation {res['window']} ({'lecture seule' if opts['lecture_seule'] else 'transaction annulée'}, "
+            f"mode {opts['mode']}) — aucune donnée conservée"
+        ))
+        for k, v in res.items():
+            if k != "window":
+                self.stdout.write(f"  {k:<14} {v}")
+
+        # (2) Phases
+        self.stdout.write("⏱️  Phases :")
+        for phase, stats in report["phases"].items():
+            self.stdout.write(f"  {phase:<8} {stats['secondes']:>9.4f} s  {stats['requetes']:>6} requête(s)")
+        self.stdout.write(f"  {'total':<8} {total:>9.4f} s")
+
+        # (3) Pénalités concernées
+        limit = opts["details"]
+        if limit:
+            for contrat_id, jour in report["created"][:limit]:
+                self.stdout.write(f"  + légère   contrat {contrat_id} jour {jour.isoformat()}")
+            for penalite_id, contrat_id in report["escalated"][:limit]:
+                self.stdout.write(f"  ↑ grave    pénalité {penalite_id} contrat {contrat_id}")
+            hidden = max(len(report["created"]) - limit, 0) + max(len(report["escalated"]) - limit, 0)
+            if hidden:
+                self.stdout.write(f"  … {hidden} autre(s)")
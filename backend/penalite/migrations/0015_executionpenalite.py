@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:18
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('penalite', '0014_penalite_penalite_contrat_8bdb0e_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecutionPenalite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('run_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('fenetre', models.CharField(max_length=20)),
+                ('jour_reference', models.DateField()),
+                ('dernier_contrat_id', models.BigIntegerField(default=0)),
+                ('statut', models.CharField(choices=[('en_cours', 'En cours'), ('terminee', 'Terminée'), ('echouee', 'Échouée')], default='en_cours', max_length=20)),
+                ('compteurs', models.JSONField(blank=True, default=dict)),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'penalite_execution',
+                'ordering': ('-created',),
+                'indexes': [models.Index(fields=['fenetre', 'jour_reference', 'statut'], name='penalite_ex_fenetre_40be01_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('penalite', '0015_executionpenalite'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='executionpenalite',
+            name='penalite_ex_fenetre_40be01_idx',
+        ),
+        migrations.AddField(
+            model_name='executionpenalite',
+            name='shard_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='executionpenalite',
+            name='shard_index',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='executionpenalite',
+            index=models.Index(fields=['fenetre', 'jour_reference', 'shard_index', 'statut'], name='penalite_ex_fenetre_f238f1_idx'),
+        ),
+    ]
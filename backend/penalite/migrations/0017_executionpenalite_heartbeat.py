@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('penalite', '0016_executionpenalite_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='executionpenalite',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db.models.query_utils import Q
 from django.utils.translation import gettext_lazy as _
 
@@ -116,4 +118,44 @@ class PaiementPenalite(TimeStampedModel):
         db_table = "paiement_penalite"
 
     def __str__(self):
-        return self.reference
\ No newline at end of file
+        return self.reference
+
+
+
+class StatutExecution(models.TextChoices):
+    EN_COURS = "en_cours", _("En cours")
+    TERMINEE = "terminee", _("Terminée")
+    ECHOUEE = "echouee", _("Échouée")
+
+
+class ExecutionPenalite(TimeStampedModel):
+    """
+    Point de reprise d'un passage du moteur de pénalités (fenêtre midi / 14h).
+    Les contrats sont traités par tranches croissantes d'id : dernier_contrat_id
+    permet de reprendre un passage interrompu là où il s'est arrêté.
+    En exécution parallèle, chaque shard (id % shard_count == shard_index)
+    a son propre point de reprise.
+    `heartbeat` est renouvelé à chaque tranche : un passage EN_COURS n'est
+    repris par un autre worker qu'une fois ce bail expiré.
+    """
+    run_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    fenetre = models.CharField(max_length=20)
+    jour_reference = models.DateField()
+    dernier_contrat_id = models.BigIntegerField(default=0)
+    shard_index = models.PositiveIntegerField(default=0)
+    shard_count = models.PositiveIntegerField(default=1)
+    statut = models.CharField(max_length=20, choices=StatutExecution.choices, default=StatutExecution.EN_COURS)
+    compteurs = models.JSONField(default=dict, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    date_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "penalite_execution"
+        ordering = ("-created",)
+        indexes = [
+            models.Index(fields=["fenetre", "jour_reference", "shard_index", "statut"]),
+        ]
+
+    def __str__(self):
+        shard = f" shard {self.shard_index}/{self.shard_count}" if self.shard_count > 1 else ""
+        return f"Execution {self.fenetre} du {self.jour_reference}{shard} ({self.statut})"
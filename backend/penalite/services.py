@@ -197,14 +197,23 @@
 
 # penalite/services.py
 
-from django.db import transaction
+from contextlib import contextmanager
+from decimal import Decimal
+from time import perf_counter, sleep
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, DecimalField, F, Value, When
+from django.db.models.functions import Concat, Greatest, Left, Length, Mod
+from django.db.models.lookups import LessThanOrEqual
 from django.utils import timezone
 from datetime import date, datetime, time, timedelta
 
-from conge.models import Conge, StatutConge
+from app_legacy.services import SwapStateBatch
+from conge.services import LeaveCoverage
 from contrat_chauffeur.models import ContratChauffeur, StatutContrat
-from paiement_lease.models import PaiementLease
-from .models import Penalite, TypePenalite, StatutPenalite
+from paiement_lease.services import PaidDayIndex, invalidate_combined_totals, invalidate_daily_reports
+from .models import Penalite, TypePenalite, StatutPenalite, ExecutionPenalite, StatutExecution, ReglePenalite
 
 import logging
 logger = logging.getLogger(__name__)
@@ -212,6 +221,70 @@ logger = logging.getLogger(__name__)
 PENALITE_LEGERE = 2000
 PENALITE_GRAVE  = 5000
 
+# "set"  : traitement ensembliste (quelques requêtes SQL par tranche)
+# "row"  : ancien parcours contrat par contrat, jour par jour
+MODES = ("set", "row")
+
+# Nombre de contrats traités par transaction (verrous courts)
+CHUNK_SIZE = getattr(settings, "PENALITE_CHUNK_SIZE", 200)
+
+# Jours rattrapés par la fenêtre "midi" (0 = depuis date_concernee, sans limite)
+NOON_DAYS = getattr(settings, "PENALITE_NOON_JOURS", 1)
+
+# Seules les légères encore dues passent en grave
+STATUTS_ESCALADABLES = (StatutPenalite.NON_PAYE, StatutPenalite.PARTIELLEMENT_PAYE)
+
+# Longueur de Penalite.description (la note d'escalade y est ajoutée)
+DESCRIPTION_MAX = Penalite._meta.get_field("description").max_length
+
+# Bail d'un passage EN_COURS : sans nouvelle tranche pendant ce délai, il est considéré interrompu
+LEASE_SECONDS = getattr(settings, "PENALITE_BAIL_SECONDES", 600)
+
+COUNTER_KEYS = ("created", "escalated", "unchanged", "paid_skipped", "leave_skipped")
+
+# Colonnes de contrat lues par la fenêtre "midi" et le rattrapage
+CONTRAT_FIELDS = ("pk", "date_concernee", "date_limite", "association_user_moto_id",
+                  "montant_par_paiement", "regle_penalite_id", "contrat_batt_id")
+
+# "rollback" : passage complet dans une transaction annulée à la fin
+# "read"     : lecture seule, aucune écriture (mode "set" uniquement)
+SIMULATIONS = ("rollback", "read")
+
+
+class RunProfile:
+    """
+    Chronométrage d'un passage du moteur par phase (scan des contrats, congés,
+    paiements, écritures) : durée cumulée et nombre de requêtes SQL, comptées
+    via connection.execute_wrapper (indépendant de DEBUG).
+
+    Avec `record=True`, les pénalités qui seraient créées (contrat, jour) ou
+    escaladées (pénalité, contrat) sont conservées pour la simulation.
+    """
+    PHASES = ("scan", "leave", "payment", "writes")
+
+    def __init__(self, record: bool = False):
+        self.record = record
+        self.timings = dict.fromkeys(self.PHASES, 0.0)
+        self.queries = dict.fromkeys(self.PHASES, 0)
+        self.created: list[tuple[int, date]] = []
+        self.escalated: list[tuple[int, int]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        def count(execute, sql, params, many, context):
+            self.queries[name] += 1
+            return execute(sql, params, many, context)
+
+        started = perf_counter()
+        try:
+            with connection.execute_wrapper(count):
+                yield
+        finally:
+            self.timings[name] += perf_counter() - started
+
+    def as_dict(self) -> dict:
+        return {p: {"secondes": round(self.timings[p], 4), "requetes": self.queries[p]} for p in self.PHASES}
+
 
 def is_sunday(d) -> bool:
     """True si la date (date ou datetime) est un dimanche."""
@@ -219,189 +292,790 @@ def is_sunday(d) -> bool:
     wk = d.weekday() if isinstance(d, datetime) else d.weekday()
     return wk == 6
 
-def _deadline_noon_from_jour(jour: date):
-    tz = timezone.get_current_timezone()
-    return timezone.make_aware(datetime.combine(jour + timedelta(days=1), time(hour=12)), tz)
+
+def _fmt_heure(t: time) -> str:
+    return f"{t.hour}h{t.minute:02d}" if t.minute else f"{t.hour}h"
+
+
+class PenaltyRule:
+    """
+    Règle de pénalité résolue : heures limites (heure_min pour la légère,
+    heure_max pour l'escalade en grave, à J+1) et montants moto / batterie.
+    Les champs non renseignés d'une ReglePenalite reprennent les valeurs
+    par défaut (12h, 14h, PENALITE_LEGERE, PENALITE_GRAVE pour la part moto,
+    0 pour la part batterie), composante par composante.
+    """
+
+    def __init__(self, pk: int | None = None, heure_legere: time | None = None, heure_grave: time | None = None,
+                 leger_moto=0, leger_batt=0, grave_moto=0, grave_batt=0):
+        self.pk = pk
+        self.heure_legere = heure_legere or time(hour=12)
+        self.heure_grave = heure_grave or time(hour=14)
+        # montant moto non renseigné (0) : défaut, même si la part batterie est fixée ;
+        # sans quoi un contrat sans batterie aurait une pénalité à 0 FCFA
+        leger_moto = leger_moto or PENALITE_LEGERE
+        grave_moto = grave_moto or PENALITE_GRAVE
+        self.leger_moto, self.leger_batt = Decimal(leger_moto), Decimal(leger_batt)
+        self.grave_moto, self.grave_batt = Decimal(grave_moto), Decimal(grave_batt)
+
+    @classmethod
+    def from_regle(cls, regle: ReglePenalite) -> "PenaltyRule":
+        return cls(regle.pk, regle.heure_min, regle.heure_max,
+                   regle.montant_leger_moto, regle.montant_leger_batt,
+                   regle.montant_grave_moto, regle.montant_grave_batt)
+
+    def _at(self, jour: date, heure: time) -> datetime:
+        tz = timezone.get_current_timezone()
+        return timezone.make_aware(datetime.combine(jour + timedelta(days=1), heure), tz)
+
+    def deadline(self, jour: date) -> datetime:
+        """Limite de paiement du jour J (J+1 à heure_min)."""
+        return self._at(jour, self.heure_legere)
+
+    def late_deadline(self, jour: date) -> datetime:
+        """Limite avant escalade en grave (J+1 à heure_max)."""
+        return self._at(jour, self.heure_grave)
+
+    def montant_legere(self, avec_batterie: bool) -> Decimal:
+        return self.leger_moto + (self.leger_batt if avec_batterie else 0)
+
+    def montant_grave(self, avec_batterie: bool) -> Decimal:
+        return self.grave_moto + (self.grave_batt if avec_batterie else 0)
+
+
+_DEFAULT_RULE = PenaltyRule()
+
+# Cache des règles du processus : {id ReglePenalite: PenaltyRule}, rechargé à
+# chaque passage et vidé à l'enregistrement d'une règle (voir penalite.apps)
+_RULES: dict[int, PenaltyRule] | None = None
+
+
+def load_penalty_rules() -> dict[int, PenaltyRule]:
+    """Charge toutes les règles en une requête et remplace le cache."""
+    global _RULES
+    _RULES = {r.pk: PenaltyRule.from_regle(r) for r in ReglePenalite.objects.all()}
+    return _RULES
+
+
+def invalidate_penalty_rules() -> None:
+    global _RULES
+    _RULES = None
 
 
-def _limit_14h_from_jour(jour: date):
-    tz = timezone.get_current_timezone()
-    return timezone.make_aware(datetime.combine(jour + timedelta(days=1), time(hour=14)), tz)
+def rule_for(regle_id: int | None) -> PenaltyRule:
+    """Règle d'un contrat (regle_penalite_id), à défaut PENALITE_REGLE_DEFAUT, à défaut 12h/14h et montants fixes."""
+    rules = _RULES if _RULES is not None else load_penalty_rules()
+    rule = rules.get(regle_id) or rules.get(getattr(settings, "PENALITE_REGLE_DEFAUT", 0))
+    return rule or _DEFAULT_RULE
 
-def _is_on_leave(contrat, jour: date) -> bool:
+
+def _paid_index(start: date, end: date, montants_min: dict, rules: dict[int, PenaltyRule]) -> PaidDayIndex:
     """
-    Retourne True si le contrat chauffeur est en congé approuvé couvrant le jour donné.
+    Paiements PAYE des contrats donnés sur [start .. end], chargés en une requête :
+    payé à temps = avant J+1 heure_min avec au moins montant_par_paiement,
+    payé en retard = entre J+1 heure_min et J+1 heure_max (règle du contrat).
     """
-    start_of_day = datetime.combine(jour, time.min)
-    end_of_day   = datetime.combine(jour, time.max)
-    tz = timezone.get_current_timezone()
-    start_of_day = timezone.make_aware(start_of_day, tz)
-    end_of_day   = timezone.make_aware(end_of_day, tz)
+    return PaidDayIndex.load(
+        start, end,
+        contrat_ids=list(montants_min),
+        montants_min=montants_min,
+        deadline=lambda contrat_id, jour: rules[contrat_id].deadline(jour),
+        late_deadline=lambda contrat_id, jour: rules[contrat_id].late_deadline(jour),
+    )
+
+
+def _legere_defaults(jour: date, date_limite, now, rule: PenaltyRule = _DEFAULT_RULE,
+                     avec_batterie: bool = False) -> dict:
+    """Valeurs d'une pénalité légère automatique pour le jour J."""
+    montant = rule.montant_legere(avec_batterie)
+    return dict(
+        type_penalite=TypePenalite.LEGERE,
+        montant_penalite=montant,
+        motif_penalite=f"Paiement non reçu avant {_fmt_heure(rule.heure_legere)}",
+        statut_penalite=StatutPenalite.NON_PAYE,
+        description=f"Pénalité automatique légère du {jour.isoformat()}",
+        montant_paye=0,
+        montant_restant=montant,
+        echeance_paiement_penalite=now + timedelta(hours=72),
+        date_limite_reference=date_limite or jour,
+    )
+
+
+def _last_noon_day(now) -> date:
+    """Dernier jour J dont une deadline (J+1 à heure_min, règle la plus matinale) est dépassée à `now`."""
+    yesterday = now.date() - timedelta(days=1)
+    rules = _RULES if _RULES is not None else load_penalty_rules()
+    earliest = min([r.heure_legere for r in rules.values()] + [rule_for(None).heure_legere])
+    if now >= PenaltyRule(heure_legere=earliest).deadline(yesterday):
+        return yesterday
+    return yesterday - timedelta(days=1)
 
-    return Conge.objects.filter(
-        contrat=contrat,
-        statut=StatutConge.APPROUVE,
-        date_debut__lte=end_of_day,
-        date_fin__gte=start_of_day,
-    ).exists()
 
+def _first_noon_day(last_day: date) -> date | None:
+    """Premier jour rattrapé par la fenêtre "midi" (None : depuis date_concernee)."""
+    if NOON_DAYS <= 0:
+        return None
+    return last_day - timedelta(days=NOON_DAYS - 1)
 
-def _is_paid_for_day(contrat, jour: date) -> bool:
+
+def _plan_legeres(contrats, first_day: date, last_day: date, now, counters: dict,
+                  swaps: SwapStateBatch, profile: RunProfile) -> list[Penalite]:
     """
-    Retourne True s'il existe un paiement enregistré pour le jour J,
-    créé avant la deadline J+1 à 12h locale.
+    Légères manquantes sur [first_day .. last_day] pour les contrats donnés
+    (tuples CONTRAT_FIELDS) : congés, paiements et pénalités existantes sont
+    chargés une fois (une requête chacun), les jours non payés sont déterminés
+    en mémoire selon la règle de chaque contrat. Chaque contrat est parcouru à
+    partir de max(date_concernee, first_day), jusqu'au dernier jour dont
+    l'heure limite est dépassée. Renvoie les pénalités à insérer, non enregistrées.
     """
-    deadline = _deadline_noon_from_jour(jour)
+    ids = [c[0] for c in contrats]
+    rules = {c[0]: rule_for(c[5]) for c in contrats}
+    with profile.phase("scan"):
+        existing = set(Penalite.objects
+                       .filter(contrat_chauffeur_id__in=ids, date_paiement_manquee__range=(first_day, last_day))
+                       .values_list("contrat_chauffeur_id", "date_paiement_manquee"))
+    with profile.phase("leave"):
+        leaves = LeaveCoverage.load(first_day, last_day, contrat_ids=ids)
+    with profile.phase("payment"):
+        paid = _paid_index(first_day, last_day, {c[0]: c[4] for c in contrats}, rules)
 
-    return PaiementLease.objects.filter(
-        contrat_chauffeur=contrat,
-        date_concernee=jour,
-        created__lte=deadline,
-        statut="PAYE",
-        montant_total__gte=(contrat.montant_par_paiement or 0),
-    ).exists()
+    to_create = []
+    for pk, date_concernee, date_limite, assoc_id, _, _, batt_id in contrats:
+        rule = rules[pk]
+        jour = max(date_concernee, first_day)
+        while jour <= last_day and now >= rule.deadline(jour):
+            if leaves.covers(pk, jour):
+                counters["leave_skipped"] += 1
+            elif paid.is_paid(pk, jour):
+                counters["paid_skipped"] += 1
+            elif (pk, jour) in existing:
+                counters["unchanged"] += 1
+            else:
+                to_create.append(Penalite(
+                    contrat_chauffeur_id=pk,
+                    date_paiement_manquee=jour,
+                    **_legere_defaults(jour, date_limite, now, rule, bool(batt_id)),
+                ))
+                if profile.record:
+                    profile.created.append((pk, jour))
+                # 🔒 Bloquer le swap
+                swaps.block(assoc_id)
+            jour += timedelta(days=1)
+    return to_create
 
 
-@transaction.atomic
-def apply_penalties_for_now(force_window: str | None = None) -> dict:
+def _insert_legeres(to_create: list[Penalite]) -> dict[date, int]:
     """
-    Fonction principale : applique les pénalités selon la fenêtre horaire.
-    - Avant 14h -> création des légères (2000 FCFA)
-    - Après 14h -> escalade des légères en graves (5000 FCFA)
+    Insère les légères (doublons écartés par uniq_penalite_par_contrat_jour_et_type)
+    et retourne le nombre de lignes réellement insérées par jour manqué :
+    comptage avant / après, dans la transaction, sur les contrats et les jours
+    de la tranche.
     """
-    now = timezone.localtime()
-    today = now.date()
-    hour = now.hour
-    window = force_window if force_window in ("noon", "fourteen") else ("noon" if hour < 14 else "fourteen")
+    if not to_create:
+        return {}
+    jours = [p.date_paiement_manquee for p in to_create]
+    scope = (Penalite.objects
+             .filter(contrat_chauffeur_id__in={p.contrat_chauffeur_id for p in to_create},
+                     date_paiement_manquee__range=(min(jours), max(jours)),
+                     type_penalite=TypePenalite.LEGERE)
+             .order_by()
+             .values("date_paiement_manquee").annotate(n=Count("id"))
+             .values_list("date_paiement_manquee", "n"))
 
-    created = escalated = unchanged = paid_skipped = leave_skipped = 0
+    before = dict(scope)
+    Penalite.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+    return {jour: n - before.get(jour, 0) for jour, n in scope.all() if n > before.get(jour, 0)}
 
-    # 🕛 Fenêtre "midi" : création des pénalités légères
-    if window == "noon":
-        contrats = ContratChauffeur.objects.select_for_update().filter(statut=StatutContrat.ENCOURS)
 
-        for contrat in contrats:
-            current_day = contrat.date_concernee or today
+def _apply_noon_set_based(contrat_ids, now, counters: dict, swaps: SwapStateBatch,
+                          profile: RunProfile, write: bool = True) -> set[date]:
+    """
+    Fenêtre "midi" en mode ensembliste : les légères manquantes de la tranche
+    sont déterminées par _plan_legeres puis insérées par bulk_create, les
+    doublons étant écartés par uniq_penalite_par_contrat_jour_et_type.
+    Seuls les PENALITE_NOON_JOURS derniers jours sont traités, les trous plus
+    anciens relèvent de backfill_penalties. Avec `write=False` rien n'est inséré.
+    Retourne les jours dont des légères ont été créées.
+    """
+    last_day = _last_noon_day(now)
+    with profile.phase("scan"):
+        contrats = list(ContratChauffeur.objects
+                        .filter(pk__in=contrat_ids, statut=StatutContrat.ENCOURS, date_concernee__lte=last_day)
+                        .order_by("pk")
+                        .values_list(*CONTRAT_FIELDS))
+    if not contrats:
+        return set()
 
-            while current_day <= today:
+    first_day = max(min(c[1] for c in contrats), _first_noon_day(last_day) or date.min)
+    to_create = _plan_legeres(contrats, first_day, last_day, now, counters, swaps, profile)
+    if not to_create:
+        return set()
 
-                deadline = _deadline_noon_from_jour(current_day)
-                if now < deadline:
-                    break
+    if not write:
+        counters["created"] += len(to_create)
+        return {p.date_paiement_manquee for p in to_create}
 
-                if _is_on_leave(contrat, current_day):
-                    leave_skipped += 1
-                    current_day += timedelta(days=1)
-                    continue
+    with profile.phase("writes"):
+        crees = _insert_legeres(to_create)
+    created = sum(crees.values())
+    counters["created"] += created
+    # lignes écartées par la contrainte d'unicité (passage concurrent ou repris)
+    counters["unchanged"] += len(to_create) - created
+    return set(crees)
 
-                if _is_paid_for_day(contrat, current_day):
-                    paid_skipped += 1
-                else:
-                    date_limite_snapshot = contrat.date_limite or current_day
 
+def _apply_noon_rows(contrat_ids, now, counters: dict, swaps: SwapStateBatch, profile: RunProfile) -> set[date]:
+    """Fenêtre "midi" : parcours contrat par contrat, jour par jour ; retourne les jours des légères créées."""
+    today = now.date()
+    jours = set()
+    with profile.phase("scan"):
+        contrats = list(ContratChauffeur.objects
+                        .select_for_update()
+                        .filter(pk__in=contrat_ids, statut=StatutContrat.ENCOURS)
+                        .order_by("pk"))
+
+    first_day = min((c.date_concernee for c in contrats if c.date_concernee), default=today)
+    with profile.phase("leave"):
+        leaves = LeaveCoverage.load(first_day, today, contrat_ids=contrat_ids)
+    rules = {c.pk: rule_for(c.regle_penalite_id) for c in contrats}
+    with profile.phase("payment"):
+        paid = _paid_index(first_day, today, {c.pk: c.montant_par_paiement for c in contrats}, rules)
+
+    first_noon_day = _first_noon_day(_last_noon_day(now))
+    for contrat in contrats:
+        current_day = contrat.date_concernee or today
+        if first_noon_day and current_day < first_noon_day:
+            current_day = first_noon_day
+
+        while current_day <= today:
+
+            deadline = rules[contrat.pk].deadline(current_day)
+            if now < deadline:
+                break
+
+            if leaves.covers(contrat.pk, current_day):
+                counters["leave_skipped"] += 1
+                current_day += timedelta(days=1)
+                continue
+
+            if paid.is_paid(contrat.pk, current_day):
+                counters["paid_skipped"] += 1
+            else:
+                with profile.phase("writes"):
                     pen, was_created = Penalite.objects.get_or_create(
                         contrat_chauffeur=contrat,
                         date_paiement_manquee=current_day,
-                        defaults=dict(
-                            type_penalite=TypePenalite.LEGERE,
-                            montant_penalite=PENALITE_LEGERE,
-                            motif_penalite="Paiement non reçu avant 12h",
-                            statut_penalite=StatutPenalite.NON_PAYE,
-                            description=f"Pénalité automatique légère du {current_day.isoformat()}",
-                            montant_paye=0,
-                            montant_restant=PENALITE_LEGERE,
-                            echeance_paiement_penalite=now + timedelta(hours=72),
-                            date_limite_reference=date_limite_snapshot,
-                        ),
+                        defaults=_legere_defaults(current_day, contrat.date_limite, now,
+                                                  rules[contrat.pk], bool(contrat.contrat_batt_id)),
                     )
 
-                    if was_created:
-                        created += 1
+                if was_created:
+                    counters["created"] += 1
+                    jours.add(current_day)
+                    if profile.record:
+                        profile.created.append((contrat.pk, current_day))
 
-                        # 🔒 Bloquer le swap
-                        try:
-                            assoc = contrat.association_user_moto
-                            if assoc:
-                                assoc.swap_bloque = 0
-                                assoc.save(update_fields=["swap_bloque"])
-                                logger.info(f"Swap bloqué pour chauffeur {assoc.validated_user_id}")
-                        except Exception as e:
-                            logger.warning(f"Erreur blocage swap (contrat {contrat.id}): {e}")
+                    # 🔒 Bloquer le swap
+                    swaps.block(contrat.association_user_moto_id)
 
-                    else:
-                        unchanged += 1
+                else:
+                    counters["unchanged"] += 1
 
-                current_day += timedelta(days=1)
+            current_day += timedelta(days=1)
 
-    # 🕑 Fenêtre "14h" : escalade des pénalités légères en graves
-    else:
-        target_jour = today - timedelta(days=1)
-        deadline = _deadline_noon_from_jour(target_jour)
-        limit14 = _limit_14h_from_jour(target_jour)
+    return jours
 
-        pens = (Penalite.objects
-                .select_related("contrat_chauffeur")
-                .select_for_update()
-                .filter(date_paiement_manquee=target_jour, type_penalite=TypePenalite.LEGERE))
 
-        for pen in pens:
-            contrat = pen.contrat_chauffeur
+def _apply_fourteen_rows(contrat_ids, now, counters: dict, swaps: SwapStateBatch, profile: RunProfile) -> set[date]:
+    """Fenêtre "14h" : escalade des légères de la veille en graves ; retourne {veille} si une pénalité a changé."""
+    target_jour = now.date() - timedelta(days=1)
 
-            if _is_on_leave(contrat, target_jour):
-                leave_skipped += 1
-                continue
+    with profile.phase("scan"):
+        pens = list(Penalite.objects
+                    .select_related("contrat_chauffeur")
+                    .select_for_update()
+                    .filter(
+                        contrat_chauffeur_id__in=contrat_ids,
+                        date_paiement_manquee=target_jour,
+                        type_penalite=TypePenalite.LEGERE,
+                    ))
+    with profile.phase("leave"):
+        leaves = LeaveCoverage.load(target_jour, target_jour, contrat_ids=contrat_ids)
+    rules = {p.contrat_chauffeur_id: rule_for(p.contrat_chauffeur.regle_penalite_id) for p in pens}
+    with profile.phase("payment"):
+        paid = _paid_index(target_jour, target_jour,
+                           {p.contrat_chauffeur_id: p.contrat_chauffeur.montant_par_paiement for p in pens}, rules)
 
-            if _is_paid_for_day(contrat, target_jour):
-                paid_skipped += 1
-                continue
+    escalated = 0
+    for pen in pens:
+        contrat = pen.contrat_chauffeur
+        rule = rules[contrat.pk]
 
-            # Paiement entre 12h et 14h → pas d’escalade
-            lease_paid_late = PaiementLease.objects.filter(
-                contrat_chauffeur=contrat,
-                date_concernee=target_jour,
-                created__gt=deadline,
-                created__lte=limit14,
-                statut="PAYE",
-            ).exists()
-            if lease_paid_late:
-                unchanged += 1
-                continue
+        if leaves.covers(contrat.pk, target_jour):
+            counters["leave_skipped"] += 1
+            continue
 
-            # Toujours pas payé → escalade en grave
-            restant = max((pen.montant_penalite or 0) - (pen.montant_paye or 0), 0)
-            if restant <= 0 or pen.statut_penalite == StatutPenalite.PAYE:
-                unchanged += 1
-                continue
+        if paid.is_paid(contrat.pk, target_jour):
+            counters["paid_skipped"] += 1
+            continue
+
+        # Paiement entre heure_min et heure_max → pas d’escalade
+        if paid.paid_late(contrat.pk, target_jour):
+            counters["unchanged"] += 1
+            continue
+
+        # Heure limite de la règle pas encore atteinte
+        if now < rule.late_deadline(target_jour):
+            counters["unchanged"] += 1
+            continue
 
-            pen.type_penalite = TypePenalite.GRAVE
-            pen.montant_penalite = PENALITE_GRAVE
-            pen.motif_penalite = "Paiement de lease non reçu avant 14h"
-            pen.montant_restant = max(pen.montant_penalite - (pen.montant_paye or 0), 0)
-            prefix = (pen.description + " | ") if pen.description else ""
-            pen.description = f"{prefix}Escalade automatique en grave le {now.strftime('%Y-%m-%d %H:%M')}"
+        # Toujours pas payé → escalade en grave
+        restant = max((pen.montant_penalite or 0) - (pen.montant_paye or 0), 0)
+        if restant <= 0 or pen.statut_penalite == StatutPenalite.PAYE:
+            counters["unchanged"] += 1
+            continue
+
+        pen.type_penalite = TypePenalite.GRAVE
+        pen.montant_penalite = rule.montant_grave(bool(contrat.contrat_batt_id))
+        pen.motif_penalite = f"Paiement de lease non reçu avant {_fmt_heure(rule.heure_grave)}"
+        pen.montant_restant = max(pen.montant_penalite - (pen.montant_paye or 0), 0)
+        prefix = (pen.description + " | ") if pen.description else ""
+        pen.description = f"{prefix}Escalade automatique en grave le {now.strftime('%Y-%m-%d %H:%M')}"
+        with profile.phase("writes"):
             pen.save(update_fields=[
                 "type_penalite", "montant_penalite", "motif_penalite",
                 "montant_restant", "description",
             ])
-            escalated += 1
+        counters["escalated"] += 1
+        escalated += 1
+        if profile.record:
+            profile.escalated.append((pen.pk, contrat.pk))
+
+        # 🔒 Bloquer le swap aussi en cas d’escalade
+        swaps.block(contrat.association_user_moto_id)
 
+    return {target_jour} if escalated else set()
+
+
+def _apply_fourteen_set_based(contrat_ids, now, counters: dict, swaps: SwapStateBatch,
+                              profile: RunProfile, write: bool = True) -> set[date]:
+    """
+    Fenêtre "14h" en mode ensembliste : les légères de la veille, les congés et
+    les paiements de la tranche sont chargés une fois (une requête chacun) et
+    classés en mémoire (payé à temps, payé entre heure_min et heure_max), puis
+    un UPDATE par montant / heure de règle (en pratique un ou deux) passe
+    l'ensemble à escalader en grave, description complétée côté SQL.
+    Avec `write=False` l'UPDATE n'est pas exécuté. Retourne {veille} si une
+    pénalité a été escaladée.
+    """
+    target_jour = now.date() - timedelta(days=1)
+
+    with profile.phase("scan"):
+        rows = list(Penalite.objects
+                    .filter(
+                        contrat_chauffeur_id__in=contrat_ids,
+                        date_paiement_manquee=target_jour,
+                        type_penalite=TypePenalite.LEGERE,
+                    )
+                    .order_by()
+                    .values_list(
+                        "pk", "contrat_chauffeur_id", "statut_penalite", "montant_penalite", "montant_paye",
+                        "contrat_chauffeur__association_user_moto_id", "contrat_chauffeur__montant_par_paiement",
+                        "contrat_chauffeur__regle_penalite_id", "contrat_chauffeur__contrat_batt_id",
+                    ))
+    if not rows:
+        return set()
+
+    with profile.phase("leave"):
+        leaves = LeaveCoverage.load(target_jour, target_jour, contrat_ids=contrat_ids)
+    rules = {r[1]: rule_for(r[7]) for r in rows}
+    with profile.phase("payment"):
+        paid = _paid_index(target_jour, target_jour, {r[1]: r[6] for r in rows}, rules)
+
+    # (montant grave, heure_max) -> ids à escalader
+    escalate: dict[tuple[Decimal, time], list[int]] = {}
+    for pk, contrat_id, statut, montant, paye, assoc_id, _, _, batt_id in rows:
+        rule = rules[contrat_id]
+        if leaves.covers(contrat_id, target_jour):
+            counters["leave_skipped"] += 1
+        elif paid.is_paid(contrat_id, target_jour):
+            counters["paid_skipped"] += 1
+        elif paid.paid_late(contrat_id, target_jour):
+            # Paiement entre heure_min et heure_max → pas d’escalade
+            counters["unchanged"] += 1
+        elif now < rule.late_deadline(target_jour):
+            counters["unchanged"] += 1
+        elif (montant or 0) - (paye or 0) <= 0 or statut not in STATUTS_ESCALADABLES:
+            counters["unchanged"] += 1
+        else:
+            escalate.setdefault((rule.montant_grave(bool(batt_id)), rule.heure_grave), []).append(pk)
+            if profile.record:
+                profile.escalated.append((pk, contrat_id))
             # 🔒 Bloquer le swap aussi en cas d’escalade
-            try:
-                assoc = contrat.association_user_moto
-                if assoc:
-                    assoc.swap_bloque = 0
-                    assoc.save(update_fields=["swap_bloque"])
-                    logger.info(f"Swap bloqué (escalade grave) pour chauffeur {assoc.validated_user_id}")
-            except Exception as e:
-                logger.warning(f"Erreur blocage swap (contrat {contrat.id}): {e}")
+            swaps.block(assoc_id)
+
+    if not escalate:
+        return set()
+    if not write:
+        counters["escalated"] += sum(len(ids) for ids in escalate.values())
+        return {target_jour}
+
+    # La note d'escalade est toujours conservée en entier : si la description ne
+    # peut pas la recevoir, c'est l'ancienne description qui est raccourcie ("…")
+    suffix = f"Escalade automatique en grave le {now.strftime('%Y-%m-%d %H:%M')}"
+    tail = " | " + suffix
+    room = DESCRIPTION_MAX - len(tail)
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    escalated = 0
+    with profile.phase("writes"):
+        for (montant_grave, heure_grave), escalate_ids in escalate.items():
+            # gardes répétées dans le WHERE : une pénalité payée ou modifiée depuis la lecture n'est pas escaladée
+            updated = Penalite.objects.filter(
+                pk__in=escalate_ids,
+                type_penalite=TypePenalite.LEGERE,
+                statut_penalite__in=STATUTS_ESCALADABLES,
+                montant_restant__gt=0,
+            ).update(
+                type_penalite=TypePenalite.GRAVE,
+                montant_penalite=montant_grave,
+                motif_penalite=f"Paiement de lease non reçu avant {_fmt_heure(heure_grave)}",
+                montant_restant=Greatest(
+                    Value(montant_grave, output_field=money) - F("montant_paye"),
+                    Value(Decimal("0"), output_field=money),
+                    output_field=money,
+                ),
+                description=Case(
+                    When(description="", then=Value(suffix)),
+                    When(LessThanOrEqual(Length("description"), room), then=Concat(F("description"), Value(tail))),
+                    default=Concat(Left(F("description"), room - 1), Value("…" + tail)),
+                ),
+            )
+            counters["escalated"] += updated
+            counters["unchanged"] += len(escalate_ids) - updated
+            escalated += updated
+
+    return {target_jour} if escalated else set()
+
+
+def _next_chunk_ids(window: str, now, after_id: int, size: int, shard: tuple[int, int]) -> list[int]:
+    """Prochaine tranche d'ids de contrats (ordre croissant) à traiter pour la fenêtre et le shard."""
+    shard_index, shard_count = shard
+
+    if window == "noon":
+        qs = (ContratChauffeur.objects
+              .filter(statut=StatutContrat.ENCOURS, date_concernee__lte=_last_noon_day(now), pk__gt=after_id))
+        id_field = "pk"
+    else:
+        qs = (Penalite.objects
+              .filter(
+                  date_paiement_manquee=now.date() - timedelta(days=1),
+                  type_penalite=TypePenalite.LEGERE,
+                  contrat_chauffeur_id__gt=after_id,
+              ))
+        id_field = "contrat_chauffeur_id"
+
+    if shard_count > 1:
+        qs = qs.annotate(shard=Mod(id_field, shard_count)).filter(shard=shard_index)
+
+    return list(qs.order_by(id_field).values_list(id_field, flat=True).distinct()[:size])
+
+
+class LeaseLost(Exception):
+    """Le passage a été repris par un autre worker (bail expiré)."""
+
+
+def _start_or_resume_run(window: str, jour: date, shard: tuple[int, int]) -> ExecutionPenalite | None:
+    """
+    Reprend le dernier passage inachevé de la fenêtre (et du shard) pour ce jour, sinon en ouvre un nouveau.
+    Un passage EN_COURS dont le bail (heartbeat) n'a pas expiré tourne encore sur un autre worker :
+    retourne None. La reprise est un UPDATE conditionnel sur statut / heartbeat, un seul worker la gagne.
+    """
+    shard_index, shard_count = shard
+    now = timezone.now()
+    run = (ExecutionPenalite.objects
+           .filter(fenetre=window, jour_reference=jour,
+                   shard_index=shard_index, shard_count=shard_count,
+                   statut__in=[StatutExecution.EN_COURS, StatutExecution.ECHOUEE])
+           .order_by("-created")
+           .first())
+    if run is None:
+        return ExecutionPenalite.objects.create(
+            fenetre=window, jour_reference=jour, shard_index=shard_index, shard_count=shard_count,
+            heartbeat=now,
+        )
+
+    if run.statut == StatutExecution.EN_COURS and run.heartbeat and run.heartbeat > now - timedelta(seconds=LEASE_SECONDS):
+        logger.warning("[PENALITES] passage %s toujours en cours (bail renouvelé le %s), rien à faire",
+                       run.run_id, run.heartbeat)
+        return None
+
+    claimed = (ExecutionPenalite.objects
+               .filter(pk=run.pk, statut=run.statut, heartbeat=run.heartbeat)
+               .update(statut=StatutExecution.EN_COURS, heartbeat=now, updated=now))
+    if not claimed:
+        logger.warning("[PENALITES] passage %s repris par un autre worker", run.run_id)
+        return None
+
+    logger.info("[PENALITES] reprise du passage %s après le contrat %s", run.run_id, run.dernier_contrat_id)
+    run.statut, run.heartbeat = StatutExecution.EN_COURS, now
+    return run
+
+
+def _renew_lease(run: ExecutionPenalite) -> bool:
+    """
+    Enregistre le point de reprise de la tranche et renouvelle le bail, à condition que le passage
+    n'ait pas été repris entre-temps ; False si le bail est perdu.
+    """
+    now = timezone.now()
+    renewed = (ExecutionPenalite.objects
+               .filter(pk=run.pk, statut=StatutExecution.EN_COURS, heartbeat=run.heartbeat)
+               .update(dernier_contrat_id=run.dernier_contrat_id, compteurs=run.compteurs,
+                       heartbeat=now, updated=now))
+    if renewed:
+        run.heartbeat = now
+    return bool(renewed)
+
+
+def merge_penalty_results(results) -> dict:
+    """Fusionne les compteurs de plusieurs passages (shards) en un seul résumé."""
+    results = [r for r in results if r]
+    merged = {"window": results[0]["window"] if results else None}
+    for k in COUNTER_KEYS:
+        merged[k] = sum(int(r.get(k, 0)) for r in results)
+    return merged
+
+
+def apply_penalties_for_now(force_window: str | None = None, mode: str = "set",
+                            chunk_size: int | None = None,
+                            shard: tuple[int, int] | None = None,
+                            now: datetime | None = None,
+                            simulate: str | None = None,
+                            profile: RunProfile | None = None) -> dict:
+    """
+    Fonction principale : applique les pénalités selon la fenêtre horaire.
+    - Avant 14h -> création des légères (2000 FCFA par défaut)
+    - Après 14h -> escalade des légères en graves (5000 FCFA par défaut)
+
+    Montants et heures limites viennent de la ReglePenalite de chaque contrat
+    (voir rule_for), chargées une fois par passage.
+
+    `mode="set"` traite les deux fenêtres de façon ensembliste (bulk_create
+    des légères, UPDATE groupé des escalades), `mode="row"` conserve le
+    parcours contrat par contrat.
+
+    Les contrats sont traités par tranches de `chunk_size` ids, chacune dans
+    sa propre transaction ; le point de reprise (ExecutionPenalite) est
+    enregistré avec la tranche, ce qui permet à un worker interrompu de
+    reprendre là où il s'est arrêté.
+
+    `shard=(index, count)` limite le passage aux contrats dont
+    id % count == index (exécution parallèle, voir penalite.tasks).
+
+    `now` fixe l'instant de référence (par défaut l'heure locale courante).
+    `simulate="rollback"` exécute le passage dans une transaction annulée,
+    `simulate="read"` sans aucune écriture ; voir simulate_penalties.
+    """
+    now = timezone.localtime(now) if now else timezone.localtime()
+    today = now.date()
+    hour = now.hour
+    window = force_window if force_window in ("noon", "fourteen") else ("noon" if hour < 14 else "fourteen")
+    mode = mode if mode in MODES else "set"
+    chunk_size = chunk_size or CHUNK_SIZE
+    shard = shard or (0, 1)
+    profile = profile or RunProfile()
+    load_penalty_rules()
+
+    if simulate == "read":
+        if mode != "set":
+            raise ValueError("La simulation en lecture seule n'est disponible qu'en mode 'set'.")
+        # Passage non enregistré : pas de point de reprise en base
+        run = ExecutionPenalite(fenetre=window, jour_reference=today, shard_index=shard[0], shard_count=shard[1])
+        return _run_chunks(run, window, now, mode, chunk_size, shard, profile, write=False)
+
+    if simulate == "rollback":
+        with transaction.atomic():
+            # Nouveau passage, même si un passage réel est à reprendre
+            run = ExecutionPenalite.objects.create(
+                fenetre=window, jour_reference=today, shard_index=shard[0], shard_count=shard[1],
+                heartbeat=timezone.now(),
+            )
+            res = _run_chunks(run, window, now, mode, chunk_size, shard, profile)
+            transaction.set_rollback(True)
+        return res
+
+    run = _start_or_resume_run(window, today, shard)
+    if run is None:
+        # passage déjà en cours sur un autre worker : compteurs nuls
+        return {"window": window, **dict.fromkeys(COUNTER_KEYS, 0)}
+    return _run_chunks(run, window, now, mode, chunk_size, shard, profile)
+
+
+def _run_chunks(run: ExecutionPenalite, window: str, now, mode: str, chunk_size: int,
+                shard: tuple[int, int], profile: RunProfile, write: bool = True) -> dict:
+    """Boucle des tranches d'un passage ; avec `write=False` ni pénalités, ni swaps, ni point de reprise."""
+    counters = {k: int(run.compteurs.get(k, 0)) for k in COUNTER_KEYS}
+    swaps_blocked = 0
+
+    try:
+        while True:
+            with profile.phase("scan"):
+                ids = _next_chunk_ids(window, now, run.dernier_contrat_id, chunk_size, shard)
+            if not ids:
+                break
+
+            with transaction.atomic():
+                chunk_counters = dict.fromkeys(COUNTER_KEYS, 0)
+                swaps = SwapStateBatch()
+
+                # 🕛 Fenêtre "midi" : création des pénalités légères
+                if window == "noon" and mode == "set":
+                    jours = _apply_noon_set_based(ids, now, chunk_counters, swaps, profile, write)
+                elif window == "noon":
+                    jours = _apply_noon_rows(ids, now, chunk_counters, swaps, profile)
+                # 🕑 Fenêtre "14h" : escalade des pénalités légères en graves
+                elif mode == "set":
+                    jours = _apply_fourteen_set_based(ids, now, chunk_counters, swaps, profile, write)
+                else:
+                    jours = _apply_fourteen_rows(ids, now, chunk_counters, swaps, profile)
+
+                for k in COUNTER_KEYS:
+                    counters[k] += chunk_counters[k]
+                run.dernier_contrat_id = ids[-1]
+
+                if write:
+                    with profile.phase("writes"):
+                        # 🔒 Blocage des swaps de la tranche : un UPDATE groupé
+                        swap_changes = swaps.flush()
+                        swaps_blocked += swap_changes["blocked"]
+
+                        run.compteurs = counters
+                        if not _renew_lease(run):
+                            raise LeaseLost(run.run_id)
+                        if jours:
+                            # seuls les jours réellement modifiés par la tranche
+                            invalidate_combined_totals()
+                            invalidate_daily_reports(min(jours), max(jours))
+
+    except LeaseLost:
+        # tranche annulée ; le passage appartient désormais à un autre worker
+        logger.warning("[PENALITES] bail du passage %s perdu, tranche jusqu'au contrat %s annulée",
+                       run.run_id, run.dernier_contrat_id)
+        raise
+    except Exception:
+        if write:
+            run.statut = StatutExecution.ECHOUEE
+            run.save(update_fields=["statut", "updated"])
+        logger.exception("[PENALITES] passage %s interrompu après le contrat %s", run.run_id, run.dernier_contrat_id)
+        raise
+
+    res = {"window": window, **counters}
+    if not write:
+        return res
+
+    run.statut = StatutExecution.TERMINEE
+    run.date_fin = timezone.now()
+    run.save(update_fields=["statut", "date_fin", "updated"])
+
+    logger.info("[PENALITES] %s -> %s (run %s, %s swap(s) bloqué(s), phases %s)",
+                window, res, run.run_id, swaps_blocked, profile.as_dict())
+    return res
+
+
+def simulate_penalties(window: str, now: datetime | None = None, mode: str = "set",
+                       read_only: bool = False, chunk_size: int | None = None) -> dict:
+    """
+    Simule un passage du moteur pour `window` à l'instant `now`, sans rien
+    conserver : dans une transaction annulée (par défaut) ou en lecture seule.
+    Renvoie les compteurs, les pénalités qui seraient créées / escaladées et
+    le détail des phases (durée, nombre de requêtes).
+    """
+    profile = RunProfile(record=True)
+    res = apply_penalties_for_now(
+        window, mode=mode, chunk_size=chunk_size, now=now,
+        simulate="read" if read_only else "rollback", profile=profile,
+    )
+    return {
+        "result": res,
+        "phases": profile.as_dict(),
+        "created": profile.created,
+        "escalated": profile.escalated,
+    }
+
+
+def backfill_penalties(start: date, end: date, contrat_ids=None, chunk_size: int | None = None,
+                       throttle: float = 0.0, now: datetime | None = None, write: bool = True,
+                       progress=None) -> dict:
+    """
+    Rattrapage hors ligne des légères manquantes sur [start .. end] (borné au
+    dernier jour échu), pour tous les contrats en cours ou ceux de `contrat_ids`.
+
+    Même classement que la fenêtre "midi" (_plan_legeres), par tranches de
+    `chunk_size` contrats : une transaction par tranche, insertions groupées
+    par jour, pause de `throttle` secondes entre deux tranches pour ne pas
+    gêner le passage de 12h. `progress(traites, total, compteurs)` est appelé
+    après chaque tranche. Avec `write=False` rien n'est écrit.
+    """
+    now = timezone.localtime(now) if now else timezone.localtime()
+    load_penalty_rules()
+    end = min(end, _last_noon_day(now))
+    chunk_size = chunk_size or CHUNK_SIZE
+    profile = RunProfile()
+    counters = dict.fromkeys(COUNTER_KEYS, 0)
+    par_jour: dict[date, int] = {}
+    swaps_blocked = 0
+
+    qs = ContratChauffeur.objects.filter(statut=StatutContrat.ENCOURS, date_concernee__lte=end)
+    if contrat_ids:
+        qs = qs.filter(pk__in=list(contrat_ids))
+    qs = qs.order_by("pk").values_list(*CONTRAT_FIELDS)
+    total = qs.count()
+    done = 0
+    after_id = 0
+
+    while start <= end:
+        with profile.phase("scan"):
+            contrats = list(qs.filter(pk__gt=after_id)[:chunk_size])
+        if not contrats:
+            break
+
+        with transaction.atomic():
+            swaps = SwapStateBatch()
+            first_day = max(start, min(c[1] for c in contrats))
+            to_create = _plan_legeres(contrats, first_day, end, now, counters, swaps, profile)
+
+            # Insertions groupées par jour manqué ; seules les lignes réellement insérées sont comptées
+            to_create.sort(key=lambda p: (p.date_paiement_manquee, p.contrat_chauffeur_id))
+            if write:
+                with profile.phase("writes"):
+                    crees = _insert_legeres(to_create)
+                    swaps_blocked += swaps.flush()["blocked"]
+                    if crees:
+                        invalidate_combined_totals()
+                        invalidate_daily_reports(min(crees), max(crees))
+            else:
+                crees = {}
+                for p in to_create:
+                    crees[p.date_paiement_manquee] = crees.get(p.date_paiement_manquee, 0) + 1
+
+            for jour, n in crees.items():
+                par_jour[jour] = par_jour.get(jour, 0) + n
+            counters["created"] += sum(crees.values())
+            counters["unchanged"] += len(to_create) - sum(crees.values())
+
+        done += len(contrats)
+        after_id = contrats[-1][0]
+        if progress:
+            progress(done, total, counters)
+        if throttle:
+            sleep(throttle)
 
     res = {
-        "window": window,
-        "created": created,
-        "escalated": escalated,
-        "unchanged": unchanged,
-        "paid_skipped": paid_skipped,
-        "leave_skipped": leave_skipped,
+        "start": start, "end": end, "contrats": done, **counters,
+        "swaps_blocked": swaps_blocked,
+        "par_jour": dict(sorted(par_jour.items())),
+        "phases": profile.as_dict(),
     }
-    logger.info("[PENALITES] %s -> %s", window, res)
-    return res
\ No newline at end of file
+    logger.info("[PENALITES] rattrapage %s..%s -> %s", start, end,
+                {k: v for k, v in res.items() if k not in ("par_jour", "phases")})
+    return res
@@ -1,11 +1,51 @@
 # penalite/tasks.py
-from celery import shared_task
-from penalite.services import apply_penalties_for_now
+from celery import chord, group, shared_task
+from django.conf import settings
+
+from paiement_lease.tasks import generer_rapport_journalier
+from penalite.services import apply_penalties_for_now, merge_penalty_results
+
+
+def _shard_count() -> int:
+    return max(int(getattr(settings, "PENALITE_SHARDS", 1) or 1), 1)
+
+
+def _fan_out(task, window: str, then=None):
+    """
+    Répartit la fenêtre sur N shards (id % N) exécutés en parallèle, puis
+    fusionne les compteurs : le résultat garde la forme de apply_penalties_for_now.
+    Avec un seul shard, la fenêtre est traitée directement dans ce worker.
+    `then` : signature immuable lancée une fois la fenêtre terminée.
+    """
+    shards = _shard_count()
+    if shards <= 1:
+        res = apply_penalties_for_now(force_window=window)
+        if then is not None:
+            then.delay()
+        return res
+
+    merge = fusionner_resultats_penalites.s()
+    if then is not None:
+        merge.link(then)
+    return task.replace(chord(
+        group(appliquer_penalite_shard.s(window, i, shards) for i in range(shards)),
+        merge,
+    ))
+
 
 @shared_task
-def appliquer_penalite_12h():
-    return apply_penalties_for_now(force_window="noon")
+def appliquer_penalite_shard(window: str, shard_index: int, shard_count: int):
+    return apply_penalties_for_now(force_window=window, shard=(shard_index, shard_count))
 
 @shared_task
-def appliquer_penalite_14h():
-    return apply_penalties_for_now(force_window="fourteen")
+def fusionner_resultats_penalites(results):
+    return merge_penalty_results(results)
+
+@shared_task(bind=True)
+def appliquer_penalite_12h(self):
+    return _fan_out(self, "noon")
+
+@shared_task(bind=True)
+def appliquer_penalite_14h(self):
+    # après l'escalade de 14h, la veille est figée : instantané de son récapitulatif
+    return _fan_out(self, "fourteen", then=generer_rapport_journalier.si())
@@ -12,6 +12,8 @@ from .serializers import (
 from django.db import transaction
 from django.utils import timezone
 
+from paiement_lease.services import invalidate_combined_totals, invalidate_daily_reports
+
 
 # Create your views here.
 class PenaliteViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
@@ -43,6 +45,8 @@ class PaiementPenaliteViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
         penalite.montant_paye = penalite.montant_penalite
         penalite.montant_restant = 0
         penalite.save(update_fields=["statut_penalite", "montant_paye", "montant_restant", "updated"])
+        invalidate_combined_totals()
+        invalidate_daily_reports(penalite.date_paiement_manquee)
 
 
 
@@ -104,6 +108,8 @@ class AnnulerPenaliteAPIView(APIView):
                     "echeance_paiement_penalite",
                     "updated",
                 ])
+                invalidate_combined_totals()
+                invalidate_daily_reports(pen.date_paiement_manquee)
 
 
             return Response(